@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from aurora_admin.selectors import filter_admin_dispensers
+from dispensers.services import reset_pairing_in_chunks
+
+
+class Command(BaseCommand):
+    help = "Clear pairing and revoke device sessions for a filtered set of dispensers, in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", help="DispenserModel code")
+        parser.add_argument("--owner", help="Owner email")
+        parser.add_argument("--search", help="serial_id prefix")
+        parser.add_argument("--all", action="store_true", help="Reset every dispenser in the fleet")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--start-after", type=int, default=0, help="Resume after this dispenser id (from an interrupted run)"
+        )
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between chunks")
+
+    def handle(self, *args, **options):
+        filters = {key: options[key] for key in ("model", "owner", "search") if options[key]}
+        if not filters and not options["all"]:
+            raise CommandError("Give at least one filter, or --all to reset every dispenser")
+
+        dispensers = filter_admin_dispensers(**filters)
+        target = dispensers.filter(pk__gt=options["start_after"]).count()
+        self.stdout.write(f"Resetting pairing for {target} dispensers")
+
+        def progress(total, last_pk):
+            self.stdout.write(f"  {total}/{target} reset (up to id {last_pk}; resume with --start-after {last_pk})")
+            if options["pause"]:
+                time.sleep(options["pause"])
+
+        reset = reset_pairing_in_chunks(
+            dispensers, chunk_size=options["chunk_size"], start_after_pk=options["start_after"], progress=progress
+        )
+        self.stdout.write(self.style.SUCCESS(f"Reset pairing for {reset} dispensers"))
@@ -0,0 +1,19 @@
+from rest_framework.pagination import CursorPagination
+
+
+class AdminCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key: each page is an index range scan
+    (WHERE id < cursor ORDER BY id DESC LIMIT n), so page cost does not grow
+    with table size or page depth the way OFFSET does.
+    """
+
+    ordering = "-id"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+class PendingSyncPagination(AdminCursorPagination):
+    # Oldest unsynced change first; walks dispenser_pending_sync_idx.
+    ordering = ("dirty_since", "id")
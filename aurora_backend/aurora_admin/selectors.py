@@ -0,0 +1,131 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+
+from dispensers.models import Dispenser
+
+
+def filter_admin_dispensers(
+    *,
+    model=None,
+    owner=None,
+    paired=None,
+    dirty=None,
+    last_seen_after=None,
+    last_seen_before=None,
+    search=None,
+):
+    dispensers = Dispenser.objects.select_related("owner", "dispenser_model")
+    if model:
+        dispensers = dispensers.filter(dispenser_model__code=model)
+    if owner:
+        dispensers = dispensers.filter(owner__email=owner)
+    if paired is not None:
+        dispensers = dispensers.exclude(device_secret="") if paired else dispensers.filter(device_secret="")
+    if dirty is not None:
+        dispensers = dispensers.filter(dirty=dirty)
+    if last_seen_after:
+        dispensers = dispensers.filter(last_seen_at__gte=last_seen_after)
+    if last_seen_before:
+        dispensers = dispensers.filter(last_seen_at__lt=last_seen_before)
+    if search:
+        dispensers = dispensers.filter(serial_id__startswith=search)
+    return dispensers
+
+
+def list_admin_users(*, search=None):
+    """
+    Users annotated with their fleet counts and latest device check-in, all
+    computed by one grouped query per page.
+    """
+    users = get_user_model().objects.annotate(
+        dispenser_count=Count("dispensers"),
+        unsynced_dispenser_count=Count("dispensers", filter=Q(dispensers__dirty=True)),
+        last_device_activity=Max("dispensers__last_seen_at"),
+    )
+    if search:
+        users = users.filter(email__startswith=search)
+    return users
+
+
+FLEET_HEALTH_CACHE_KEY = "aurora_admin:fleet_health"
+FLEET_HEALTH_BUCKETS = ("total", "online", "stale", "never_seen", "unpaired", "dirty")
+
+
+def _fleet_health_rows(now):
+    online_since = now - timedelta(seconds=settings.FLEET_ONLINE_WINDOW_SECONDS)
+    stale_before = now - timedelta(seconds=settings.FLEET_STALE_AFTER_SECONDS)
+    return (
+        Dispenser.objects.order_by()
+        .values("dispenser_model__code")
+        .annotate(
+            total=Count("id"),
+            online=Count("id", filter=Q(last_seen_at__gte=online_since)),
+            stale=Count("id", filter=Q(last_seen_at__lt=stale_before)),
+            never_seen=Count("id", filter=Q(last_seen_at__isnull=True)),
+            unpaired=Count("id", filter=Q(device_secret="")),
+            dirty=Count("id", filter=Q(dirty=True)),
+        )
+        .order_by("dispenser_model__code")
+    )
+
+
+def get_fleet_health() -> dict:
+    """
+    Dispenser counts per health bucket, per DispenserModel and in total, from
+    one grouped query. Cached for FLEET_HEALTH_CACHE_SECONDS so dashboards
+    polling every few seconds share one computation.
+    """
+    summary = cache.get(FLEET_HEALTH_CACHE_KEY)
+    if summary is not None:
+        return summary
+
+    now = timezone.now()
+    models = []
+    totals = dict.fromkeys(FLEET_HEALTH_BUCKETS, 0)
+    for row in _fleet_health_rows(now):
+        models.append({"model": row["dispenser_model__code"], **{b: row[b] for b in FLEET_HEALTH_BUCKETS}})
+        for bucket in FLEET_HEALTH_BUCKETS:
+            totals[bucket] += row[bucket]
+
+    summary = {"generated_at": now, "totals": totals, "models": models}
+    cache.set(FLEET_HEALTH_CACHE_KEY, summary, settings.FLEET_HEALTH_CACHE_SECONDS)
+    return summary
+
+
+# Upper bounds (seconds) of the sync lag histogram buckets; the last bucket is open-ended.
+SYNC_LAG_BUCKETS = (60, 300, 900, 3600, 6 * 3600, 24 * 3600)
+
+
+def list_pending_sync_dispensers():
+    return Dispenser.objects.filter(dirty=True).select_related("dispenser_model")
+
+
+def get_sync_lag_histogram() -> dict:
+    """
+    How long devices took to fetch their last configuration change, bucketed,
+    plus the size and age of the pending-sync queue: one aggregate query.
+    """
+    aggregates = {
+        f"le_{bound}": Count("id", filter=Q(last_sync_lag_seconds__lte=bound)) for bound in SYNC_LAG_BUCKETS
+    }
+    aggregates["synced"] = Count("id", filter=Q(last_sync_lag_seconds__isnull=False))
+    aggregates["pending"] = Count("id", filter=Q(dirty=True))
+    aggregates["oldest_dirty_since"] = Min("dirty_since", filter=Q(dirty=True))
+    row = Dispenser.objects.aggregate(**aggregates)
+
+    buckets, below = [], 0
+    for bound in SYNC_LAG_BUCKETS:
+        cumulative = row[f"le_{bound}"]
+        buckets.append({"le_seconds": bound, "count": cumulative - below})
+        below = cumulative
+    buckets.append({"le_seconds": None, "count": row["synced"] - below})
+    return {
+        "buckets": buckets,
+        "pending": row["pending"],
+        "oldest_dirty_since": row["oldest_dirty_since"],
+    }
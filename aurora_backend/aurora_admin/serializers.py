@@ -1,13 +1,67 @@
 from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
+from dispensers.manifest import MANIFEST_FORMATS
 from dispensers.models import Dispenser, DispenserModel
 
 
 class AdminUserSerializer(serializers.ModelSerializer):
+    # Annotated by aurora_admin.selectors.list_admin_users.
+    dispenser_count = serializers.IntegerField(read_only=True)
+    unsynced_dispenser_count = serializers.IntegerField(read_only=True)
+    last_device_activity = serializers.DateTimeField(read_only=True)
+
     class Meta:
         model = get_user_model()
-        fields = ["id", "email", "first_name", "last_name", "is_active", "is_staff"]
+        fields = [
+            "id",
+            "email",
+            "first_name",
+            "last_name",
+            "is_active",
+            "is_staff",
+            "dispenser_count",
+            "unsynced_dispenser_count",
+            "last_device_activity",
+        ]
+
+
+class AdminUserFilterSerializer(serializers.Serializer):
+    search = serializers.CharField(required=False, max_length=254, help_text="email prefix")
+
+
+class AdminDispenserFilterSerializer(serializers.Serializer):
+    model = serializers.CharField(required=False, help_text="DispenserModel code")
+    owner = serializers.EmailField(required=False)
+    paired = serializers.BooleanField(required=False, allow_null=True, default=None)
+    dirty = serializers.BooleanField(required=False, allow_null=True, default=None)
+    last_seen_after = serializers.DateTimeField(required=False)
+    last_seen_before = serializers.DateTimeField(required=False)
+    search = serializers.CharField(required=False, max_length=30, help_text="serial_id prefix")
+
+    def validate_owner(self, value):
+        return get_user_model().objects.normalize_email(value)
+
+
+class AdminResetPairingSerializer(AdminDispenserFilterSerializer):
+    MAX_LIMIT = 5000
+
+    all = serializers.BooleanField(default=False, help_text="Required to reset the whole fleet without filters")
+    start_after_pk = serializers.IntegerField(
+        min_value=0, default=0, help_text="Resume after this dispenser id (last_pk of the previous call)"
+    )
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_LIMIT, default=1000)
+
+    def validate(self, data):
+        filters = {
+            key: value
+            for key, value in data.items()
+            if key not in ("all", "start_after_pk", "limit") and value is not None
+        }
+        if not filters and not data["all"]:
+            raise serializers.ValidationError(_("Give at least one filter, or all=true to reset every dispenser"))
+        return data
 
 
 class AdminDispenserSerializer(serializers.ModelSerializer):
@@ -53,3 +107,26 @@ class DispenserModelSerializer(serializers.ModelSerializer):
         fields = ["id", "code", "name", "slot_count", "serial_prefix", "next_sequence"]
         read_only_fields = ["next_sequence"]
 
+
+class ReserveSerialIdsSerializer(serializers.Serializer):
+    count = serializers.IntegerField(min_value=1, max_value=DispenserModel.MAX_SEQUENCE)
+    date = serializers.DateField(required=False)
+
+
+class DispenserImportSerializer(serializers.Serializer):
+    manifest = serializers.FileField()
+    format = serializers.ChoiceField(choices=MANIFEST_FORMATS, required=False)
+
+
+class AdminPendingSyncSerializer(serializers.ModelSerializer):
+    model = serializers.CharField(source="dispenser_model.code", default=None, read_only=True)
+    pending_seconds = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Dispenser
+        fields = ["id", "serial_id", "model", "schedule_version", "dirty_since", "pending_seconds", "last_seen_at"]
+
+    def get_pending_seconds(self, obj):
+        if obj.dirty_since is None:
+            return None
+        return round((self.context["now"] - obj.dirty_since).total_seconds())
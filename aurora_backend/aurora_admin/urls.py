@@ -3,12 +3,24 @@ from django.urls import path
 from .views import (
     AdminUsersListView,
     AdminDispenserListView,
+    AdminDispenserImportView,
+    AdminFleetHealthView,
+    AdminResetPairingView,
+    AdminPendingSyncListView,
+    AdminSyncLagView,
     AdminDispenserModelListCreateView,
+    AdminReserveSerialIdsView,
 )
 
 urlpatterns = [
     path('users/', AdminUsersListView.as_view(), name='admin-users'),
     path('dispensers/', AdminDispenserListView.as_view(), name='admin-dispensers'),
+    path('fleet-health/', AdminFleetHealthView.as_view(), name='admin-fleet-health'),
+    path('pending-sync/', AdminPendingSyncListView.as_view(), name='admin-pending-sync'),
+    path('pending-sync/lag/', AdminSyncLagView.as_view(), name='admin-sync-lag'),
+    path('dispensers/reset-pairing/', AdminResetPairingView.as_view(), name='admin-reset-pairing'),
+    path('dispensers/import/', AdminDispenserImportView.as_view(), name='admin-dispenser-import'),
     path('dispenser-models/', AdminDispenserModelListCreateView.as_view(), name='admin-dispenser-models'),
+    path('dispenser-models/<str:code>/serials/', AdminReserveSerialIdsView.as_view(), name='admin-reserve-serial-ids'),
 ]
 
@@ -1,28 +1,188 @@
+import io
+
 from django.db import transaction
+from django.utils import timezone
 from rest_framework import generics, permissions, status
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from authentication.models import User
-from dispensers.models import Dispenser, DispenserModel
+from aurora_backend.query_budget import query_budget
+from dispensers.models import DispenserModel
+from dispensers.manifest import ManifestError, detect_format, iter_manifest_rows
+from dispensers.services import (
+    SerialRangeExhausted,
+    import_dispensers,
+    reserve_serial_ids,
+    reset_pairing_in_chunks,
+)
+from .pagination import AdminCursorPagination, PendingSyncPagination
+from .selectors import (
+    filter_admin_dispensers,
+    get_fleet_health,
+    get_sync_lag_histogram,
+    list_admin_users,
+    list_pending_sync_dispensers,
+)
 from .serializers import (
     AdminUserSerializer,
+    AdminUserFilterSerializer,
+    AdminDispenserFilterSerializer,
     AdminDispenserSerializer,
     DispenserModelSerializer,
+    ReserveSerialIdsSerializer,
+    DispenserImportSerializer,
+    AdminPendingSyncSerializer,
+    AdminResetPairingSerializer,
 )
 
 
+@query_budget(2)
 class AdminUsersListView(generics.ListAPIView):
+    """
+    Users, newest first, cursor-paginated, with dispenser counts and last
+    device activity. search filters by email prefix (case-sensitive).
+    """
+
     permission_classes = [permissions.IsAdminUser]
     serializer_class = AdminUserSerializer
-    queryset = User.objects.all()
+    pagination_class = AdminCursorPagination
+
+    def get_queryset(self):
+        filters = AdminUserFilterSerializer(data=self.request.query_params.dict())
+        filters.is_valid(raise_exception=True)
+        return list_admin_users(**filters.validated_data)
 
 
+@query_budget(2)
 class AdminDispenserListView(generics.ListAPIView):
+    """
+    Fleet listing, newest first, cursor-paginated. Filters: model (code),
+    owner (email), paired, dirty, last_seen_after/last_seen_before, and
+    search (serial_id prefix).
+    """
+
     permission_classes = [permissions.IsAdminUser]
     serializer_class = AdminDispenserSerializer
-    queryset = Dispenser.objects.select_related("owner", "dispenser_model").all()
+    pagination_class = AdminCursorPagination
+
+    def get_queryset(self):
+        # A plain dict so absent booleans stay None instead of HTML-form False.
+        filters = AdminDispenserFilterSerializer(data=self.request.query_params.dict())
+        filters.is_valid(raise_exception=True)
+        return filter_admin_dispensers(**filters.validated_data)
+
+
+# Auth, then per chunk: id lookup, savepoint, UPDATE, release; plus the final "more left?" check.
+@query_budget(2 + 4 * (AdminResetPairingSerializer.MAX_LIMIT // 1000))
+class AdminResetPairingView(APIView):
+    """
+    Clear pairing and revoke device sessions for dispensers matching the
+    same filters as the admin dispenser list (or all=true for the whole
+    fleet), in short chunked UPDATEs.
+
+    Each call resets at most `limit` dispensers in id order, starting after
+    start_after_pk, so no request runs long enough to hit a timeout. The
+    response's last_pk is where the next call resumes; done is true once
+    nothing matching is left. For a whole-fleet sweep in one go, use the
+    reset_pairing management command.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    chunk_size = 1000
+
+    def post(self, request):
+        serializer = AdminResetPairingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        filters = dict(serializer.validated_data)
+        filters.pop("all")
+        start_after_pk = filters.pop("start_after_pk")
+        limit = filters.pop("limit")
+
+        dispensers = filter_admin_dispensers(**filters)
+        chunks = [(0, start_after_pk)]
+        reset = reset_pairing_in_chunks(
+            dispensers,
+            chunk_size=self.chunk_size,
+            start_after_pk=start_after_pk,
+            limit=limit,
+            progress=lambda total, last_pk: chunks.append((total, last_pk)),
+        )
+        last_pk = chunks[-1][1]
+        done = reset < limit or not dispensers.filter(pk__gt=last_pk).exists()
+        return Response({"reset": reset, "chunks": len(chunks) - 1, "last_pk": last_pk, "done": done})
 
 
+@query_budget(2)
+class AdminFleetHealthView(APIView):
+    """
+    Online / stale / never-seen / unpaired / dirty dispenser counts, broken
+    down by dispenser model. Served from a short-lived cache.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(get_fleet_health())
+
+
+@query_budget(2)
+class AdminPendingSyncListView(generics.ListAPIView):
+    """
+    Dispensers whose configuration changed since their last fetch, the
+    longest-waiting first.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    serializer_class = AdminPendingSyncSerializer
+    pagination_class = PendingSyncPagination
+
+    def get_queryset(self):
+        return list_pending_sync_dispensers()
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), "now": timezone.now()}
+
+
+@query_budget(2)
+class AdminSyncLagView(APIView):
+    """Histogram of configuration propagation lag and pending-sync queue stats."""
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(get_sync_lag_histogram())
+
+
+@query_budget(6)
+class AdminDispenserImportView(APIView):
+    """
+    Pre-register dispensers from an uploaded CSV/NDJSON manifest. The upload
+    is read row by row from Django's upload storage (spooled to disk when
+    large) and imported in batches; responds with a per-row error report.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        serializer = DispenserImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        manifest = serializer.validated_data["manifest"]
+
+        try:
+            manifest_format = serializer.validated_data.get("format") or detect_format(manifest.name)
+            stream = io.TextIOWrapper(manifest.open("rb"), encoding="utf-8-sig", newline="")
+            report = import_dispensers(iter_manifest_rows(stream, manifest_format))
+        except ManifestError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except UnicodeDecodeError:
+            return Response({"detail": "Manifest must be UTF-8 text"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(report)
+
+
+@query_budget(get=2, post=4)
 class AdminDispenserModelListCreateView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = DispenserModelSerializer
@@ -31,3 +191,32 @@ class AdminDispenserModelListCreateView(generics.ListCreateAPIView):
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
 
+
+@query_budget(3)
+class AdminReserveSerialIdsView(APIView):
+    """
+    Reserve a contiguous block of serial IDs for a dispenser model, e.g. for
+    a manufacturing run. Each call consumes `count` of the model's 9999
+    sequence numbers for the serials' date (today unless `date` is given);
+    a block that does not fit the rest of that day returns 409 with the
+    number still free.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, code: str):
+        serializer = ReserveSerialIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            serial_ids = reserve_serial_ids(
+                code=code,
+                count=serializer.validated_data["count"],
+                day=serializer.validated_data.get("date"),
+            )
+        except DispenserModel.DoesNotExist:
+            return Response({"detail": "Dispenser model not found"}, status=status.HTTP_404_NOT_FOUND)
+        except SerialRangeExhausted as exc:
+            return Response({"detail": str(exc), "remaining": exc.remaining}, status=status.HTTP_409_CONFLICT)
+
+        return Response({"code": code, "serial_ids": serial_ids}, status=status.HTTP_201_CREATED)
@@ -0,0 +1,97 @@
+"""
+Per-view database query budgets.
+
+Views declare the most queries a single request may run:
+
+    @query_budget(3)                    # any method
+    @query_budget(get=2, post=6)        # per HTTP method
+
+QueryBudgetMiddleware counts every statement a request executes (on all
+database connections, savepoints included) and compares it with the
+budget of the view that handled it. It only runs with DEBUG or
+QUERY_BUDGET_ENABLED = True, so production requests don't pay for the
+counting. Overruns are logged; with QUERY_BUDGET_STRICT = True (CI, or a
+test) they raise QueryBudgetExceeded instead, so an N+1 regression fails
+the test that exercises it. Strict requests run in a transaction that the
+exception rolls back, so an overrun never leaves its writes behind.
+"""
+
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(limit: int | None = None, **per_method: int):
+    """Class or function view decorator declaring the view's query budget."""
+
+    def decorate(view):
+        view.query_budget = {method.upper(): value for method, value in per_method.items()}
+        if limit is not None:
+            view.query_budget["*"] = limit
+        return view
+
+    return decorate
+
+
+def get_query_budget(view_func, method: str) -> int | None:
+    """The budget declared for `method` on a resolved view function, or None."""
+    view = getattr(view_func, "view_class", None) or getattr(view_func, "cls", None) or view_func
+    budgets = getattr(view, "query_budget", None)
+    if not budgets:
+        return None
+    return budgets.get(method.upper(), budgets.get("*"))
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        if not (settings.DEBUG or getattr(settings, "QUERY_BUDGET_ENABLED", False)):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        strict = getattr(settings, "QUERY_BUDGET_STRICT", False)
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            if strict:
+                for alias in connections:
+                    stack.enter_context(transaction.atomic(using=alias))
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+
+            message = self.overrun_message(request, counter.count)
+            if message and strict:
+                raise QueryBudgetExceeded(message)
+
+        if message:
+            logger.warning(message)
+        return response
+
+    @staticmethod
+    def overrun_message(request, count: int) -> str | None:
+        match = getattr(request, "resolver_match", None)
+        budget = get_query_budget(match.func, request.method) if match else None
+        if budget is None or count <= budget:
+            return None
+        return (
+            f"{request.method} {request.path} ran {count} queries, "
+            f"over the budget of {budget} for {match.view_name}"
+        )
@@ -2,7 +2,10 @@
 Base settings shared across environments.
 """
 
+import json
 import os
+import sys
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 
@@ -36,8 +39,8 @@ REST_FRAMEWORK = {
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_THROTTLE_CLASSES': (
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'aurora_backend.throttling.AnonRateThrottle',
+        'aurora_backend.throttling.UserRateThrottle',
     ),
     'DEFAULT_THROTTLE_RATES': {
         'anon': '60/min',
@@ -46,10 +49,26 @@ REST_FRAMEWORK = {
         'register': '5/min',
         'logout': '30/min',
         'delete_user': '5/min',
+        # Per-dispenser token buckets for device endpoints.
+        'device_config': '30/min',
+        'device_events': '60/min',
+        'device_session': '10/min',
+        'device_pair': '5/min',
+        'device_gateway': '30/min',
     },
     'EXCEPTION_HANDLER': 'aurora_backend.exceptions.custom_exception_handler',
 }
 
+TESTING = sys.argv[1:2] == ["test"]
+
+# Shared throttle state (see aurora_backend/throttling.py): memory://, sqlite:///<path> or redis://...
+# The sqlite default is shared by workers on one host only; settings_prod requires an explicit URL.
+# Test runs use an in-process store so no throttle state carries over between runs.
+THROTTLE_STORE_URL = os.getenv(
+    "THROTTLE_STORE_URL",
+    "memory://" if TESTING else f"sqlite:///{Path(tempfile.gettempdir()) / 'aurora-throttle.sqlite3'}",
+)
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
@@ -81,9 +100,44 @@ SIMPLE_JWT = {
 DEVICE_TOKEN_SECRET = os.getenv("DEVICE_TOKEN_SECRET", SECRET_KEY)
 DEVICE_TOKEN_TTL_MINUTES = int(os.getenv("DEVICE_TOKEN_TTL_MINUTES", "60"))
 DEVICE_TOKEN_ALGORITHM = os.getenv("DEVICE_TOKEN_ALGORITHM", "HS256")
+# Key rotation: JSON list of {"kid", "secret", "verify_until"?}. Tokens are signed
+# with DEVICE_TOKEN_ACTIVE_KID and verified with whichever key their kid header
+# names. Keep a retired key listed with verify_until >= (switch time + TTL) so
+# outstanding tokens expire naturally instead of all at once. Tokens without a
+# kid are verified with the "default" key (DEVICE_TOKEN_SECRET when unset).
+DEVICE_TOKEN_KEYS = json.loads(os.getenv("DEVICE_TOKEN_KEYS", "[]"))
+DEVICE_TOKEN_ACTIVE_KID = os.getenv("DEVICE_TOKEN_ACTIVE_KID", "")
+# Per-process LRU of already-verified device tokens (0 disables the cache).
+DEVICE_TOKEN_CACHE_SIZE = int(os.getenv("DEVICE_TOKEN_CACHE_SIZE", "4096"))
+# Fleet gateways allowed to request sessions in bulk, as "name:key,name:key".
+DEVICE_GATEWAY_KEYS = dict(
+    entry.split(":", 1) for entry in os.getenv("DEVICE_GATEWAY_KEYS", "").split(",") if ":" in entry
+)
+DEVICE_GATEWAY_MAX_BATCH = int(os.getenv("DEVICE_GATEWAY_MAX_BATCH", "200"))
+
+# A recorded ScheduleEvent counts as the outcome of a dose if it happened within this many minutes of it.
+DOSE_EVENT_MATCH_WINDOW_MINUTES = int(os.getenv("DOSE_EVENT_MATCH_WINDOW_MINUTES", "120"))
+
+# Fleet health buckets: a dispenser is online if it checked in within the first
+# window and stale if its last check-in is older than the second.
+FLEET_ONLINE_WINDOW_SECONDS = int(os.getenv("FLEET_ONLINE_WINDOW_SECONDS", "600"))
+FLEET_STALE_AFTER_SECONDS = int(os.getenv("FLEET_STALE_AFTER_SECONDS", str(24 * 3600)))
+FLEET_HEALTH_CACHE_SECONDS = int(os.getenv("FLEET_HEALTH_CACHE_SECONDS", "15"))
+
+# How long a rendered owner dispenser response is kept; entries are keyed on data versions, so this only bounds memory.
+DISPENSER_RESPONSE_CACHE_SECONDS = int(os.getenv("DISPENSER_RESPONSE_CACHE_SECONDS", "600"))
+
+# QueryBudgetMiddleware only counts queries with DEBUG or this on; leave it off in production.
+QUERY_BUDGET_ENABLED = os.getenv("QUERY_BUDGET_ENABLED", "False").lower() == "true"
+# Raise (and roll back) instead of logging when a request runs more queries than its view's @query_budget.
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "False").lower() == "true"
+
+# Upper bound on how long a worker keeps serving a DispenserModel catalog edited by another process.
+DISPENSER_MODEL_CATALOG_TTL = int(os.getenv("DISPENSER_MODEL_CATALOG_TTL", "300"))
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'aurora_backend.query_budget.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -11,6 +11,11 @@ SECRET_KEY = os.environ.get("DJANGO_SECRET_KEY", SECRET_KEY)
 if not SECRET_KEY or SECRET_KEY.startswith("django-insecure"):
     raise RuntimeError("DJANGO_SECRET_KEY must be set in production.")
 
+# The sqlite:// default in settings_base only covers the workers of one host.
+THROTTLE_STORE_URL = os.environ.get("THROTTLE_STORE_URL", "")
+if not THROTTLE_STORE_URL:
+    raise RuntimeError("THROTTLE_STORE_URL must be set in production (e.g. redis://host:6379/0).")
+
 ALLOWED_HOSTS = [host for host in os.getenv("DJANGO_ALLOWED_HOSTS", "").split(",") if host] or []
 
 # Harden cookies/transport; adjust if behind a proxy/terminating TLS.
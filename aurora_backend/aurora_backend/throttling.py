@@ -0,0 +1,341 @@
+"""
+Shared throttle state for DRF throttles.
+
+DRF's built-in throttles keep their history in the default Django cache,
+which is per-process LocMem here. The stores below keep throttle state
+somewhere every worker can see and update it atomically:
+
+- memory://            single-process dict (tests, runserver)
+- sqlite:///<path>     file shared by all workers on one host
+- redis://host:port/0  shared across hosts (requires the redis package)
+
+Select one with THROTTLE_STORE_URL.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from itertools import count
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework import throttling
+from rest_framework.throttling import SimpleRateThrottle
+
+
+def _take_token(tokens, stamp, capacity, rate, now):
+    """
+    Refill a bucket holding `tokens` at `stamp` up to `now` and try to take one.
+    Returns (tokens_left, wait_seconds); wait is 0 when the request is allowed.
+    """
+    tokens = min(capacity, tokens + max(0.0, now - stamp) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+def _slide_window(start, current, previous, window, now):
+    """
+    Roll stored (start, current, previous) counters forward to the window
+    containing `now`. Returns the new (start, current, previous).
+    """
+    window_start = now - (now % window)
+    if start == window_start:
+        return start, current, previous
+    if start == window_start - window:
+        return window_start, 0, current
+    return window_start, 0, 0
+
+
+def _hit_window(current, previous, limit, window, start, now):
+    """
+    Sliding-window counter: weight the previous fixed window by how much of it
+    still overlaps the trailing `window` seconds. Returns (current, wait).
+    """
+    elapsed = now - start
+    estimate = previous * (1 - elapsed / window) + current
+    if estimate + 1 <= limit:
+        return current + 1, 0.0
+    room = limit - 1 - current
+    if room >= 0 and previous:
+        # Wait until enough of the previous window has slid out.
+        return current, max(0.0, (1 - room / previous) * window - elapsed)
+    return current, window - elapsed
+
+
+class ThrottleStore(ABC):
+    @abstractmethod
+    def take_token(self, key, capacity, rate, now):
+        """
+        Atomically take one token from the bucket `key`, which holds at most
+        `capacity` tokens and refills at `rate` tokens per second.
+        Returns the number of seconds to wait, or 0 if the request is allowed.
+        """
+
+    @abstractmethod
+    def hit_window(self, key, limit, window, now):
+        """
+        Atomically count a request against the sliding window `key`, allowing
+        at most `limit` requests per `window` seconds. Denied requests are not
+        counted. Returns the number of seconds to wait, or 0 if allowed.
+        """
+
+
+class MemoryThrottleStore(ThrottleStore):
+    def __init__(self):
+        self._buckets = {}
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def take_token(self, key, capacity, rate, now):
+        with self._lock:
+            tokens, stamp = self._buckets.get(key, (capacity, now))
+            tokens, wait = _take_token(tokens, stamp, capacity, rate, now)
+            self._buckets[key] = (tokens, now)
+        return wait
+
+    def hit_window(self, key, limit, window, now):
+        with self._lock:
+            start, current, previous = _slide_window(*self._windows.get(key, (None, 0, 0)), window, now)
+            current, wait = _hit_window(current, previous, limit, window, start, now)
+            self._windows[key] = (start, current, previous)
+        return wait
+
+
+class SQLiteThrottleStore(ThrottleStore):
+    """
+    Keeps buckets in a SQLite file; BEGIN IMMEDIATE serializes the
+    read-modify-write across every process that opens the same file.
+    """
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # Shared by every thread; next() on a count is atomic, unlike += 1.
+        self._calls = count(1)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        # Connections must not be shared across a fork (e.g. gunicorn --preload).
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_bucket ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, stamp REAL NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sliding_window ("
+                "key TEXT PRIMARY KEY, start REAL NOT NULL, current INTEGER NOT NULL, "
+                "previous INTEGER NOT NULL, expires REAL NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _write(self, callback):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = callback(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def _maybe_purge(self, conn, now):
+        if next(self._calls) % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM token_bucket WHERE expires < ?", (now,))
+            conn.execute("DELETE FROM sliding_window WHERE expires < ?", (now,))
+
+    def take_token(self, key, capacity, rate, now):
+        def take(conn):
+            row = conn.execute("SELECT tokens, stamp FROM token_bucket WHERE key = ?", (key,)).fetchone()
+            tokens, stamp = row if row else (capacity, now)
+            tokens, wait = _take_token(tokens, stamp, capacity, rate, now)
+            conn.execute(
+                "INSERT INTO token_bucket (key, tokens, stamp, expires) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, stamp = excluded.stamp, "
+                "expires = excluded.expires",
+                (key, tokens, now, now + capacity / rate),
+            )
+            self._maybe_purge(conn, now)
+            return wait
+
+        return self._write(take)
+
+    def hit_window(self, key, limit, window, now):
+        def hit(conn):
+            row = conn.execute(
+                "SELECT start, current, previous FROM sliding_window WHERE key = ?", (key,)
+            ).fetchone()
+            start, current, previous = _slide_window(*(row or (None, 0, 0)), window, now)
+            current, wait = _hit_window(current, previous, limit, window, start, now)
+            conn.execute(
+                "INSERT INTO sliding_window (key, start, current, previous, expires) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET start = excluded.start, current = excluded.current, "
+                "previous = excluded.previous, expires = excluded.expires",
+                (key, start, current, previous, start + 2 * window),
+            )
+            self._maybe_purge(conn, now)
+            return wait
+
+        return self._write(hit)
+
+
+class RedisThrottleStore(ThrottleStore):
+    """
+    Runs each check as a Lua script so it is atomic on the Redis server.
+    """
+
+    TOKEN_BUCKET_SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+        local tokens = tonumber(state[1]) or capacity
+        local stamp = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - stamp) * rate)
+        local wait = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            wait = (1 - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'stamp', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+        return tostring(wait)
+    """
+
+    SLIDING_WINDOW_SCRIPT = """
+        local limit = tonumber(ARGV[1])
+        local window = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local start = now - (now % window)
+        local state = redis.call('HMGET', KEYS[1], 'start', 'current', 'previous')
+        local stored = tonumber(state[1])
+        local current = tonumber(state[2]) or 0
+        local previous = tonumber(state[3]) or 0
+        if stored ~= start then
+            if stored == start - window then
+                previous = current
+            else
+                previous = 0
+            end
+            current = 0
+        end
+        local elapsed = now - start
+        local wait = 0
+        if previous * (1 - elapsed / window) + current + 1 <= limit then
+            current = current + 1
+        else
+            local room = limit - 1 - current
+            if room >= 0 and previous > 0 then
+                wait = math.max(0, (1 - room / previous) * window - elapsed)
+            else
+                wait = window - elapsed
+            end
+        end
+        redis.call('HSET', KEYS[1], 'start', start, 'current', current, 'previous', previous)
+        redis.call('EXPIRE', KEYS[1], math.ceil(2 * window))
+        return tostring(wait)
+    """
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError as exc:
+            raise ImproperlyConfigured("THROTTLE_STORE_URL uses redis:// but the redis package is not installed.") from exc
+        self._client = redis.Redis.from_url(url)
+        self._token_bucket = self._client.register_script(self.TOKEN_BUCKET_SCRIPT)
+        self._sliding_window = self._client.register_script(self.SLIDING_WINDOW_SCRIPT)
+
+    def take_token(self, key, capacity, rate, now):
+        return float(self._token_bucket(keys=[key], args=[capacity, rate, now]))
+
+    def hit_window(self, key, limit, window, now):
+        return float(self._sliding_window(keys=[key], args=[limit, window, now]))
+
+
+def build_throttle_store(url):
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        return MemoryThrottleStore()
+    if parsed.scheme == "sqlite":
+        return SQLiteThrottleStore(parsed.path)
+    if parsed.scheme in ("redis", "rediss"):
+        return RedisThrottleStore(url)
+    raise ImproperlyConfigured(f"Unsupported THROTTLE_STORE_URL scheme '{parsed.scheme}'")
+
+
+@lru_cache(maxsize=None)
+def get_throttle_store():
+    return build_throttle_store(getattr(settings, "THROTTLE_STORE_URL", "memory://"))
+
+
+@receiver(setting_changed)
+def _reset_throttle_store(*, setting, **kwargs):
+    if setting == "THROTTLE_STORE_URL":
+        get_throttle_store.cache_clear()
+
+
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """
+    Drop-in replacement for SimpleRateThrottle's list-of-timestamps history:
+    two counters per key in the shared store, so each check is O(1) and the
+    limit holds across all worker processes.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self._wait = get_throttle_store().hit_window(self.key, self.num_requests, self.duration, self.timer())
+        return self._wait == 0
+
+    def wait(self):
+        return math.ceil(self._wait) if self._wait else None
+
+
+class AnonRateThrottle(SlidingWindowRateThrottle, throttling.AnonRateThrottle):
+    pass
+
+
+class UserRateThrottle(SlidingWindowRateThrottle, throttling.UserRateThrottle):
+    pass
+
+
+class TokenBucketRateThrottle(SimpleRateThrottle):
+    """
+    Token-bucket variant of SimpleRateThrottle backed by the shared store.
+    A rate of "30/min" allows bursts of 30 requests and refills one token
+    every two seconds.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        rate = self.num_requests / self.duration
+        self._wait = get_throttle_store().take_token(self.key, self.num_requests, rate, self.timer())
+        return self._wait == 0
+
+    def wait(self):
+        return math.ceil(self._wait) if self._wait else None
@@ -31,9 +31,11 @@ def blacklist_all_user_tokens(user):
     Blacklist every outstanding token for a user.
     Idempotent: safe to call multiple times.
     """
-    outstanding_tokens = OutstandingToken.objects.filter(user=user)
-    for token in outstanding_tokens:
-        BlacklistedToken.objects.get_or_create(token=token)
+    token_ids = OutstandingToken.objects.filter(user=user, blacklistedtoken__isnull=True).values_list("pk", flat=True)
+    BlacklistedToken.objects.bulk_create(
+        [BlacklistedToken(token_id=token_id) for token_id in token_ids],
+        ignore_conflicts=True,
+    )
 
 
 @transaction.atomic
@@ -1,4 +1,4 @@
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
+from aurora_backend.throttling import UserRateThrottle, AnonRateThrottle
 
 
 class LoginThrottle(UserRateThrottle):
@@ -7,7 +7,9 @@ from rest_framework.views import APIView
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.serializers import TokenRefreshSerializer
-from rest_framework_simplejwt.views import TokenRefreshView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from aurora_backend.query_budget import query_budget
 
 from .models import User
 from .serializers import RegisterSerializer, LoginSerializer, UserSerializer, UpdateNamesSerializer
@@ -23,6 +25,7 @@ from .throttles import (
     RegisterThrottle,
 )
 
+@query_budget(4)
 class RegisterView(APIView):
     throttle_classes = [RegisterThrottle]
 
@@ -44,6 +47,7 @@ class RegisterView(APIView):
         errorMessages = " ".join([" ".join(messages) for messages in serializer.errors.values()])
         return Response({"detail": errorMessages}, status=status.HTTP_400_BAD_REQUEST)
 
+@query_budget(2)
 class LoginView(views.APIView):
     permission_classes = []
     throttle_classes = [LoginThrottle]
@@ -67,6 +71,7 @@ class LoginView(views.APIView):
         return Response({"detail": errorMessages}, status=status.HTTP_400_BAD_REQUEST)
     
 
+@query_budget(8)
 class LogoutView(APIView):
     throttle_classes = [LogoutThrottle]
 
@@ -91,6 +96,7 @@ class GetAllUsersView(APIView):
         serializer = UserSerializer(users, many=True)        
         return Response(serializer.data, status=status.HTTP_200_OK)
  
+@query_budget(1)
 class GetUserView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
@@ -100,6 +106,7 @@ class GetUserView(APIView):
         userData = UserSerializer(user).data
         return Response(userData, status=status.HTTP_200_OK)
     
+@query_budget(2)
 class UpdateNamesView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
@@ -124,9 +131,22 @@ class UpdateNamesView(APIView):
     def put(self, request):
         return self.patch(request)
     
+@query_budget(3)
+class ObtainTokenPairView(TokenObtainPairView):
+    pass
+
+
+# simplejwt's rotate-and-blacklist refresh: the blacklist and active-user
+# checks, then a user lookup and get_or_create (with savepoint) for the old
+# token's blacklist row and again for the new token's outstanding row.
+@query_budget(13)
 class RefreshAccessTokenView(TokenRefreshView):
     serializer_class = TokenRefreshSerializer
 
+# Auth, one bulk blacklist of the user's tokens, then Django's delete
+# collector: related dispensers and templates, admin log, groups,
+# permissions, outstanding tokens and the user row; two savepoint pairs.
+@query_budget(14)
 class DeleteUserView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class DispensersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dispensers'
+
+    def ready(self):
+        # Connects the DispenserModel catalog invalidation signals.
+        from . import catalog  # noqa: F401
@@ -0,0 +1,65 @@
+"""
+Process-local cache of the DispenserModel catalog.
+
+The catalog is a handful of rows that change a few times a year, but it is
+consulted on every registration and whenever a dispenser's slot count is
+needed. It is loaded with one query and kept until a DispenserModel is saved
+or deleted in this process, or DISPENSER_MODEL_CATALOG_TTL seconds pass
+(which bounds staleness for edits made by other processes).
+
+Cached instances are shared: treat them as read-only. Their next_sequence
+is only the frozen floor for new per-day serial counters, so it is safe to
+read from the cache (see services.reserve_serial_ids).
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import DispenserModel
+
+
+class DispenserModelCatalog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (by_code, by_id, expires), swapped as one tuple so readers never see a mix.
+        self._state = None
+
+    def _tables(self):
+        state = self._state
+        if state is None or time.monotonic() >= state[2]:
+            with self._lock:
+                state = self._state
+                if state is None or time.monotonic() >= state[2]:
+                    models = list(DispenserModel.objects.all())
+                    state = (
+                        {model.code: model for model in models},
+                        {model.pk: model for model in models},
+                        time.monotonic() + getattr(settings, "DISPENSER_MODEL_CATALOG_TTL", 300),
+                    )
+                    self._state = state
+        return state
+
+    def by_code(self, code: str) -> DispenserModel | None:
+        return self._tables()[0].get(code)
+
+    def by_id(self, pk: int) -> DispenserModel | None:
+        return self._tables()[1].get(pk)
+
+    def codes(self) -> dict[str, DispenserModel]:
+        return dict(self._tables()[0])
+
+    def clear(self) -> None:
+        self._state = None
+
+
+dispenser_model_catalog = DispenserModelCatalog()
+
+
+@receiver(post_save, sender=DispenserModel)
+@receiver(post_delete, sender=DispenserModel)
+def _invalidate_dispenser_model_catalog(**kwargs):
+    dispenser_model_catalog.clear()
@@ -1,9 +1,12 @@
+import hmac
+
+from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from rest_framework import authentication, exceptions
 from rest_framework.authentication import get_authorization_header
 
 from .models import Dispenser
-from .device_tokens import decode_device_token
+from .device_tokens import verify_device_token
 
 
 class DeviceAuthentication(authentication.BaseAuthentication):
@@ -35,6 +38,33 @@ class DeviceAuthentication(authentication.BaseAuthentication):
         # Return (user, auth) tuple. Use owner as acting user if present; otherwise anonymous.
         return (dispenser.owner if dispenser.owner else None, dispenser)
 
+    def authenticate_header(self, request):
+        return 'Bearer realm="device"'
+
+
+class DeviceGatewayAuthentication(authentication.BaseAuthentication):
+    """
+    Shared-key auth for fleet gateways (hubs fronting many dispensers).
+    Expects:
+      - Header X-Gateway-Key: <key>, matching one of settings.DEVICE_GATEWAY_KEYS
+    request.auth is set to the gateway's configured name.
+    """
+
+    keyword = "X-Gateway-Key"
+
+    def authenticate(self, request):
+        key = request.headers.get(self.keyword)
+        if not key:
+            raise exceptions.AuthenticationFailed(_("Missing gateway key"))
+
+        for name, expected in getattr(settings, "DEVICE_GATEWAY_KEYS", {}).items():
+            if hmac.compare_digest(key.encode(), expected.encode()):
+                return (None, name)
+        raise exceptions.AuthenticationFailed(_("Invalid gateway key"))
+
+    def authenticate_header(self, request):
+        return 'Gateway realm="device-gateway"'
+
 
 class DeviceSessionAuthentication(authentication.BaseAuthentication):
     """
@@ -60,13 +90,10 @@ class DeviceSessionAuthentication(authentication.BaseAuthentication):
         token = auth[1].decode()
 
         try:
-            payload = decode_device_token(token)
+            token_serial, token_rev, _exp = verify_device_token(token)
         except Exception:
             raise exceptions.AuthenticationFailed(_("Invalid or expired device token"))
 
-        token_serial = payload.get("sub")
-        token_rev = payload.get("rev")
-
         if not token_serial or token_rev is None:
             raise exceptions.AuthenticationFailed(_("Invalid device token payload"))
 
@@ -82,4 +109,5 @@ class DeviceSessionAuthentication(authentication.BaseAuthentication):
 
         return (dispenser.owner if dispenser.owner else None, dispenser)
 
-
+    def authenticate_header(self, request):
+        return 'Bearer realm="device"'
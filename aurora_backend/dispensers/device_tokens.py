@@ -1,9 +1,21 @@
-from datetime import timedelta
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
 
 import jwt
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.utils import timezone
 
+# Tokens issued before key rotation carry no kid header.
+DEFAULT_KID = "default"
+
+SigningKey = namedtuple("SigningKey", ["kid", "secret", "algorithm", "verify_until"])
+
 
 def _device_token_ttl():
     minutes = getattr(settings, "DEVICE_TOKEN_TTL_MINUTES", 60)
@@ -13,13 +25,72 @@ def _device_token_ttl():
         return timedelta(minutes=60)
 
 
+def _parse_verify_until(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if timezone.is_naive(value):
+        value = value.replace(tzinfo=dt_timezone.utc)
+    return value.timestamp()
+
+
+@lru_cache(maxsize=None)
+def _signing_keys():
+    """
+    Resolve DEVICE_TOKEN_KEYS once into a kid -> SigningKey table.
+
+    Each entry is {"kid", "secret", optional "algorithm", optional
+    "verify_until"}. Without DEVICE_TOKEN_KEYS the single
+    DEVICE_TOKEN_SECRET is used under the "default" kid.
+    """
+    algorithm = getattr(settings, "DEVICE_TOKEN_ALGORITHM", "HS256")
+    entries = getattr(settings, "DEVICE_TOKEN_KEYS", None) or [
+        {"kid": DEFAULT_KID, "secret": getattr(settings, "DEVICE_TOKEN_SECRET", settings.SECRET_KEY)}
+    ]
+    return {
+        entry["kid"]: SigningKey(
+            kid=entry["kid"],
+            secret=entry["secret"],
+            algorithm=entry.get("algorithm", algorithm),
+            verify_until=_parse_verify_until(entry.get("verify_until")),
+        )
+        for entry in entries
+    }
+
+
+def _active_signing_key():
+    keys = _signing_keys()
+    kid = getattr(settings, "DEVICE_TOKEN_ACTIVE_KID", None) or next(iter(keys))
+    return keys[kid]
+
+
+def _verification_key(kid):
+    """
+    Return the SigningKey for kid if it may still verify tokens, else None.
+    """
+    key = _signing_keys().get(kid or DEFAULT_KID)
+    if key is None or (key.verify_until is not None and key.verify_until <= time.time()):
+        return None
+    return key
+
+
+@receiver(setting_changed)
+def _reset_signing_keys(*, setting, **kwargs):
+    if setting in ("DEVICE_TOKEN_KEYS", "DEVICE_TOKEN_ACTIVE_KID", "DEVICE_TOKEN_SECRET", "DEVICE_TOKEN_ALGORITHM"):
+        _signing_keys.cache_clear()
+        verified_token_cache.clear()
+
+
 def issue_device_token(dispenser):
     """
     Create a signed JWT for a dispenser device. Token contains:
     - sub: serial_id
     - rev: dispenser.device_session_rev (used for revocation/rotation)
     - type: "device"
+    The token is signed with the active key and names it in the kid header.
     """
+    key = _active_signing_key()
     now = timezone.now()
     exp = now + _device_token_ttl()
     payload = {
@@ -29,21 +100,84 @@ def issue_device_token(dispenser):
         "iat": int(now.timestamp()),
         "exp": int(exp.timestamp()),
     }
-    token = jwt.encode(
-        payload,
-        getattr(settings, "DEVICE_TOKEN_SECRET", settings.SECRET_KEY),
-        algorithm=getattr(settings, "DEVICE_TOKEN_ALGORITHM", "HS256"),
-    )
+    token = jwt.encode(payload, key.secret, algorithm=key.algorithm, headers={"kid": key.kid})
     return token, exp
 
 
 def decode_device_token(token):
     """
-    Decode and verify a device token. Raises jwt exceptions on failure/expiry.
+    Decode and verify a device token against the key named by its kid header.
+    Raises jwt exceptions on failure/expiry or when the key has been retired.
+    """
+    kid = jwt.get_unverified_header(token).get("kid")
+    key = _verification_key(kid)
+    if key is None:
+        raise jwt.InvalidKeyError(f"Unknown or retired device token key '{kid}'")
+    return jwt.decode(token, key.secret, algorithms=[key.algorithm])
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of device tokens whose signature has already been verified.
+    Maps sha256(token) -> (sub, rev, exp, kid). Entries are only served while
+    exp is still in the future, matching PyJWT's expiry rule exactly.
+    Revocation is not cached: callers still compare rev to the dispenser row.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        key = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, token, sub, rev, exp, kid):
+        if self.maxsize <= 0:
+            return
+        key = self._digest(token)
+        with self._lock:
+            self._entries[key] = (sub, rev, exp, kid)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+verified_token_cache = VerifiedTokenCache(getattr(settings, "DEVICE_TOKEN_CACHE_SIZE", 4096))
+
+
+def verify_device_token(token):
+    """
+    Return (sub, rev, exp) for a valid device token, consulting the verified
+    token cache before falling back to full signature verification.
+    Raises jwt exceptions on failure/expiry.
     """
-    return jwt.decode(
-        token,
-        getattr(settings, "DEVICE_TOKEN_SECRET", settings.SECRET_KEY),
-        algorithms=[getattr(settings, "DEVICE_TOKEN_ALGORITHM", "HS256")],
-    )
+    cached = verified_token_cache.get(token)
+    if cached is not None:
+        sub, rev, exp, kid = cached
+        if _verification_key(kid) is None:
+            raise jwt.InvalidKeyError(f"Unknown or retired device token key '{kid}'")
+        return sub, rev, exp
 
+    payload = decode_device_token(token)
+    sub, rev, exp = payload.get("sub"), payload.get("rev"), payload.get("exp")
+    if sub and rev is not None and exp is not None:
+        verified_token_cache.put(token, sub, rev, exp, jwt.get_unverified_header(token).get("kid"))
+    return sub, rev, exp
@@ -1,3 +1,4 @@
+import hmac
 import secrets
 
 from django.db import transaction
@@ -6,15 +7,32 @@ from rest_framework import status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .device_auth import DeviceAuthentication, DeviceSessionAuthentication
+from aurora_backend.query_budget import query_budget
+from aurora_backend.throttling import AnonRateThrottle
+
+from .device_auth import DeviceAuthentication, DeviceSessionAuthentication, DeviceGatewayAuthentication
 from .models import Dispenser, Container, Schedule, ScheduleEvent
-from .serializers import DeviceConfigSerializer, DeviceEventSerializer, DeviceContainerSerializer
+from .serializers import (
+    DeviceConfigSerializer,
+    DeviceEventSerializer,
+    DeviceContainerSerializer,
+    DeviceSessionBatchSerializer,
+)
 from .device_tokens import issue_device_token
+from .throttles import (
+    DeviceConfigThrottle,
+    DeviceEventThrottle,
+    DeviceSessionThrottle,
+    DevicePairThrottle,
+    DeviceGatewayThrottle,
+)
 
 
+@query_budget(6)
 class DeviceConfigView(APIView):
     authentication_classes = [DeviceSessionAuthentication, DeviceAuthentication]
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [DeviceConfigThrottle]
 
     def get(self, request, serial_id):
         dispenser = Dispenser.objects.select_related().prefetch_related(
@@ -24,8 +42,11 @@ class DeviceConfigView(APIView):
             return Response({"detail": "Dispenser not found"}, status=status.HTTP_404_NOT_FOUND)
 
         dispenser.last_seen_at = timezone.now()
+        if dispenser.dirty and dispenser.dirty_since:
+            dispenser.last_sync_lag_seconds = (dispenser.last_seen_at - dispenser.dirty_since).total_seconds()
         dispenser.dirty = False
-        dispenser.save(update_fields=["last_seen_at", "dirty"])
+        dispenser.dirty_since = None
+        dispenser.save(update_fields=["last_seen_at", "dirty", "dirty_since", "last_sync_lag_seconds"])
 
         data = {
             "serial_id": dispenser.serial_id,
@@ -35,9 +56,11 @@ class DeviceConfigView(APIView):
         return Response(data)
 
 
+@query_budget(6)
 class DeviceEventView(APIView):
     authentication_classes = [DeviceSessionAuthentication, DeviceAuthentication]
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [DeviceEventThrottle]
 
     def post(self, request, serial_id):
         dispenser = Dispenser.objects.filter(serial_id=serial_id).first()
@@ -66,6 +89,7 @@ class DeviceEventView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+@query_budget(3)
 class DeviceSessionView(APIView):
     """
     Issues a short-lived bearer token for device requests.
@@ -74,6 +98,7 @@ class DeviceSessionView(APIView):
 
     authentication_classes = [DeviceAuthentication]
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [DeviceSessionThrottle]
 
     def post(self, request, serial_id):
         dispenser = Dispenser.objects.filter(serial_id=serial_id).first()
@@ -90,12 +115,62 @@ class DeviceSessionView(APIView):
         )
 
 
+@query_budget(1)
+class DeviceSessionBatchView(APIView):
+    """
+    Issues session tokens for many dispensers at once on behalf of a fleet gateway.
+    Authenticated with X-Gateway-Key; each device still proves itself with its
+    own device_secret. All serials are resolved with a single query.
+    """
+
+    authentication_classes = [DeviceGatewayAuthentication]
+    permission_classes = [permissions.AllowAny]
+    throttle_classes = [DeviceGatewayThrottle]
+
+    def post(self, request):
+        serializer = DeviceSessionBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        devices = serializer.validated_data["devices"]
+
+        dispensers = {
+            dispenser.serial_id: dispenser
+            for dispenser in Dispenser.objects.filter(
+                serial_id__in={device["serial_id"] for device in devices}
+            ).only("id", "serial_id", "device_secret", "device_session_rev")
+        }
+
+        sessions = []
+        for device in devices:
+            dispenser = dispensers.get(device["serial_id"])
+            if (
+                not dispenser
+                or not dispenser.device_secret
+                or not hmac.compare_digest(dispenser.device_secret.encode(), device["device_secret"].encode())
+            ):
+                sessions.append({"serial_id": device["serial_id"], "detail": "Invalid device credentials"})
+                continue
+
+            token, exp = issue_device_token(dispenser)
+            sessions.append(
+                {
+                    "serial_id": dispenser.serial_id,
+                    "token": token,
+                    "expires_at": exp.isoformat(),
+                }
+            )
+
+        return Response({"sessions": sessions}, status=status.HTTP_200_OK)
+
+
+@query_budget(4)
 class DevicePairView(APIView):
     """
     First-connect pairing: issue device_secret once for unpaired dispensers.
     """
 
     permission_classes = [permissions.AllowAny]
+    # Unauthenticated, so keep the IP-based limit alongside the per-serial one.
+    throttle_classes = [DevicePairThrottle, AnonRateThrottle]
 
     def post(self, request, serial_id):
         with transaction.atomic():
@@ -0,0 +1,157 @@
+"""
+Expansion of weekly Schedule rules into concrete dose instants.
+
+Schedule rows store wall-clock (day_of_week, hour, minute) triples. A
+repeating rule fires every week; a rule with repeat=False fires once, at
+its first occurrence on or after the moment it was created. Instants are
+computed in a given timezone so DST shifts keep the wall-clock time.
+"""
+
+import heapq
+from bisect import bisect_left
+from datetime import datetime, time, timedelta
+from itertools import count
+
+WEEK = timedelta(days=7)
+
+
+def _first_occurrence(schedule, after: datetime, tz) -> datetime:
+    """First wall-clock occurrence of the rule at or after `after`."""
+    local = after.astimezone(tz)
+    days_ahead = (schedule.day_of_week - local.weekday()) % 7
+    day = local.date() + timedelta(days=days_ahead)
+    candidate = datetime.combine(day, time(schedule.hour, schedule.minute), tzinfo=tz)
+    if candidate < after:
+        candidate = datetime.combine(day + WEEK, time(schedule.hour, schedule.minute), tzinfo=tz)
+    return candidate
+
+
+def _weekly(first: datetime, tz):
+    # Step in wall-clock time so DST changes don't drift the time of day.
+    naive = first.replace(tzinfo=None)
+    for week in count():
+        yield (naive + week * WEEK).replace(tzinfo=tz)
+
+
+def iter_schedule_doses(schedule, start: datetime, tz):
+    """Dose instants of one rule from `start` onwards, in order (infinite if repeating)."""
+    if not schedule.repeat:
+        once = _first_occurrence(schedule, schedule.created_at, tz)
+        if once >= start:
+            yield once
+        return
+    yield from _weekly(_first_occurrence(schedule, start, tz), tz)
+
+
+def expand_schedule_doses(schedule, start: datetime, end: datetime, tz) -> list[datetime]:
+    """Dose instants of one rule within [start, end)."""
+    if not schedule.repeat:
+        return [at for at in iter_schedule_doses(schedule, start, tz) if at < end]
+    first = _first_occurrence(schedule, start, tz)
+    if first >= end:
+        return []
+    # Number of weekly occurrences is known up front: one per whole week left.
+    weeks = (end - first) // WEEK + 1
+    naive = first.replace(tzinfo=None)
+    doses = [(naive + week * WEEK).replace(tzinfo=tz) for week in range(weeks)]
+    return [at for at in doses if at < end]
+
+
+def _dose_order(dose):
+    return dose[0], dose[1].pk
+
+
+def expand_doses(schedules, start: datetime, end: datetime, tz) -> list[tuple[datetime, object]]:
+    """All (instant, schedule) pairs within [start, end), ordered by instant."""
+    doses = [
+        (at, schedule)
+        for schedule in schedules
+        for at in expand_schedule_doses(schedule, start, end, tz)
+    ]
+    doses.sort(key=_dose_order)
+    return doses
+
+
+def iter_upcoming_doses(schedules, start: datetime, tz):
+    """
+    Lazily merged (instant, schedule) pairs from `start` onwards across all
+    given schedules: each dispenser's rules are heap-merged into one
+    next-fire stream, and those streams are merged again, so taking the next
+    N doses costs O(N log k) regardless of how many dispensers there are.
+    """
+    by_dispenser = {}
+    for schedule in schedules:
+        by_dispenser.setdefault(schedule.container.dispenser_id, []).append(schedule)
+
+    def rule_stream(schedule):
+        return ((at, schedule) for at in iter_schedule_doses(schedule, start, tz))
+
+    streams = [
+        heapq.merge(*(rule_stream(schedule) for schedule in rules), key=_dose_order)
+        for rules in by_dispenser.values()
+    ]
+    return heapq.merge(*streams, key=_dose_order)
+
+
+def next_dose_by_dispenser(schedules, start: datetime, tz) -> dict[int, tuple[datetime, object]]:
+    """Each dispenser's next (instant, schedule) from `start`; dispensers with nothing due are left out."""
+    upcoming = {}
+    for schedule in schedules:
+        at = next(iter_schedule_doses(schedule, start, tz), None)
+        if at is None:
+            continue
+        dispenser_id = schedule.container.dispenser_id
+        if dispenser_id not in upcoming or _dose_order((at, schedule)) < _dose_order(upcoming[dispenser_id]):
+            upcoming[dispenser_id] = (at, schedule)
+    return upcoming
+
+
+def adherence_by_dispenser(doses, matched, now: datetime, window: timedelta) -> dict[int, dict]:
+    """
+    Per-dispenser tally of `doses` already due at `now`, given the event
+    matches from match_events. A dose without an event counts as missed once
+    the match window has passed, and as pending until then.
+    """
+    tallies = {}
+    for index, (at, schedule) in enumerate(doses):
+        tally = tallies.setdefault(
+            schedule.container.dispenser_id, {"due": 0, "completed": 0, "missed": 0, "pending": 0}
+        )
+        tally["due"] += 1
+        event = matched.get(index)
+        if event is not None:
+            tally["completed" if event.status == "completed" else "missed"] += 1
+        elif at + window < now:
+            tally["missed"] += 1
+        else:
+            tally["pending"] += 1
+    for tally in tallies.values():
+        settled = tally["completed"] + tally["missed"]
+        tally["rate"] = tally["completed"] / settled if settled else None
+    return tallies
+
+
+def match_events(doses, events, window: timedelta) -> dict[int, object]:
+    """
+    Pair doses with recorded ScheduleEvents of the same schedule whose
+    occurred_at lies within `window` of the dose. Returns {dose index: event}.
+    """
+    by_schedule = {}
+    for event in sorted(events, key=lambda e: e.occurred_at):
+        by_schedule.setdefault(event.schedule_id, []).append(event)
+    instants = {sid: [e.occurred_at for e in evs] for sid, evs in by_schedule.items()}
+
+    matched = {}
+    for index, (at, schedule) in enumerate(doses):
+        candidates = by_schedule.get(schedule.pk)
+        if not candidates:
+            continue
+        times = instants[schedule.pk]
+        pos = bisect_left(times, at)
+        nearest = min(
+            (candidates[i] for i in (pos - 1, pos) if 0 <= i < len(candidates)),
+            key=lambda e: abs(e.occurred_at - at),
+        )
+        if abs(nearest.occurred_at - at) <= window:
+            matched[index] = nearest
+    return matched
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dispensers.manifest import MANIFEST_FORMATS, ManifestError, detect_format, iter_manifest_rows
+from dispensers.services import import_dispensers
+
+
+class Command(BaseCommand):
+    help = "Pre-register unowned dispensers from a CSV or NDJSON manufacturing manifest."
+
+    def add_arguments(self, parser):
+        parser.add_argument("manifest", help="Path to the manifest file")
+        parser.add_argument("--format", choices=MANIFEST_FORMATS, help="Defaults to the file extension")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--max-errors", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options["manifest"]
+        try:
+            manifest_format = options["format"] or detect_format(path)
+            with open(path, encoding="utf-8-sig", newline="") as stream:
+                report = import_dispensers(
+                    iter_manifest_rows(stream, manifest_format),
+                    batch_size=options["batch_size"],
+                    max_errors=options["max_errors"],
+                )
+        except (ManifestError, OSError) as exc:
+            raise CommandError(str(exc))
+
+        for error in report["errors"]:
+            self.stderr.write(f"line {error['line']}: {error['serial_id'] or '-'}: {error['error']}")
+        if report["errors_truncated"]:
+            self.stderr.write("... further errors omitted")
+        self.stdout.write(
+            self.style.SUCCESS(f"Imported {report['created']} of {report['rows']} rows ({report['failed']} failed)")
+        )
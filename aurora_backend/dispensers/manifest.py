@@ -0,0 +1,89 @@
+"""
+Reading manufacturing manifests: one dispenser per row, as CSV with a
+header (serial_id[,name]) or as NDJSON ({"serial_id": ..., "name": ...}
+per line).
+
+Rows are yielded one at a time from the open text stream, so callers can
+process arbitrarily large manifests in fixed-size batches.
+"""
+
+import csv
+import json
+import re
+from collections import namedtuple
+from itertools import islice
+
+from .models import SERIAL_ID_PATTERN
+
+MANIFEST_FORMATS = ("csv", "ndjson")
+
+# line: 1-based line of the row in the manifest; error: parse/format problem or None.
+ManifestRow = namedtuple("ManifestRow", ["line", "serial_id", "name", "error"])
+
+
+class ManifestError(ValueError):
+    """The manifest as a whole cannot be read (unknown format, bad header)."""
+
+
+def detect_format(filename: str) -> str:
+    extension = filename.rsplit(".", 1)[-1].lower()
+    if extension == "csv":
+        return "csv"
+    if extension in ("ndjson", "jsonl"):
+        return "ndjson"
+    raise ManifestError(f"Cannot tell the manifest format of '{filename}'; use .csv or .ndjson")
+
+
+def _row(line, serial_id, name):
+    serial_id = (serial_id or "").strip()
+    name = (name or "").strip() or serial_id
+    error = None
+    if not re.match(SERIAL_ID_PATTERN, serial_id):
+        error = "Invalid serial ID format. Expected format: CODE-YYYYMMDD-XXXX"
+    elif len(name) > 100:
+        error = "Name must be at most 100 characters"
+    return ManifestRow(line, serial_id, name, error)
+
+
+def _iter_csv(stream):
+    reader = csv.DictReader(stream)
+    if not reader.fieldnames or "serial_id" not in reader.fieldnames:
+        raise ManifestError("CSV manifest needs a header row with a serial_id column")
+    for record in reader:
+        yield _row(reader.line_num, record.get("serial_id"), record.get("name"))
+
+
+def _iter_ndjson(stream):
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError:
+            yield ManifestRow(line, "", "", "Line is not valid JSON")
+            continue
+        if not isinstance(record, dict):
+            yield ManifestRow(line, "", "", "Line must be a JSON object")
+            continue
+        yield _row(line, str(record.get("serial_id") or ""), str(record.get("name") or ""))
+
+
+def iter_manifest_rows(stream, manifest_format: str):
+    """Yield a ManifestRow for every row of a text stream."""
+    if manifest_format == "csv":
+        return _iter_csv(stream)
+    if manifest_format == "ndjson":
+        return _iter_ndjson(stream)
+    raise ManifestError(f"Unsupported manifest format '{manifest_format}'")
+
+
+def iter_spec_rows(specs):
+    """Yield a ManifestRow for every {"serial_id", "name"?} dict; line is its 1-based position."""
+    for line, spec in enumerate(specs, start=1):
+        yield _row(line, str(spec.get("serial_id") or ""), str(spec.get("name") or ""))
+
+
+def batched(iterable, size: int):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
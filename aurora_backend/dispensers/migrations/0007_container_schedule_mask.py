@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:55
+
+from django.db import migrations, models
+
+
+def populate_schedule_mask(apps, schema_editor):
+    Container = apps.get_model("dispensers", "Container")
+    Schedule = apps.get_model("dispensers", "Schedule")
+    masks = {}
+    for container_id, day_of_week, hour, minute in Schedule.objects.values_list(
+        "container_id", "day_of_week", "hour", "minute"
+    ).iterator():
+        masks[container_id] = masks.get(container_id, 0) | 1 << ((day_of_week * 24 + hour) * 60 + minute)
+    for container_id, bits in masks.items():
+        Container.objects.filter(pk=container_id).update(
+            schedule_mask=bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispensers', '0006_dispenser_device_session_rev'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='container',
+            name='schedule_mask',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.RunPython(populate_schedule_mask, migrations.RunPython.noop),
+    ]
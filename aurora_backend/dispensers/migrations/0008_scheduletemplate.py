@@ -0,0 +1,46 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispensers', '0007_container_schedule_mask'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedule_templates', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['name'],
+                'unique_together': {('owner', 'name')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ScheduleTemplateRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot_number', models.PositiveIntegerField()),
+                ('day_of_week', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('minute', models.PositiveSmallIntegerField(default=0)),
+                ('repeat', models.BooleanField(default=True)),
+                ('template', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rules', to='dispensers.scheduletemplate')),
+            ],
+            options={
+                'ordering': ['slot_number', 'day_of_week', 'hour', 'minute'],
+                'constraints': [models.UniqueConstraint(fields=('template', 'slot_number', 'day_of_week', 'hour', 'minute'), name='uniq_template_rule_per_slot_time')],
+            },
+        ),
+    ]
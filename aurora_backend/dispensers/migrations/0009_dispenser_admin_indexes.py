@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispensers', '0008_scheduletemplate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dispenser',
+            index=models.Index(fields=['dispenser_model', 'id'], name='dispenser_model_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dispenser',
+            index=models.Index(fields=['last_seen_at'], name='dispenser_last_seen_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dispenser',
+            index=models.Index(condition=models.Q(('dirty', True)), fields=['id'], name='dispenser_dirty_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dispenser',
+            index=models.Index(condition=models.Q(('device_secret', '')), fields=['id'], name='dispenser_unpaired_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:07
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def clear_dirty_since_for_synced(apps, schema_editor):
+    # AddField stamped every existing row; only dirty ones are waiting on a sync.
+    Dispenser = apps.get_model("dispensers", "Dispenser")
+    Dispenser.objects.filter(dirty=False).update(dirty_since=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispensers', '0009_dispenser_admin_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='dispenser',
+            name='dispenser_dirty_idx',
+        ),
+        migrations.AddField(
+            model_name='dispenser',
+            name='dirty_since',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+        migrations.AddField(
+            model_name='dispenser',
+            name='last_sync_lag_seconds',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(clear_dirty_since_for_synced, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='dispenser',
+            index=models.Index(condition=models.Q(('dirty', True)), fields=['dirty_since', 'id'], name='dispenser_pending_sync_idx'),
+        ),
+    ]
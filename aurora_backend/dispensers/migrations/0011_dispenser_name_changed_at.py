@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispensers', '0010_dispenser_dirty_since'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dispenser',
+            name='name_changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
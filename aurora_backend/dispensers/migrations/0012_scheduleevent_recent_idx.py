@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispensers', '0011_dispenser_name_changed_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scheduleevent',
+            index=models.Index(fields=['dispenser', '-occurred_at'], name='event_dispenser_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispensers', '0012_scheduleevent_recent_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SerialSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('next_sequence', models.PositiveIntegerField(default=1)),
+                ('dispenser_model', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='serial_sequences', to='dispensers.dispensermodel')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dispenser_model', 'day'), name='uniq_serial_sequence_per_day')],
+            },
+        ),
+    ]
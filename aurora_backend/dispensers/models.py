@@ -3,12 +3,24 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 
+from .weekmask import WeekMask
+
+
+# Serial ID format: CODE-YYYYMMDD-XXXX, where XXXX counts up per model and day (see SerialSequence).
+SERIAL_ID_PATTERN = r'^[A-Z0-9]+-\d{8}-\d{4}$'
+
 
 class DispenserModel(models.Model):
+    # Highest sequence that fits the four XXXX digits of a serial ID.
+    MAX_SEQUENCE = 9999
+
     code = models.CharField(max_length=10, unique=True)  # e.g., S, M, L, XL1
     name = models.CharField(max_length=100)
     slot_count = models.PositiveIntegerField(default=4)
     serial_prefix = models.CharField(max_length=10, unique=True)
+    # First sequence of every new day's SerialSequence. Frozen since counters
+    # became per day, so numbers issued under the old model-wide counter are
+    # never reissued.
     next_sequence = models.PositiveIntegerField(default=1)
 
     class Meta:
@@ -17,6 +29,28 @@ class DispenserModel(models.Model):
     def __str__(self):
         return f"{self.code} ({self.name})"
 
+    def format_serial_id(self, sequence: int, day) -> str:
+        return f"{self.code}-{day:%Y%m%d}-{sequence:04d}"
+
+
+class SerialSequence(models.Model):
+    """
+    Next free XXXX sequence of one dispenser model's serials dated `day`.
+    Each model can mint MAX_SEQUENCE serials per day.
+    """
+
+    dispenser_model = models.ForeignKey(DispenserModel, on_delete=models.CASCADE, related_name="serial_sequences")
+    day = models.DateField()
+    next_sequence = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["dispenser_model", "day"], name="uniq_serial_sequence_per_day"),
+        ]
+
+    def __str__(self):
+        return f"{self.dispenser_model_id} {self.day}: {self.next_sequence}"
+
 
 class Dispenser(models.Model):
     DISPENSER_SIZES = {
@@ -27,6 +61,8 @@ class Dispenser(models.Model):
 
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name="dispensers")
     name = models.CharField(max_length=100)
+    # Set on rename; with schedule_version it versions everything the owner views show.
+    name_changed_at = models.DateTimeField(null=True, blank=True)
     serial_id = models.CharField(max_length=30, unique=True)
     size = models.CharField(max_length=10)  # code; keep free-form for new models
     dispenser_model = models.ForeignKey(DispenserModel, on_delete=models.SET_NULL, null=True, blank=True, related_name="dispensers")
@@ -36,30 +72,60 @@ class Dispenser(models.Model):
     schedule_version = models.BigIntegerField(default=1)
     device_session_rev = models.PositiveIntegerField(default=1)
     dirty = models.BooleanField(default=True)
+    # When the oldest change the device hasn't fetched yet was made; None while in sync.
+    dirty_since = models.DateTimeField(null=True, blank=True, default=timezone.now)
+    # Seconds from dirty_since to the config fetch that last brought the device in sync.
+    last_sync_lag_seconds = models.FloatField(null=True, blank=True)
     last_seen_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         unique_together = ("owner", "name")
         ordering = ["name"]
+        indexes = [
+            # Admin fleet listing: filters combined with keyset pagination on id.
+            models.Index(fields=["dispenser_model", "id"], name="dispenser_model_id_idx"),
+            models.Index(fields=["last_seen_at"], name="dispenser_last_seen_idx"),
+            # Pending-sync queue, oldest first; only dirty rows are indexed.
+            models.Index(
+                fields=["dirty_since", "id"], condition=models.Q(dirty=True), name="dispenser_pending_sync_idx"
+            ),
+            models.Index(fields=["id"], condition=models.Q(device_secret=""), name="dispenser_unpaired_idx"),
+        ]
 
     def __str__(self):
-        return f"{self.name} (owned by {self.owner.email if self.owner else 'unassigned'})"
+        # Only use the owner if it is already loaded; printing shouldn't run a query.
+        if Dispenser.owner.is_cached(self):
+            owner = self.owner.email if self.owner else "unassigned"
+        else:
+            owner = f"user {self.owner_id}" if self.owner_id else "unassigned"
+        return f"{self.name} (owned by {owner})"
 
     @property
     def max_containers(self):
-        if self.dispenser_model:
-            return self.dispenser_model.slot_count
+        if self.dispenser_model_id:
+            # Avoid a lazy FK query: the catalog already has every model.
+            from .catalog import dispenser_model_catalog
+
+            dispenser_model = (
+                self.dispenser_model
+                if Dispenser.dispenser_model.is_cached(self)
+                else dispenser_model_catalog.by_id(self.dispenser_model_id)
+            )
+            if dispenser_model:
+                return dispenser_model.slot_count
         # Fallback to legacy size mapping
         return self.DISPENSER_SIZES.get(self.size, ('', 4))[1]
 
+    def build_containers(self):
+        """Unsaved empty containers for every slot of this dispenser"""
+        return [
+            Container(dispenser=self, slot_number=slot, pill_name=f"Empty Slot {slot}")
+            for slot in range(1, self.max_containers + 1)
+        ]
+
     def initialize_containers(self):
         """Create empty containers for this dispenser based on its size"""
-        for slot in range(1, self.max_containers + 1):
-            Container.objects.create(
-                dispenser=self,
-                slot_number=slot,
-                pill_name=f"Empty Slot {slot}"
-            )
+        return Container.objects.bulk_create(self.build_containers())
 
 
 class Container(models.Model):
@@ -71,6 +137,9 @@ class Container(models.Model):
     dispenser = models.ForeignKey(Dispenser, on_delete=models.CASCADE, related_name="containers")
     slot_number = models.PositiveIntegerField()
     pill_name = models.CharField(max_length=100)
+    # Minute-of-week bitmap of this slot's schedules (see weekmask.py),
+    # kept in step with the Schedule rows by dispensers.services.
+    schedule_mask = models.BinaryField(default=b"", editable=False)
 
     class Meta:
         unique_together = ("dispenser", "slot_number")
@@ -79,6 +148,10 @@ class Container(models.Model):
     def __str__(self):
         return f"Slot {self.slot_number}: {self.pill_name}"
 
+    @property
+    def week_mask(self) -> WeekMask:
+        return WeekMask.from_bytes(self.schedule_mask)
+
 
 class Schedule(models.Model):
     """
@@ -119,6 +192,45 @@ class Schedule(models.Model):
         return f"{self.get_day_of_week_display()} {self.hour:02d}:{self.minute:02d} (repeat={self.repeat})"
 
 
+class ScheduleTemplate(models.Model):
+    """
+    A named regimen of per-slot weekly rules that can be written onto many
+    dispensers at once (see services.apply_schedule_template).
+    """
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="schedule_templates")
+    name = models.CharField(max_length=100)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ("owner", "name")
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+
+class ScheduleTemplateRule(models.Model):
+    template = models.ForeignKey(ScheduleTemplate, on_delete=models.CASCADE, related_name="rules")
+    slot_number = models.PositiveIntegerField()
+    day_of_week = models.PositiveSmallIntegerField(choices=Schedule.DAY_OF_WEEK_CHOICES)
+    hour = models.PositiveSmallIntegerField()  # 0-23
+    minute = models.PositiveSmallIntegerField(default=0)  # 0-59
+    repeat = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ["slot_number", "day_of_week", "hour", "minute"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["template", "slot_number", "day_of_week", "hour", "minute"],
+                name="uniq_template_rule_per_slot_time",
+            )
+        ]
+
+    def __str__(self):
+        return f"Slot {self.slot_number} {self.get_day_of_week_display()} {self.hour:02d}:{self.minute:02d}"
+
+
 class ScheduleEvent(models.Model):
     STATUS_COMPLETED = "completed"
     STATUS_MISSED = "missed"
@@ -136,7 +248,15 @@ class ScheduleEvent(models.Model):
 
     class Meta:
         ordering = ["-occurred_at", "-id"]
+        indexes = [
+            # Latest event per dispenser (home screen).
+            models.Index(fields=["dispenser", "-occurred_at"], name="event_dispenser_recent_idx"),
+        ]
 
     def __str__(self):
-        return f"{self.dispenser.serial_id} {self.status} at {self.occurred_at}"
+        if ScheduleEvent.dispenser.is_cached(self):
+            dispenser = self.dispenser.serial_id
+        else:
+            dispenser = f"dispenser {self.dispenser_id}"
+        return f"{dispenser} {self.status} at {self.occurred_at}"
 
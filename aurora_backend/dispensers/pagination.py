@@ -0,0 +1,20 @@
+from rest_framework.pagination import CursorPagination
+
+
+class DispenserListPagination(CursorPagination):
+    """
+    Opt-in keyset pagination for a user's dispensers, in the list's usual
+    name order. Responses stay a plain list unless the client sends
+    page_size or follows a cursor.
+    """
+
+    ordering = ("name", "id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.page_size_query_param not in params and self.cursor_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
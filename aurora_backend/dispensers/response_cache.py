@@ -0,0 +1,66 @@
+"""
+Cached owner dispenser responses, validated by data versions.
+
+Everything GetDispenserView and ShowAllDispensers return changes only
+through dispensers.services, and every such write moves a version column:
+schedule and pill-name edits bump schedule_version, renames stamp
+name_changed_at, and creating or deleting a dispenser changes the id set.
+A request therefore runs one narrow query (selectors.list_dispenser_versions)
+and hashes the result, with the user and the request URL, into a digest
+that is both the ETag and the cache key:
+
+- If-None-Match with the current ETag -> 304, nothing rendered;
+- a cached body under the digest -> returned as is;
+- otherwise the view renders normally and the body is cached.
+
+Stale entries are never served, since a write changes the digest; they
+just age out after DISPENSER_RESPONSE_CACHE_SECONDS.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+CACHE_KEY_PREFIX = "dispensers:response:"
+
+
+def response_digest(request, versions) -> str:
+    parts = (
+        request.user.pk,
+        request.user.email,
+        request.build_absolute_uri(),
+        getattr(request, "accepted_media_type", ""),
+        versions,
+    )
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def _etag_matches(request, etag: str) -> bool:
+    header = request.headers.get("If-None-Match", "")
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates or "*" in candidates
+
+
+def cached_response(request, versions, render) -> Response:
+    """
+    The response for `versions` (see selectors.list_dispenser_versions),
+    from the client's cache (304), ours, or render() on a miss.
+    """
+    digest = response_digest(request, versions)
+    etag = f'"{digest}"'
+    if _etag_matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    data = cache.get(CACHE_KEY_PREFIX + digest)
+    if data is not None:
+        response = Response(data)
+    else:
+        response = render()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        cache.set(CACHE_KEY_PREFIX + digest, response.data, settings.DISPENSER_RESPONSE_CACHE_SECONDS)
+    response["ETag"] = etag
+    return response
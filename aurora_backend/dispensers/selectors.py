@@ -1,12 +1,37 @@
-from .models import Dispenser, Container, Schedule
+from django.db.models import OuterRef, Subquery
 
+from .models import Dispenser, Container, Schedule, ScheduleEvent, ScheduleTemplate
 
-def list_dispensers_for_user(user):
-    return Dispenser.objects.filter(owner=user).prefetch_related("containers__schedules")
+
+def list_dispensers_for_user(user, *, with_owner=True, with_containers=True, with_schedules=True):
+    """
+    The user's dispensers. The with_* flags drop the owner join and the
+    container/schedule prefetch queries when the caller won't read them.
+    """
+    queryset = Dispenser.objects.filter(owner=user)
+    if with_owner:
+        queryset = queryset.select_related("owner")
+    if with_containers and with_schedules:
+        queryset = queryset.prefetch_related("containers__schedules")
+    elif with_containers:
+        queryset = queryset.prefetch_related("containers")
+    return queryset
+
+
+def list_dispenser_versions(user, pk: int | None = None) -> list[tuple]:
+    """
+    (id, schedule_version, name_changed_at) for the user's dispensers: one
+    narrow query that changes whenever a service write changes what the
+    owner dispenser views return.
+    """
+    queryset = Dispenser.objects.filter(owner=user)
+    if pk is not None:
+        queryset = queryset.filter(pk=pk)
+    return list(queryset.order_by("pk").values_list("pk", "schedule_version", "name_changed_at"))
 
 
 def get_dispenser_for_user(user, pk: int):
-    return Dispenser.objects.filter(owner=user).prefetch_related("containers__schedules").get(pk=pk)
+    return list_dispensers_for_user(user).get(pk=pk)
 
 
 def get_container_for_user(user, pk: int):
@@ -23,3 +48,59 @@ def get_schedule_for_user(user, pk: int):
         .get(pk=pk, container__dispenser__owner=user)
     )
 
+
+def list_container_masks_for_user(user, dispenser_pk: int):
+    """
+    Containers of one owned dispenser with just the fields needed for
+    mask-based summaries; raises Dispenser.DoesNotExist if not owned.
+    """
+    containers = list(
+        Container.objects.filter(dispenser_id=dispenser_pk, dispenser__owner=user)
+        .only("id", "slot_number", "pill_name", "schedule_mask")
+    )
+    if not containers and not Dispenser.objects.filter(pk=dispenser_pk, owner=user).exists():
+        raise Dispenser.DoesNotExist
+    return containers
+
+
+def list_schedules_for_user(user, dispenser_pk: int | None = None):
+    """
+    Every schedule of the user's dispensers (or of one owned dispenser) with
+    its container, in one query; raises Dispenser.DoesNotExist if dispenser_pk
+    is given but not owned.
+    """
+    schedules = Schedule.objects.filter(container__dispenser__owner=user).select_related("container")
+    if dispenser_pk is not None:
+        schedules = list(schedules.filter(container__dispenser_id=dispenser_pk))
+        if not schedules and not Dispenser.objects.filter(pk=dispenser_pk, owner=user).exists():
+            raise Dispenser.DoesNotExist
+    return list(schedules)
+
+
+def list_schedule_events(schedule_ids, start, end):
+    return list(
+        ScheduleEvent.objects.filter(schedule_id__in=schedule_ids, occurred_at__gte=start, occurred_at__lt=end)
+        .only("id", "schedule_id", "status", "occurred_at")
+    )
+
+
+def list_dispensers_with_last_event(user):
+    """
+    The user's dispensers by name, each annotated with its most recent
+    ScheduleEvent (last_event_status, last_event_at, last_event_slot) in the
+    same query.
+    """
+    latest = ScheduleEvent.objects.filter(dispenser=OuterRef("pk")).order_by("-occurred_at", "-id")
+    return list(
+        Dispenser.objects.filter(owner=user)
+        .annotate(
+            last_event_status=Subquery(latest.values("status")[:1]),
+            last_event_at=Subquery(latest.values("occurred_at")[:1]),
+            last_event_slot=Subquery(latest.values("container__slot_number")[:1]),
+        )
+        .order_by("name")
+    )
+
+
+def list_schedule_templates_for_user(user):
+    return ScheduleTemplate.objects.filter(owner=user).prefetch_related("rules")
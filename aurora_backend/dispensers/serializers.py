@@ -1,9 +1,21 @@
 import re
+import zoneinfo
+from datetime import timedelta
 
+from django.conf import settings
 from rest_framework import serializers
 from django.utils.translation import gettext_lazy as _
 
-from .models import Dispenser, Container, Schedule, DispenserModel
+from .catalog import dispenser_model_catalog
+from .models import (
+    SERIAL_ID_PATTERN,
+    Dispenser,
+    Container,
+    Schedule,
+    DispenserModel,
+    ScheduleTemplate,
+    ScheduleTemplateRule,
+)
 
 
 class ScheduleReadSerializer(serializers.ModelSerializer):
@@ -33,6 +45,76 @@ class ScheduleWriteSerializer(serializers.ModelSerializer):
         return value
 
 
+class ContainerConfigurationSerializer(serializers.Serializer):
+    slot_number = serializers.IntegerField(min_value=1)
+    pill_name = serializers.CharField(max_length=100, required=False)
+    schedules = ScheduleWriteSerializer(many=True)
+
+    def validate_pill_name(self, value):
+        if not value.strip():
+            raise serializers.ValidationError(_("Pill name cannot be empty"))
+        return value.strip()
+
+    def validate_schedules(self, value):
+        times = [(s["day_of_week"], s["hour"], s.get("minute", 0)) for s in value]
+        if len(times) != len(set(times)):
+            raise serializers.ValidationError(_("A slot cannot have two schedules at the same time"))
+        return value
+
+
+class DispenserConfigurationSerializer(serializers.Serializer):
+    containers = ContainerConfigurationSerializer(many=True)
+
+    def validate_containers(self, value):
+        slots = [c["slot_number"] for c in value]
+        if len(slots) != len(set(slots)):
+            raise serializers.ValidationError(_("Each slot may only appear once"))
+        return value
+
+
+class ScheduleTemplateRuleSerializer(ScheduleWriteSerializer):
+    class Meta:
+        model = ScheduleTemplateRule
+        fields = ["slot_number", "day_of_week", "hour", "minute", "repeat"]
+
+    def validate_slot_number(self, value):
+        if value < 1:
+            raise serializers.ValidationError(_("Slot number must be positive"))
+        return value
+
+
+class ScheduleTemplateSerializer(serializers.ModelSerializer):
+    rules = ScheduleTemplateRuleSerializer(many=True)
+
+    class Meta:
+        model = ScheduleTemplate
+        fields = ["id", "name", "created_at", "rules"]
+        read_only_fields = ["id", "created_at"]
+
+    def validate_name(self, value):
+        value = value.strip()
+        if not value:
+            raise serializers.ValidationError(_("Template name cannot be empty"))
+        request = self.context.get("request")
+        if request and ScheduleTemplate.objects.filter(owner=request.user, name=value).exists():
+            raise serializers.ValidationError(_("You already have a template with this name"))
+        return value
+
+    def validate_rules(self, value):
+        times = [(r["slot_number"], r["day_of_week"], r["hour"], r.get("minute", 0)) for r in value]
+        if len(times) != len(set(times)):
+            raise serializers.ValidationError(_("A slot cannot have two rules at the same time"))
+        return value
+
+
+class ApplyScheduleTemplateSerializer(serializers.Serializer):
+    dispenser_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=getattr(settings, "SCHEDULE_TEMPLATE_MAX_DISPENSERS", 500),
+    )
+
+
 class ContainerSerializer(serializers.ModelSerializer):
     schedules = ScheduleReadSerializer(many=True, read_only=True)
 
@@ -40,6 +122,14 @@ class ContainerSerializer(serializers.ModelSerializer):
         model = Container
         fields = ['id', 'dispenser', 'slot_number', 'pill_name', 'schedules']
 
+    def get_fields(self):
+        fields = super().get_fields()
+        # Sparse fieldset from DispenserListQuerySerializer; absent means everything.
+        expand = self.context.get("expand")
+        if expand is not None and "containers.schedules" not in expand:
+            fields.pop("schedules")
+        return fields
+
     def validate_slot_number(self, value):
         if value < 1:
             raise serializers.ValidationError(_("Slot number must be positive"))
@@ -81,6 +171,17 @@ class DispenserReadSerializer(serializers.ModelSerializer):
         model = Dispenser
         fields = ['id', 'name', 'serial_id', 'owner', 'containers']
 
+    def get_fields(self):
+        fields = super().get_fields()
+        # Sparse fieldset from DispenserListQuerySerializer; absent means everything.
+        only = self.context.get("fields")
+        if only is not None:
+            expand = self.context.get("expand", ())
+            for name in list(fields):
+                if name not in only and not (name == "containers" and "containers" in expand):
+                    fields.pop(name)
+        return fields
+
     def validate_name(self, value):
         if len(value.strip()) < 3:
             raise serializers.ValidationError(_("Dispenser name must be at least 3 characters long"))
@@ -114,15 +215,13 @@ class RegisterDispenserSerializer(serializers.Serializer):
     name = serializers.CharField(max_length=100)
 
     def validate_serial_id(self, value):
-        # Serial ID format: CODE-YYYYMMDD-XXXX
-        pattern = r'^[A-Z0-9]+-\d{8}-\d{4}$'
-        if not re.match(pattern, value):
+        if not re.match(SERIAL_ID_PATTERN, value):
             raise serializers.ValidationError(
                 _("Invalid serial ID format. Expected format: CODE-YYYYMMDD-XXXX (e.g., S-20250524-0001)")
             )
 
         code = value.split("-")[0]
-        if not DispenserModel.objects.filter(code=code).exists():
+        if dispenser_model_catalog.by_code(code) is None:
             raise serializers.ValidationError(_("Unknown dispenser model code."))
 
         if Dispenser.objects.filter(serial_id=value).exists():
@@ -213,3 +312,89 @@ class DeviceEventSerializer(serializers.Serializer):
     occurred_at = serializers.DateTimeField()
     container_slot = serializers.IntegerField(required=False)
     schedule_id = serializers.IntegerField(required=False)
+
+
+class DeviceCredentialSerializer(serializers.Serializer):
+    serial_id = serializers.CharField(max_length=30)
+    device_secret = serializers.CharField(max_length=64)
+
+
+class DeviceSessionBatchSerializer(serializers.Serializer):
+    devices = serializers.ListField(
+        child=DeviceCredentialSerializer(),
+        allow_empty=False,
+        max_length=getattr(settings, "DEVICE_GATEWAY_MAX_BATCH", 200),
+    )
+
+
+class TimeZoneField(serializers.CharField):
+    def to_internal_value(self, data):
+        try:
+            return zoneinfo.ZoneInfo(super().to_internal_value(data))
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            raise serializers.ValidationError(_("Unknown time zone"))
+
+
+class DoseCalendarQuerySerializer(serializers.Serializer):
+    MAX_DAYS = 93
+
+    start = serializers.DateField()
+    end = serializers.DateField(help_text="Inclusive")
+    tz = TimeZoneField(required=False)
+    events = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, data):
+        if data["end"] < data["start"]:
+            raise serializers.ValidationError(_("end must not be before start"))
+        if data["end"] - data["start"] >= timedelta(days=self.MAX_DAYS):
+            raise serializers.ValidationError(_("A calendar can span at most %(days)d days") % {"days": self.MAX_DAYS})
+        return data
+
+
+class UpcomingDosesQuerySerializer(serializers.Serializer):
+    limit = serializers.IntegerField(required=False, default=20, min_value=1, max_value=200)
+    tz = TimeZoneField(required=False)
+
+
+class HomeScreenQuerySerializer(serializers.Serializer):
+    tz = TimeZoneField(required=False)
+
+
+class CommaSeparatedChoiceField(serializers.CharField):
+    """"a,b,c" -> ("a", "b", "c"), each checked against choices."""
+
+    def __init__(self, *, choices, **kwargs):
+        self.choices = tuple(choices)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        values = tuple(dict.fromkeys(v.strip() for v in super().to_internal_value(data).split(",") if v.strip()))
+        unknown = [v for v in values if v not in self.choices]
+        if unknown:
+            raise serializers.ValidationError(
+                _("Unknown value(s) %(unknown)s; choose from %(choices)s")
+                % {"unknown": ", ".join(unknown), "choices": ", ".join(self.choices)}
+            )
+        return values
+
+
+class DispenserListQuerySerializer(serializers.Serializer):
+    """
+    Sparse fieldsets for dispenser reads. fields picks top-level fields;
+    expand picks nested relations ("containers.schedules" implies
+    "containers"). With neither, the full legacy shape is returned.
+    """
+
+    FIELDS = ("id", "name", "serial_id", "owner")
+    EXPANSIONS = ("containers", "containers.schedules")
+
+    fields = CommaSeparatedChoiceField(choices=FIELDS, required=False)
+    expand = CommaSeparatedChoiceField(choices=EXPANSIONS, required=False, allow_blank=True)
+
+    def validate(self, data):
+        if "fields" not in data and "expand" not in data:
+            return {"fields": self.FIELDS, "expand": self.EXPANSIONS}
+        expand = set(data.get("expand") or ())
+        if "containers.schedules" in expand:
+            expand.add("containers")
+        return {"fields": data.get("fields") or self.FIELDS, "expand": tuple(sorted(expand))}
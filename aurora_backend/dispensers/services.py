@@ -1,19 +1,131 @@
-from django.db import transaction
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
-from .models import Dispenser, Container, Schedule, DispenserModel
+from .models import (
+    Dispenser,
+    Container,
+    Schedule,
+    DispenserModel,
+    SerialSequence,
+    ScheduleTemplate,
+    ScheduleTemplateRule,
+)
+from .catalog import dispenser_model_catalog
+from .manifest import batched, iter_spec_rows
+from .weekmask import WeekMask
 
 
-def _mark_dispenser_dirty(dispenser: Dispenser):
+class ScheduleVersionConflict(Exception):
+    """
+    The dispenser's schedule_version no longer matches the version the client
+    edited against (If-Match / expected_version).
+    """
+
+    def __init__(self, current_version=None):
+        super().__init__("Dispenser configuration was changed by someone else")
+        self.current_version = current_version
+
+
+class SerialRangeExhausted(Exception):
+    """The dispenser model has fewer than the requested sequence numbers left for the day."""
+
+    def __init__(self, remaining: int):
+        super().__init__(f"Only {remaining} serial number(s) left for this model on this day")
+        self.remaining = remaining
+
+
+def _can_update_returning() -> bool:
+    """
+    Whether the backend supports UPDATE ... RETURNING. Django only has a
+    feature flag for INSERT ... RETURNING, which MariaDB sets without
+    supporting the UPDATE form.
+    """
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor == "sqlite":
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
+
+
+def _bump_schedule_versions(dispensers, *, expected_version: int | None = None) -> dict[int, int]:
+    """
+    Mark every dispenser in the queryset dirty and increment schedule_version
+    as a single UPDATE evaluated by the database, so concurrent edits never
+    lose an increment. Returns {dispenser_id: new_schedule_version}.
+
+    With expected_version, only rows still at that version are bumped; the
+    update doubles as a compare-and-swap for optimistic concurrency.
+
+    dirty_since keeps the time of the oldest change the device hasn't
+    fetched yet, so it is only set on rows that were in sync.
+    """
+    qn = connection.ops.quote_name
+    now = timezone.now()
+    if _can_update_returning():
+        subquery, params = dispensers.order_by().values("pk").query.sql_with_params()
+        sql = (
+            f"UPDATE {qn(Dispenser._meta.db_table)} "
+            f"SET {qn('schedule_version')} = {qn('schedule_version')} + 1, {qn('dirty')} = %s, "
+            f"{qn('dirty_since')} = COALESCE({qn('dirty_since')}, %s) "
+            f"WHERE {qn('id')} IN ({subquery})"
+        )
+        params = (True, now, *params)
+        if expected_version is not None:
+            sql += f" AND {qn('schedule_version')} = %s"
+            params = (*params, expected_version)
+        sql += f" RETURNING {qn('id')}, {qn('schedule_version')}"
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return dict(cursor.fetchall())
+
+    # Backends without UPDATE ... RETURNING: lock the rows, then update and read back.
+    targets = Dispenser.objects.filter(pk__in=dispensers.values("pk"))
+    if expected_version is not None:
+        targets = targets.filter(schedule_version=expected_version)
+    pks = list(targets.select_for_update().values_list("pk", flat=True))
+    Dispenser.objects.filter(pk__in=pks).update(
+        schedule_version=F("schedule_version") + 1,
+        dirty=True,
+        dirty_since=Coalesce("dirty_since", Value(now)),
+    )
+    return dict(Dispenser.objects.filter(pk__in=pks).values_list("pk", "schedule_version"))
+
+
+def _mark_dispenser_dirty(dispenser: Dispenser, *, expected_version: int | None = None):
+    versions = _bump_schedule_versions(Dispenser.objects.filter(pk=dispenser.pk), expected_version=expected_version)
+    if dispenser.pk not in versions:
+        raise ScheduleVersionConflict(
+            Dispenser.objects.filter(pk=dispenser.pk).values_list("schedule_version", flat=True).first()
+        )
     dispenser.dirty = True
-    dispenser.schedule_version += 1
-    dispenser.save(update_fields=["dirty", "schedule_version"])
+    dispenser.dirty_since = dispenser.dirty_since or timezone.now()
+    dispenser.schedule_version = versions[dispenser.pk]
+
+
+def _refresh_schedule_masks(container_ids) -> None:
+    """
+    Recompute Container.schedule_mask from the Schedule rows of the given
+    containers: one SELECT and one UPDATE regardless of how many containers.
+    Call after the version bump so the dispenser row lock is already held.
+    """
+    masks = {pk: WeekMask() for pk in container_ids}
+    for container_id, day_of_week, hour, minute in Schedule.objects.filter(
+        container_id__in=masks
+    ).values_list("container_id", "day_of_week", "hour", "minute"):
+        masks[container_id].add(day_of_week, hour, minute)
+    Container.objects.bulk_update(
+        [Container(pk=pk, schedule_mask=mask.to_bytes()) for pk, mask in masks.items()],
+        ["schedule_mask"],
+    )
 
 
 @transaction.atomic
 def create_dispenser_for_user(*, owner, name: str, serial_id: str) -> Dispenser:
     prefix = serial_id.split("-")[0]
-    dispenser_model = DispenserModel.objects.filter(code=prefix).first()
+    dispenser_model = dispenser_model_catalog.by_code(prefix)
     size = prefix
     dispenser = Dispenser.objects.create(
         owner=owner,
@@ -22,12 +134,191 @@ def create_dispenser_for_user(*, owner, name: str, serial_id: str) -> Dispenser:
         size=size,
         dispenser_model=dispenser_model,
     )
+    # New dispensers start dirty (the field default), so no second save is needed.
     dispenser.initialize_containers()
-    dispenser.dirty = True
-    dispenser.save(update_fields=["dirty"])
     return dispenser
 
 
+def provision_dispensers(
+    *, dispensers: list[dict], owner=None, batch_size: int = 500, max_errors: int = 1000
+) -> dict:
+    """
+    Create many dispensers with their empty containers from
+    [{"serial_id", "name"?}, ...], e.g. a factory run (owner=None) or a
+    facility onboarding. The specs get the same checks and chunked inserts
+    as a manifest import; returns import_dispensers' report.
+    """
+    return import_dispensers(
+        iter_spec_rows(dispensers), owner=owner, batch_size=batch_size, max_errors=max_errors
+    )
+
+
+@transaction.atomic
+def _insert_dispensers(dispensers: list[Dispenser]) -> list[Dispenser]:
+    """Insert unsaved dispensers and all of their empty containers: two INSERTs."""
+    dispensers = Dispenser.objects.bulk_create(dispensers)
+    if not connection.features.can_return_rows_from_bulk_insert:
+        pks = dict(
+            Dispenser.objects.filter(serial_id__in=[d.serial_id for d in dispensers]).values_list("serial_id", "pk")
+        )
+        for dispenser in dispensers:
+            dispenser.pk = pks[dispenser.serial_id]
+    Container.objects.bulk_create(
+        [container for dispenser in dispensers for container in dispenser.build_containers()]
+    )
+    return dispensers
+
+
+def import_dispensers(rows, *, owner=None, batch_size: int = 500, max_errors: int = 1000) -> dict:
+    """
+    Pre-register dispensers from ManifestRows (see manifest.py), unowned
+    unless an owner is given.
+
+    Rows are consumed batch by batch, so memory stays bounded by batch_size
+    however long the manifest is. Each batch is checked with one lookup of
+    already-registered serials and inserted by _insert_dispensers in its own
+    transaction; rows that fail validation are skipped and reported, the
+    rest of the batch still goes in. At most max_errors errors are listed.
+    """
+    models_by_code = dispenser_model_catalog.codes()
+    report = {"rows": 0, "created": 0, "failed": 0, "errors": [], "errors_truncated": False}
+
+    def reject(row, message):
+        report["failed"] += 1
+        if len(report["errors"]) < max_errors:
+            report["errors"].append({"line": row.line, "serial_id": row.serial_id, "error": message})
+        else:
+            report["errors_truncated"] = True
+
+    for batch in batched(rows, batch_size):
+        report["rows"] += len(batch)
+        serials = [row.serial_id for row in batch if not row.error]
+        registered = set(Dispenser.objects.filter(serial_id__in=serials).values_list("serial_id", flat=True))
+
+        pending, accepted = {}, []
+        for row in batch:
+            code = row.serial_id.split("-")[0]
+            if row.error:
+                reject(row, row.error)
+            elif code not in models_by_code:
+                reject(row, "Unknown dispenser model code.")
+            elif row.serial_id in registered:
+                reject(row, "This dispenser is already registered")
+            elif row.serial_id in pending:
+                reject(row, f"Duplicate of line {pending[row.serial_id].line}")
+            else:
+                pending[row.serial_id] = row
+                accepted.append(
+                    Dispenser(
+                        owner=owner,
+                        name=row.name,
+                        serial_id=row.serial_id,
+                        size=code,
+                        dispenser_model=models_by_code[code],
+                    )
+                )
+        if not accepted:
+            continue
+        try:
+            _insert_dispensers(accepted)
+        except IntegrityError:
+            # Someone registered one of these serials since the lookup above.
+            for row in pending.values():
+                reject(row, "Batch conflicted with a concurrent registration; import these rows again")
+            continue
+        report["created"] += len(accepted)
+    return report
+
+
+def _reserve_sequence_block(dispenser_model: DispenserModel, day, count: int) -> int:
+    """
+    Advance the (model, day) counter by `count` in one atomic UPDATE and
+    return the first reserved number. Concurrent callers get disjoint blocks
+    without waiting on a row lock held across a round trip.
+    """
+    limit = DispenserModel.MAX_SEQUENCE + 1
+    # A new day starts at the model's frozen legacy counter (see DispenserModel.next_sequence).
+    SerialSequence.objects.bulk_create(
+        [SerialSequence(dispenser_model=dispenser_model, day=day, next_sequence=dispenser_model.next_sequence)],
+        ignore_conflicts=True,
+    )
+    if _can_update_returning():
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {qn(SerialSequence._meta.db_table)} "
+                f"SET {qn('next_sequence')} = {qn('next_sequence')} + %s "
+                f"WHERE {qn('dispenser_model_id')} = %s AND {qn('day')} = %s AND {qn('next_sequence')} + %s <= %s "
+                f"RETURNING {qn('next_sequence')}",
+                (count, dispenser_model.pk, day, count, limit),
+            )
+            row = cursor.fetchone()
+    else:
+        counter = SerialSequence.objects.filter(dispenser_model=dispenser_model, day=day)
+        with transaction.atomic():
+            row = counter.select_for_update().filter(next_sequence__lte=limit - count).values_list(
+                "next_sequence", flat=True
+            ).first()
+            if row is not None:
+                counter.update(next_sequence=F("next_sequence") + count)
+                row = (row + count,)
+    if row is None:
+        next_sequence = (
+            SerialSequence.objects.filter(dispenser_model=dispenser_model, day=day)
+            .values_list("next_sequence", flat=True)
+            .get()
+        )
+        raise SerialRangeExhausted(max(0, limit - next_sequence))
+    return row[0] - count
+
+
+def reserve_serial_ids(*, code: str, count: int, day=None) -> list[str]:
+    """
+    Reserve `count` consecutive sequence numbers of a dispenser model for
+    `day` (today by default) and format them as CODE-YYYYMMDD-XXXX serial
+    IDs. Sequences restart every day, so at most MAX_SEQUENCE serials can be
+    reserved per model and day. Raises DispenserModel.DoesNotExist or
+    SerialRangeExhausted.
+    """
+    dispenser_model = dispenser_model_catalog.by_code(code)
+    if dispenser_model is None:
+        raise DispenserModel.DoesNotExist
+    day = day or timezone.localdate()
+    first = _reserve_sequence_block(dispenser_model, day, count)
+    return [dispenser_model.format_serial_id(sequence, day) for sequence in range(first, first + count)]
+
+
+def reset_pairing_in_chunks(
+    dispensers, *, chunk_size: int = 1000, progress=None, start_after_pk: int = 0, limit: int | None = None
+) -> int:
+    """
+    Clear device_secret and bump device_session_rev (revoking session tokens)
+    for every dispenser in the queryset, so each device has to pair again.
+
+    Walks the queryset in primary-key order and resets chunk_size rows per
+    UPDATE, each in its own short transaction, so row locks are held briefly
+    and device requests for other dispensers are never stuck behind a
+    fleet-wide lock. progress(reset_so_far, last_pk) is called after each
+    chunk. Starts after start_after_pk and stops after `limit` dispensers,
+    so an interrupted or bounded sweep can resume from the last reported
+    pk. Returns the number of dispensers reset.
+    """
+    total, last_pk = 0, start_after_pk
+    while limit is None or total < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - total)
+        pks = list(dispensers.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:size])
+        if not pks:
+            break
+        with transaction.atomic():
+            total += Dispenser.objects.filter(pk__in=pks).update(
+                device_secret="", device_session_rev=F("device_session_rev") + 1
+            )
+        last_pk = pks[-1]
+        if progress:
+            progress(total, last_pk)
+    return total
+
+
 @transaction.atomic
 def delete_dispenser_for_user(*, owner, name: str) -> None:
     dispenser = get_object_or_404(Dispenser, owner=owner, name=name)
@@ -35,12 +326,15 @@ def delete_dispenser_for_user(*, owner, name: str) -> None:
 
 
 @transaction.atomic
-def update_pill_name_for_container(*, owner, dispenser_name: str, slot_number: int, pill_name: str) -> Container:
+def update_pill_name_for_container(
+    *, owner, dispenser_name: str, slot_number: int, pill_name: str, expected_version: int | None = None
+) -> Container:
     dispenser = get_object_or_404(Dispenser, owner=owner, name=dispenser_name)
     container = get_object_or_404(Container, dispenser=dispenser, slot_number=slot_number)
+    _mark_dispenser_dirty(dispenser, expected_version=expected_version)
+    container.dispenser = dispenser
     container.pill_name = pill_name
     container.save()
-    _mark_dispenser_dirty(dispenser)
     return container
 
 
@@ -48,6 +342,7 @@ def update_pill_name_for_container(*, owner, dispenser_name: str, slot_number: i
 def update_dispenser_name(*, owner, current_name: str, new_name: str) -> Dispenser:
     dispenser = get_object_or_404(Dispenser, owner=owner, name=current_name)
     dispenser.name = new_name
+    dispenser.name_changed_at = timezone.now()
     dispenser.save()
     return dispenser
 
@@ -58,22 +353,35 @@ def _assert_container_owner(container: Container, owner):
 
 
 @transaction.atomic
-def create_schedule_for_container(*, container: Container, owner, day_of_week: int, hour: int, minute: int = 0, repeat: bool = True) -> Schedule:
-    _assert_container_owner(container, owner)
+def create_schedule_for_container(*, container_id: int, owner, day_of_week: int, hour: int, minute: int = 0, repeat: bool = True, expected_version: int | None = None) -> Schedule:
+    """
+    Four statements on the happy path: the version bump, filtered on ownership,
+    doubles as the access check, then the INSERT and the container's mask
+    refresh (a SELECT and an UPDATE). Duplicates surface as IntegrityError
+    from uniq_schedule_per_container_time and roll the bump back.
+    """
+    owned = Dispenser.objects.filter(owner=owner, containers__pk=container_id)
+    if not _bump_schedule_versions(owned, expected_version=expected_version):
+        current_version = owned.values_list("schedule_version", flat=True).first()
+        if current_version is None:
+            raise Container.DoesNotExist
+        raise ScheduleVersionConflict(current_version)
+
     schedule = Schedule.objects.create(
-        container=container,
+        container_id=container_id,
         day_of_week=day_of_week,
         hour=hour,
         minute=minute,
         repeat=repeat,
     )
-    _mark_dispenser_dirty(container.dispenser)
+    _refresh_schedule_masks([container_id])
     return schedule
 
 
 @transaction.atomic
-def update_schedule(*, schedule: Schedule, owner, day_of_week: int | None = None, hour: int | None = None, minute: int | None = None, repeat: bool | None = None) -> Schedule:
+def update_schedule(*, schedule: Schedule, owner, day_of_week: int | None = None, hour: int | None = None, minute: int | None = None, repeat: bool | None = None, expected_version: int | None = None) -> Schedule:
     _assert_container_owner(schedule.container, owner)
+    _mark_dispenser_dirty(schedule.container.dispenser, expected_version=expected_version)
     if day_of_week is not None:
         schedule.day_of_week = day_of_week
     if hour is not None:
@@ -83,14 +391,182 @@ def update_schedule(*, schedule: Schedule, owner, day_of_week: int | None = None
     if repeat is not None:
         schedule.repeat = repeat
     schedule.save()
-    _mark_dispenser_dirty(schedule.container.dispenser)
+    _refresh_schedule_masks([schedule.container_id])
     return schedule
 
 
 @transaction.atomic
-def delete_schedule(*, schedule: Schedule, owner) -> None:
+def delete_schedule(*, schedule: Schedule, owner, expected_version: int | None = None) -> None:
     _assert_container_owner(schedule.container, owner)
-    dispenser = schedule.container.dispenser
+    _mark_dispenser_dirty(schedule.container.dispenser, expected_version=expected_version)
+    container_id = schedule.container_id
     schedule.delete()
-    _mark_dispenser_dirty(dispenser)
+    _refresh_schedule_masks([container_id])
+
+
+@transaction.atomic
+def apply_dispenser_configuration(
+    *, owner, dispenser_id: int, containers: list[dict], expected_version: int | None = None
+) -> dict:
+    """
+    Bring the listed slots in line with a desired state of
+    {"slot_number", "pill_name"?, "schedules": [{day_of_week, hour, minute, repeat}]}.
+
+    The diff against the current rows is computed in memory and applied with
+    bulk writes; slots not listed are left untouched. schedule_version is
+    bumped once, and only if something actually changed. The dispenser row
+    is locked first so concurrent PUTs diff against each other's results.
+    """
+    dispenser = get_object_or_404(Dispenser.objects.select_for_update(), pk=dispenser_id, owner=owner)
+    if expected_version is not None and dispenser.schedule_version != expected_version:
+        raise ScheduleVersionConflict(dispenser.schedule_version)
+    current = {
+        container.slot_number: container
+        for container in Container.objects.filter(dispenser=dispenser).prefetch_related("schedules")
+    }
+    unknown = sorted({c["slot_number"] for c in containers} - current.keys())
+    if unknown:
+        raise Container.DoesNotExist(f"Unknown slot number(s): {', '.join(map(str, unknown))}")
+
+    renamed, remasked, to_create, to_update, to_delete = [], [], [], [], []
+    for desired in containers:
+        container = current[desired["slot_number"]]
+        pill_name = desired.get("pill_name")
+        if pill_name is not None and pill_name != container.pill_name:
+            container.pill_name = pill_name
+            renamed.append(container)
+
+        existing = {(s.day_of_week, s.hour, s.minute): s for s in container.schedules.all()}
+        wanted = {
+            (s["day_of_week"], s["hour"], s.get("minute", 0)): s.get("repeat", True)
+            for s in desired["schedules"]
+        }
+        for key, schedule in existing.items():
+            if key not in wanted:
+                to_delete.append(schedule.pk)
+            elif schedule.repeat != wanted[key]:
+                schedule.repeat = wanted[key]
+                to_update.append(schedule)
+        for (day_of_week, hour, minute), repeat in wanted.items():
+            if (day_of_week, hour, minute) not in existing:
+                to_create.append(
+                    Schedule(container=container, day_of_week=day_of_week, hour=hour, minute=minute, repeat=repeat)
+                )
+        if existing.keys() != wanted.keys():
+            container.schedule_mask = WeekMask.from_times(wanted).to_bytes()
+            remasked.append(container)
+
+    # Bump (the compare-and-swap on expected_version) before writing any rows,
+    # so a stale PUT fails before doing work.
+    changed = bool(renamed or to_create or to_update or to_delete)
+    if changed:
+        _mark_dispenser_dirty(dispenser, expected_version=expected_version)
+
+    if renamed or remasked:
+        Container.objects.bulk_update(
+            {c.pk: c for c in renamed + remasked}.values(), ["pill_name", "schedule_mask"]
+        )
+    if to_delete:
+        Schedule.objects.filter(pk__in=to_delete).delete()
+    if to_update:
+        Schedule.objects.bulk_update(to_update, ["repeat"])
+    if to_create:
+        Schedule.objects.bulk_create(to_create)
+
+    return {
+        "changed": changed,
+        "schedule_version": dispenser.schedule_version,
+        "containers_updated": len(renamed),
+        "schedules_created": len(to_create),
+        "schedules_updated": len(to_update),
+        "schedules_deleted": len(to_delete),
+    }
+
+
+@transaction.atomic
+def create_schedule_template(*, owner, name: str, rules: list[dict]) -> ScheduleTemplate:
+    template = ScheduleTemplate.objects.create(owner=owner, name=name)
+    ScheduleTemplateRule.objects.bulk_create(
+        [ScheduleTemplateRule(template=template, **rule) for rule in rules]
+    )
+    return template
+
+
+@transaction.atomic
+def apply_schedule_template(*, owner, template_id: int, dispenser_ids: list[int]) -> list[dict]:
+    """
+    Add the template's rules to each listed dispenser the owner has.
+
+    Rules are additive: a slot that already drops at a rule's time keeps its
+    row, and rules for slots a dispenser doesn't have are skipped. All new
+    rows go in with one bulk_create, and every dispenser that gained a
+    schedule is bumped by the same UPDATE, so the query count does not grow
+    with the number of dispensers. The target dispensers are locked (in id
+    order) before the existing rows are read, so a concurrent edit can't
+    insert one of the same rows in between. Returns one report entry per
+    requested id.
+    """
+    template = get_object_or_404(ScheduleTemplate.objects.prefetch_related("rules"), pk=template_id, owner=owner)
+    rules = list(template.rules.all())
+    owned = dict(
+        Dispenser.objects.select_for_update()
+        .filter(owner=owner, pk__in=dispenser_ids)
+        .order_by("pk")
+        .values_list("pk", "schedule_version")
+    )
+
+    containers = {
+        (container.dispenser_id, container.slot_number): container.pk
+        for container in Container.objects.filter(
+            dispenser_id__in=owned, slot_number__in={rule.slot_number for rule in rules}
+        ).only("id", "dispenser_id", "slot_number")
+    }
+    existing = set(
+        Schedule.objects.filter(container_id__in=containers.values()).values_list(
+            "container_id", "day_of_week", "hour", "minute"
+        )
+    )
+
+    created, missing_slots, to_create = {}, {}, []
+    for dispenser_id in owned:
+        created[dispenser_id] = 0
+        for rule in rules:
+            container_id = containers.get((dispenser_id, rule.slot_number))
+            if container_id is None:
+                missing_slots.setdefault(dispenser_id, set()).add(rule.slot_number)
+                continue
+            if (container_id, rule.day_of_week, rule.hour, rule.minute) in existing:
+                continue
+            to_create.append(
+                Schedule(
+                    container_id=container_id,
+                    day_of_week=rule.day_of_week,
+                    hour=rule.hour,
+                    minute=rule.minute,
+                    repeat=rule.repeat,
+                )
+            )
+            created[dispenser_id] += 1
+
+    if to_create:
+        Schedule.objects.bulk_create(to_create)
+        owned |= _bump_schedule_versions(
+            Dispenser.objects.filter(pk__in=[pk for pk, count in created.items() if count])
+        )
+        _refresh_schedule_masks({schedule.container_id for schedule in to_create})
 
+    report = []
+    for dispenser_id in dict.fromkeys(dispenser_ids):
+        if dispenser_id not in owned:
+            report.append({"dispenser_id": dispenser_id, "status": "not_found"})
+            continue
+        report.append(
+            {
+                "dispenser_id": dispenser_id,
+                "status": "applied" if created[dispenser_id] else "unchanged",
+                "schedules_created": created[dispenser_id],
+                "schedule_version": owned[dispenser_id],
+                "missing_slots": sorted(missing_slots.get(dispenser_id, ())),
+            }
+        )
+    return report
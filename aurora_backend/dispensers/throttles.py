@@ -0,0 +1,49 @@
+from aurora_backend.throttling import TokenBucketRateThrottle
+
+from .models import Dispenser
+
+
+class DeviceRateThrottle(TokenBucketRateThrottle):
+    """
+    Throttles authenticated device requests per dispenser rather than per
+    client IP, so fleets behind one NAT don't share a budget and a runaway
+    unit is isolated. Unauthenticated calls (pairing, session exchange,
+    failed auth) are keyed by client IP and the serial in the URL, so
+    nobody can drain a device's own bucket just by knowing its serial.
+    """
+
+    def get_cache_key(self, request, view):
+        if isinstance(request.auth, Dispenser):
+            ident = f"device:{request.auth.serial_id}"
+        else:
+            ident = f"anon:{self.get_ident(request)}:{view.kwargs.get('serial_id', '')}"
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+
+class DeviceConfigThrottle(DeviceRateThrottle):
+    scope = "device_config"
+
+
+class DeviceEventThrottle(DeviceRateThrottle):
+    scope = "device_events"
+
+
+class DeviceSessionThrottle(DeviceRateThrottle):
+    scope = "device_session"
+
+
+class DevicePairThrottle(DeviceRateThrottle):
+    scope = "device_pair"
+
+
+class DeviceGatewayThrottle(TokenBucketRateThrottle):
+    """
+    Keyed on the gateway name set by DeviceGatewayAuthentication.
+    """
+
+    scope = "device_gateway"
+
+    def get_cache_key(self, request, view):
+        if not request.auth:
+            return None
+        return self.cache_format % {"scope": self.scope, "ident": request.auth}
@@ -6,6 +6,13 @@ from .views import (
     ShowAllDispensers,
     GetDispenserView,
     ResetDispenserPairingView,
+    DispenserConfigurationView,
+    DispenserScheduleSummaryView,
+    DoseCalendarView,
+    UpcomingDosesView,
+    HomeScreenView,
+    ScheduleTemplateListCreateView,
+    ApplyScheduleTemplateView,
     UpdatePillNameView,
     UpdateDispenserNameView,
     ContainerScheduleListView,
@@ -14,7 +21,13 @@ from .views import (
     ScheduleUpdateView,
     ScheduleDeleteView,
 )
-from .device_views import DeviceConfigView, DeviceEventView, DeviceSessionView, DevicePairView
+from .device_views import (
+    DeviceConfigView,
+    DeviceEventView,
+    DeviceSessionView,
+    DeviceSessionBatchView,
+    DevicePairView,
+)
 
 urlpatterns = [
     path('register-dispenser/', RegisterDispenserView.as_view(), name='register-dispenser'),
@@ -22,6 +35,14 @@ urlpatterns = [
     path('list-all-user-dispensers/', ShowAllDispensers.as_view(), name='list-all-user-dispensers'),
     path('dispenser/<int:pk>/', GetDispenserView.as_view(), name='get-dispenser'),
     path('dispenser/<int:pk>/reset-pairing/', ResetDispenserPairingView.as_view(), name='reset-dispenser-pairing'),
+    path('dispenser/<int:pk>/configuration/', DispenserConfigurationView.as_view(), name='dispenser-configuration'),
+    path('dispenser/<int:pk>/schedule-summary/', DispenserScheduleSummaryView.as_view(), name='dispenser-schedule-summary'),
+    path('dispenser/<int:pk>/calendar/', DoseCalendarView.as_view(), name='dispenser-calendar'),
+    path('calendar/', DoseCalendarView.as_view(), name='dose-calendar'),
+    path('upcoming-doses/', UpcomingDosesView.as_view(), name='upcoming-doses'),
+    path('home/', HomeScreenView.as_view(), name='home-screen'),
+    path('schedule-templates/', ScheduleTemplateListCreateView.as_view(), name='schedule-templates'),
+    path('schedule-templates/<int:pk>/apply/', ApplyScheduleTemplateView.as_view(), name='schedule-template-apply'),
     path('update-pill-name/', UpdatePillNameView.as_view(), name='update-pill-name'),
     path('update-dispenser-name/', UpdateDispenserNameView.as_view(), name='update-dispenser-name'),
     path('containers/<int:container_id>/schedules/list/', ContainerScheduleListView.as_view(), name='container-schedules-list'),
@@ -29,6 +50,7 @@ urlpatterns = [
     path('schedules/<int:pk>/retrieve/', ScheduleRetrieveView.as_view(), name='schedule-retrieve'),
     path('schedules/<int:pk>/update/', ScheduleUpdateView.as_view(), name='schedule-update'),
     path('schedules/<int:pk>/delete/', ScheduleDeleteView.as_view(), name='schedule-delete'),
+    path('devices/sessions/', DeviceSessionBatchView.as_view(), name='device-sessions-batch'),
     path('devices/<str:serial_id>/config/', DeviceConfigView.as_view(), name='device-config'),
     path('devices/<str:serial_id>/events/', DeviceEventView.as_view(), name='device-events'),
     path('devices/<str:serial_id>/session/', DeviceSessionView.as_view(), name='device-session'),
@@ -1,10 +1,19 @@
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+from django.conf import settings
 from django.db import transaction, IntegrityError
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from rest_framework import generics, status, permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
 
+from aurora_backend.query_budget import query_budget
+from authentication.serializers import UserSerializer
+
 from .models import Dispenser, Container, Schedule
 from .serializers import (
     DispenserSerializer,
@@ -14,6 +23,13 @@ from .serializers import (
     UpdateDispenserNameSerializer,
     ScheduleReadSerializer,
     ScheduleWriteSerializer,
+    DispenserConfigurationSerializer,
+    DispenserListQuerySerializer,
+    DoseCalendarQuerySerializer,
+    UpcomingDosesQuerySerializer,
+    HomeScreenQuerySerializer,
+    ScheduleTemplateSerializer,
+    ApplyScheduleTemplateSerializer,
 )
 from .services import (
     create_dispenser_for_user,
@@ -23,15 +39,80 @@ from .services import (
     create_schedule_for_container,
     update_schedule,
     delete_schedule,
+    apply_dispenser_configuration,
+    create_schedule_template,
+    apply_schedule_template,
+    ScheduleVersionConflict,
 )
 from .selectors import (
     list_dispensers_for_user,
+    list_dispenser_versions,
+    list_dispensers_with_last_event,
     get_dispenser_for_user,
     get_container_for_user,
     get_schedule_for_user,
+    list_container_masks_for_user,
+    list_schedules_for_user,
+    list_schedule_events,
+    list_schedule_templates_for_user,
 )
+from .pagination import DispenserListPagination
+from .response_cache import cached_response
+from .doses import (
+    adherence_by_dispenser,
+    expand_doses,
+    iter_upcoming_doses,
+    match_events,
+    next_dose_by_dispenser,
+)
+from .weekmask import WeekMask, split_minute_of_week
 
 
+def _expected_version(request):
+    """
+    The schedule_version a write was based on, taken from the If-Match header
+    or an expected_version field in the body. None means "don't check".
+    """
+    body = request.data if isinstance(request.data, dict) else {}
+    value = request.headers.get("If-Match") or body.get("expected_version")
+    if value in (None, "", "*"):
+        return None
+    value = str(value).strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise ValidationError({"detail": "If-Match / expected_version must be a schedule_version."})
+
+
+def _version_conflict_response(exc: ScheduleVersionConflict):
+    response = Response(
+        {"detail": str(exc), "schedule_version": exc.current_version},
+        status=status.HTTP_412_PRECONDITION_FAILED,
+    )
+    if exc.current_version is not None:
+        response["ETag"] = f'"{exc.current_version}"'
+    return response
+
+
+def _concurrent_write_response():
+    # Another request inserted one of the same schedule rows first (SQLite
+    # can't lock the dispenser row); the client should re-read and retry.
+    return Response(
+        {"detail": "The schedules were changed by another request; reload and try again."},
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
+def _with_version(response, version):
+    response["ETag"] = f'"{version}"'
+    return response
+
+
+# Auth, two uniqueness checks, the dispenser and container INSERTs, the
+# read-back (dispenser, containers, schedules) and two savepoint pairs.
+@query_budget(12)
 class RegisterDispenserView(generics.CreateAPIView):
     serializer_class = RegisterDispenserSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -47,10 +128,11 @@ class RegisterDispenserView(generics.CreateAPIView):
             serial_id=serializer.validated_data['serial_id'],
         )
 
-        response_serializer = DispenserSerializer(dispenser)
+        response_serializer = DispenserSerializer(get_dispenser_for_user(request.user, dispenser.pk))
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
 
+@query_budget(12)
 class DeleteDispenserView(generics.DestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
     lookup_field = 'name'
@@ -73,23 +155,72 @@ class DeleteDispenserView(generics.DestroyAPIView):
             )
 
 
-class ShowAllDispensers(generics.ListAPIView):
-    permission_classes = [permissions.IsAuthenticated]
-    serializer_class = DispenserSerializer
+class DispenserFieldsetMixin:
+    """
+    ?fields= / ?expand= sparse fieldsets (see DispenserListQuerySerializer).
+    The fieldset decides both what is serialized and which joins and
+    prefetch queries list_dispensers_for_user runs.
+    """
+
+    def get_fieldset(self):
+        if not hasattr(self, "_fieldset"):
+            query = DispenserListQuerySerializer(data=self.request.query_params.dict())
+            query.is_valid(raise_exception=True)
+            self._fieldset = query.validated_data
+        return self._fieldset
 
     def get_queryset(self):
-        return list_dispensers_for_user(self.request.user)
+        fieldset = self.get_fieldset()
+        return list_dispensers_for_user(
+            self.request.user,
+            with_owner="owner" in fieldset["fields"],
+            with_containers="containers" in fieldset["expand"],
+            with_schedules="containers.schedules" in fieldset["expand"],
+        )
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), **self.get_fieldset()}
+
+
+@query_budget(5)
+class ShowAllDispensers(DispenserFieldsetMixin, generics.ListAPIView):
+    """
+    The user's dispensers by name. ?fields=id,name skips the container and
+    schedule queries; ?page_size= (or a cursor) opts into pagination.
+    Responses carry an ETag and are cached (see response_cache).
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = DispenserSerializer
+    pagination_class = DispenserListPagination
+
+    def list(self, request, *args, **kwargs):
+        self.get_fieldset()
+        return cached_response(
+            request,
+            list_dispenser_versions(request.user),
+            lambda: super(ShowAllDispensers, self).list(request, *args, **kwargs),
+        )
 
 
-class GetDispenserView(generics.RetrieveAPIView):
+@query_budget(5)
+class GetDispenserView(DispenserFieldsetMixin, generics.RetrieveAPIView):
     serializer_class = DispenserSerializer
     permission_classes = [permissions.IsAuthenticated]
-    queryset = Dispenser.objects.all()
 
-    def get_queryset(self):
-        return list_dispensers_for_user(self.request.user)
+    def retrieve(self, request, *args, **kwargs):
+        self.get_fieldset()
+        versions = list_dispenser_versions(request.user, pk=kwargs["pk"])
+        if not versions:
+            raise Http404
+        return cached_response(
+            request,
+            versions,
+            lambda: super(GetDispenserView, self).retrieve(request, *args, **kwargs),
+        )
 
 
+@query_budget(5)
 class ResetDispenserPairingView(APIView):
     """
     Clears device_secret so the physical dispenser can pair again.
@@ -110,6 +241,275 @@ class ResetDispenserPairingView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+@query_budget(15)
+class DispenserConfigurationView(APIView):
+    """
+    Declarative PUT of pill names and weekly schedules for a dispenser's slots.
+    Replaces dozens of per-schedule calls with one request and one version bump.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def put(self, request, pk: int):
+        serializer = DispenserConfigurationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            result = apply_dispenser_configuration(
+                owner=request.user,
+                dispenser_id=pk,
+                containers=serializer.validated_data["containers"],
+                expected_version=_expected_version(request),
+            )
+        except Container.DoesNotExist as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except ScheduleVersionConflict as exc:
+            return _version_conflict_response(exc)
+        except IntegrityError:
+            return _concurrent_write_response()
+
+        result["dispenser"] = DispenserSerializer(get_dispenser_for_user(request.user, pk)).data
+        return _with_version(Response(result), result["schedule_version"])
+
+
+@query_budget(2)
+class DispenserScheduleSummaryView(APIView):
+    """
+    Weekly dose counts and cross-slot overlaps computed from the per-container
+    minute-of-week bitmaps, without touching Schedule rows. Pass day_of_week,
+    hour and minute to also list the slots dropping at that time.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk: int):
+        try:
+            containers = list_container_masks_for_user(request.user, pk)
+        except Dispenser.DoesNotExist:
+            return Response({"detail": "Dispenser not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        masks = {container.slot_number: container.week_mask for container in containers}
+        overlap = WeekMask.overlap(masks.values())
+        data = {
+            "doses_per_week": sum(len(mask) for mask in masks.values()),
+            "containers": [
+                {
+                    "slot_number": container.slot_number,
+                    "pill_name": container.pill_name,
+                    "doses_per_week": len(masks[container.slot_number]),
+                }
+                for container in containers
+            ],
+            "overlaps": [
+                {
+                    "day_of_week": day_of_week,
+                    "hour": hour,
+                    "minute": minute,
+                    "slots": [slot for slot, mask in masks.items() if mask.has(day_of_week, hour, minute)],
+                }
+                for day_of_week, hour, minute in map(split_minute_of_week, overlap.minutes())
+            ],
+        }
+
+        at = [request.query_params.get(key) for key in ("day_of_week", "hour", "minute")]
+        if at[0] is not None and at[1] is not None:
+            serializer = ScheduleWriteSerializer(
+                data={"day_of_week": at[0], "hour": at[1], "minute": at[2] or 0}
+            )
+            serializer.is_valid(raise_exception=True)
+            when = serializer.validated_data
+            data["dropping_slots"] = [
+                slot for slot, mask in masks.items() if mask.has(when["day_of_week"], when["hour"], when["minute"])
+            ]
+
+        return Response(data)
+
+
+def _dose_item(at, schedule) -> dict:
+    return {
+        "at": at.isoformat(),
+        "dispenser_id": schedule.container.dispenser_id,
+        "slot_number": schedule.container.slot_number,
+        "pill_name": schedule.container.pill_name,
+        "schedule_id": schedule.pk,
+    }
+
+
+@query_budget(3)
+class DoseCalendarView(APIView):
+    """
+    Weekly schedules expanded into concrete dose instants for a date range,
+    for one dispenser (pk) or all of the user's dispensers. With events=true
+    each dose carries the status of the matching recorded ScheduleEvent.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk: int | None = None):
+        query = DoseCalendarQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        tz = params.get("tz") or timezone.get_current_timezone()
+        start = datetime.combine(params["start"], time.min, tzinfo=tz)
+        end = datetime.combine(params["end"] + timedelta(days=1), time.min, tzinfo=tz)
+
+        try:
+            schedules = list_schedules_for_user(request.user, pk)
+        except Dispenser.DoesNotExist:
+            return Response({"detail": "Dispenser not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        doses = expand_doses(schedules, start, end, tz)
+        matched = {}
+        if params["events"] and doses:
+            window = timedelta(minutes=getattr(settings, "DOSE_EVENT_MATCH_WINDOW_MINUTES", 120))
+            events = list_schedule_events({s.pk for s in schedules}, start - window, end + window)
+            matched = match_events(doses, events, window)
+
+        items = []
+        for index, (at, schedule) in enumerate(doses):
+            item = _dose_item(at, schedule)
+            if params["events"]:
+                event = matched.get(index)
+                item["status"] = event.status if event else None
+            items.append(item)
+
+        return Response(
+            {
+                "start": start.isoformat(),
+                "end": end.isoformat(),
+                "timezone": str(tz),
+                "doses": items,
+            }
+        )
+
+
+@query_budget(2)
+class UpcomingDosesView(APIView):
+    """
+    The next `limit` doses across all of the user's dispensers, in
+    chronological order. Uses one schedule query however many dispensers
+    the user has.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        query = UpcomingDosesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        tz = params.get("tz") or timezone.get_current_timezone()
+
+        schedules = list_schedules_for_user(request.user)
+        doses = islice(iter_upcoming_doses(schedules, timezone.now(), tz), params["limit"])
+        return Response({"timezone": str(tz), "doses": [_dose_item(at, schedule) for at, schedule in doses]})
+
+
+@query_budget(4)
+class HomeScreenView(APIView):
+    """
+    Everything the app's home screen shows in one response: the user's
+    profile and, for each dispenser, its next dose, last recorded event and
+    today's adherence. Runs a fixed number of queries (user, dispensers with
+    their last event, schedules, today's events) however many dispensers
+    the user has.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        query = HomeScreenQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        tz = query.validated_data.get("tz") or timezone.get_current_timezone()
+        now = timezone.now()
+        day_start = datetime.combine(now.astimezone(tz).date(), time.min, tzinfo=tz)
+        window = timedelta(minutes=getattr(settings, "DOSE_EVENT_MATCH_WINDOW_MINUTES", 120))
+
+        dispensers = list_dispensers_with_last_event(request.user)
+        schedules = list_schedules_for_user(request.user)
+        next_doses = next_dose_by_dispenser(schedules, now, tz)
+        due_today = expand_doses(schedules, day_start, now, tz)
+        matched = {}
+        if due_today:
+            events = list_schedule_events({s.pk for s in schedules}, day_start - window, now + window)
+            matched = match_events(due_today, events, window)
+        adherence = adherence_by_dispenser(due_today, matched, now, window)
+
+        items = []
+        for dispenser in dispensers:
+            next_dose = next_doses.get(dispenser.pk)
+            items.append(
+                {
+                    "id": dispenser.pk,
+                    "name": dispenser.name,
+                    "serial_id": dispenser.serial_id,
+                    "schedule_version": dispenser.schedule_version,
+                    "last_seen_at": dispenser.last_seen_at.isoformat() if dispenser.last_seen_at else None,
+                    "next_dose": _dose_item(*next_dose) if next_dose else None,
+                    "last_event": (
+                        {
+                            "status": dispenser.last_event_status,
+                            "occurred_at": dispenser.last_event_at.isoformat(),
+                            "slot_number": dispenser.last_event_slot,
+                        }
+                        if dispenser.last_event_at
+                        else None
+                    ),
+                    "adherence_today": adherence.get(
+                        dispenser.pk, {"due": 0, "completed": 0, "missed": 0, "pending": 0, "rate": None}
+                    ),
+                }
+            )
+
+        return Response(
+            {
+                "user": UserSerializer(request.user).data,
+                "timezone": str(tz),
+                "generated_at": now.isoformat(),
+                "dispensers": items,
+            }
+        )
+
+
+@query_budget(get=3, post=7)
+class ScheduleTemplateListCreateView(generics.ListCreateAPIView):
+    serializer_class = ScheduleTemplateSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return list_schedule_templates_for_user(self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.instance = create_schedule_template(
+            owner=self.request.user,
+            name=serializer.validated_data["name"],
+            rules=serializer.validated_data["rules"],
+        )
+
+
+@query_budget(12)
+class ApplyScheduleTemplateView(APIView):
+    """
+    Write a template's rules onto many dispensers in one request; responds
+    with a per-dispenser report.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk: int):
+        serializer = ApplyScheduleTemplateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            results = apply_schedule_template(
+                owner=request.user,
+                template_id=pk,
+                dispenser_ids=serializer.validated_data["dispenser_ids"],
+            )
+        except IntegrityError:
+            return _concurrent_write_response()
+        return Response({"results": results})
+
+
+@query_budget(10)
 class UpdatePillNameView(generics.UpdateAPIView):
     serializer_class = UpdatePillNameSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -125,7 +525,10 @@ class UpdatePillNameView(generics.UpdateAPIView):
                 dispenser_name=serializer.validated_data['dispenser_name'],
                 slot_number=serializer.validated_data['slot_number'],
                 pill_name=serializer.validated_data['pill_name'],
+                expected_version=_expected_version(request),
             )
+        except ScheduleVersionConflict as exc:
+            return _version_conflict_response(exc)
         except Dispenser.DoesNotExist:
             return Response(
                 {"detail": "Dispenser not found"},
@@ -138,9 +541,12 @@ class UpdatePillNameView(generics.UpdateAPIView):
             )
 
         response_serializer = ContainerSerializer(container)
-        return Response(response_serializer.data)
+        return _with_version(Response(response_serializer.data), container.dispenser.schedule_version)
 
 
+# Auth, the name check, lookup and UPDATE, the read-back (dispenser,
+# containers, schedules) and two savepoint pairs.
+@query_budget(11)
 class UpdateDispenserNameView(generics.UpdateAPIView):
     serializer_class = UpdateDispenserNameSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -162,10 +568,11 @@ class UpdateDispenserNameView(generics.UpdateAPIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        response_serializer = DispenserSerializer(dispenser)
+        response_serializer = DispenserSerializer(get_dispenser_for_user(request.user, dispenser.pk))
         return Response(response_serializer.data)
 
 
+@query_budget(3)
 class ContainerScheduleListView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ScheduleReadSerializer
@@ -178,43 +585,35 @@ class ContainerScheduleListView(generics.ListAPIView):
         return container.schedules.all()
 
 
+@query_budget(7)
 class ContainerScheduleCreateView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ScheduleWriteSerializer
 
-    def get_container(self):
-        return get_container_for_user(self.request.user, self.kwargs["container_id"])
-
-    @transaction.atomic
-    def perform_create(self, serializer):
-        container = self.get_container()
-        # Prevent duplicates before hitting the DB constraint
-        if container.schedules.filter(
-            day_of_week=serializer.validated_data["day_of_week"],
-            hour=serializer.validated_data["hour"],
-            minute=serializer.validated_data["minute"],
-        ).exists():
-            raise ValidationError({"detail": "A schedule already exists for that time."})
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
         try:
-            create_schedule_for_container(
-                container=container,
-                owner=self.request.user,
+            schedule = create_schedule_for_container(
+                container_id=self.kwargs["container_id"],
+                owner=request.user,
+                expected_version=_expected_version(request),
                 **serializer.validated_data,
             )
+        except Container.DoesNotExist:
+            return Response({"detail": "Container not found"}, status=status.HTTP_404_NOT_FOUND)
         except IntegrityError:
             raise ValidationError({"detail": "A schedule already exists for that time."})
+        except ScheduleVersionConflict as exc:
+            return _version_conflict_response(exc)
 
-    def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
-        # Return the last created schedule for this container
-        read = ScheduleReadSerializer(self.get_container().schedules.latest("id"))
+        read = ScheduleReadSerializer(schedule)
         headers = self.get_success_headers(read.data)
         return Response(read.data, status=status.HTTP_201_CREATED, headers=headers)
 
 
+@query_budget(2)
 class ScheduleRetrieveView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ScheduleReadSerializer
@@ -224,6 +623,7 @@ class ScheduleRetrieveView(generics.RetrieveAPIView):
         return get_schedule_for_user(self.request.user, self.kwargs["pk"])
 
 
+@query_budget(10)
 class ScheduleUpdateView(generics.UpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ScheduleWriteSerializer
@@ -242,14 +642,18 @@ class ScheduleUpdateView(generics.UpdateAPIView):
             update_schedule(
                 schedule=schedule,
                 owner=request.user,
+                expected_version=_expected_version(request),
                 **serializer.validated_data,
             )
         except IntegrityError:
             raise ValidationError({"detail": "A schedule already exists for that time."})
+        except ScheduleVersionConflict as exc:
+            return _version_conflict_response(exc)
         read_serializer = ScheduleReadSerializer(schedule)
-        return Response(read_serializer.data)
+        return _with_version(Response(read_serializer.data), schedule.container.dispenser.schedule_version)
 
 
+@query_budget(11)
 class ScheduleDeleteView(generics.DestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
     queryset = Schedule.objects.all()
@@ -260,5 +664,8 @@ class ScheduleDeleteView(generics.DestroyAPIView):
     @transaction.atomic
     def destroy(self, request, *args, **kwargs):
         schedule = self.get_object()
-        delete_schedule(schedule=schedule, owner=request.user)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        try:
+            delete_schedule(schedule=schedule, owner=request.user, expected_version=_expected_version(request))
+        except ScheduleVersionConflict as exc:
+            return _version_conflict_response(exc)
+        return _with_version(Response(status=status.HTTP_204_NO_CONTENT), schedule.container.dispenser.schedule_version)
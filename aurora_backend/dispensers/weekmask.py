@@ -0,0 +1,99 @@
+"""
+Weekly schedules as a 10080-bit minute-of-week bitmap.
+
+Bit n is set when something drops at minute n of the week, counting from
+Monday 00:00 (the same day numbering as Schedule.day_of_week). Masks are
+plain Python ints, so membership is a shift, set operations across
+containers are |, & and -, and counting is int.bit_count().
+"""
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def minute_of_week(day_of_week: int, hour: int, minute: int = 0) -> int:
+    return day_of_week * MINUTES_PER_DAY + hour * 60 + minute
+
+
+def split_minute_of_week(value: int) -> tuple[int, int, int]:
+    """Inverse of minute_of_week: returns (day_of_week, hour, minute)."""
+    day_of_week, rest = divmod(value, MINUTES_PER_DAY)
+    hour, minute = divmod(rest, 60)
+    return day_of_week, hour, minute
+
+
+class WeekMask:
+    __slots__ = ("bits",)
+
+    def __init__(self, bits: int = 0):
+        self.bits = bits
+
+    @classmethod
+    def from_bytes(cls, data) -> "WeekMask":
+        return cls(int.from_bytes(bytes(data or b""), "little"))
+
+    @classmethod
+    def from_times(cls, times) -> "WeekMask":
+        """Build a mask from (day_of_week, hour, minute) tuples."""
+        bits = 0
+        for day_of_week, hour, minute in times:
+            bits |= 1 << minute_of_week(day_of_week, hour, minute)
+        return cls(bits)
+
+    @classmethod
+    def union(cls, masks) -> "WeekMask":
+        bits = 0
+        for mask in masks:
+            bits |= mask.bits
+        return cls(bits)
+
+    @classmethod
+    def overlap(cls, masks) -> "WeekMask":
+        """Minutes set in at least two of the given masks."""
+        seen = overlap = 0
+        for mask in masks:
+            overlap |= seen & mask.bits
+            seen |= mask.bits
+        return cls(overlap)
+
+    def to_bytes(self) -> bytes:
+        # Trimmed little-endian: an empty week stores as b"".
+        return self.bits.to_bytes((self.bits.bit_length() + 7) // 8, "little")
+
+    def add(self, day_of_week: int, hour: int, minute: int = 0) -> None:
+        self.bits |= 1 << minute_of_week(day_of_week, hour, minute)
+
+    def discard(self, day_of_week: int, hour: int, minute: int = 0) -> None:
+        self.bits &= ~(1 << minute_of_week(day_of_week, hour, minute))
+
+    def has(self, day_of_week: int, hour: int, minute: int = 0) -> bool:
+        return bool(self.bits >> minute_of_week(day_of_week, hour, minute) & 1)
+
+    def minutes(self):
+        """Set minute-of-week offsets in ascending order."""
+        bits = self.bits
+        while bits:
+            lowest = bits & -bits
+            yield lowest.bit_length() - 1
+            bits ^= lowest
+
+    def __len__(self) -> int:
+        return self.bits.bit_count()
+
+    def __bool__(self) -> bool:
+        return bool(self.bits)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, WeekMask) and self.bits == other.bits
+
+    def __or__(self, other: "WeekMask") -> "WeekMask":
+        return WeekMask(self.bits | other.bits)
+
+    def __and__(self, other: "WeekMask") -> "WeekMask":
+        return WeekMask(self.bits & other.bits)
+
+    def __sub__(self, other: "WeekMask") -> "WeekMask":
+        return WeekMask(self.bits & ~other.bits)
+
+    def __repr__(self) -> str:
+        return f"WeekMask({len(self)} minutes)"
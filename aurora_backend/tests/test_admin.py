@@ -0,0 +1,487 @@
+import os
+import re
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from aurora_admin.selectors import FLEET_HEALTH_CACHE_KEY
+from authentication.models import User
+from dispensers.catalog import dispenser_model_catalog
+from dispensers.models import SERIAL_ID_PATTERN, Container, Dispenser, DispenserModel, SerialSequence
+from dispensers.manifest import ManifestRow
+from dispensers.device_tokens import issue_device_token, verified_token_cache
+from dispensers.services import (
+    SerialRangeExhausted,
+    create_dispenser_for_user,
+    create_schedule_for_container,
+    import_dispensers,
+    reserve_serial_ids,
+    reset_pairing_in_chunks,
+)
+
+
+class AdminSerialReservationTests(TestCase):
+    def setUp(self):
+        self.addCleanup(dispenser_model_catalog.clear)
+        self.client = APIClient()
+        self.admin = User.objects.create_user(
+            email="admin@example.com",
+            password="pass12345",
+            first_name="Admin",
+            last_name="User",
+            is_staff=True,
+        )
+        self.model = DispenserModel.objects.create(code="S", name="Small", slot_count=4, serial_prefix="S")
+
+    def test_reserves_consecutive_blocks(self):
+        first = reserve_serial_ids(code="S", count=3, day=date(2025, 5, 24))
+        second = reserve_serial_ids(code="S", count=2, day=date(2025, 5, 24))
+
+        self.assertEqual(first, ["S-20250524-0001", "S-20250524-0002", "S-20250524-0003"])
+        self.assertEqual(second, ["S-20250524-0004", "S-20250524-0005"])
+        counter = SerialSequence.objects.get(dispenser_model=self.model, day=date(2025, 5, 24))
+        self.assertEqual(counter.next_sequence, 6)
+        self.assertTrue(all(re.match(SERIAL_ID_PATTERN, serial_id) for serial_id in first + second))
+
+    def test_sequences_restart_every_day(self):
+        day, next_day = date(2025, 5, 24), date(2025, 5, 25)
+        full_day = reserve_serial_ids(code="S", count=DispenserModel.MAX_SEQUENCE, day=day)
+        with self.assertRaises(SerialRangeExhausted) as ctx:
+            reserve_serial_ids(code="S", count=1, day=day)
+
+        self.assertEqual(full_day[-1], "S-20250524-9999")
+        self.assertEqual(ctx.exception.remaining, 0)
+        self.assertEqual(reserve_serial_ids(code="S", count=2, day=next_day), ["S-20250525-0001", "S-20250525-0002"])
+
+    def test_new_days_start_after_the_legacy_model_counter(self):
+        DispenserModel.objects.filter(pk=self.model.pk).update(next_sequence=41)
+        dispenser_model_catalog.clear()
+
+        self.assertEqual(reserve_serial_ids(code="S", count=1, day=date(2025, 5, 24)), ["S-20250524-0041"])
+
+    def test_locked_fallback_reserves_consecutive_blocks(self):
+        with mock.patch("dispensers.services._can_update_returning", return_value=False):
+            first = reserve_serial_ids(code="S", count=2, day=date(2025, 5, 24))
+            second = reserve_serial_ids(code="S", count=1, day=date(2025, 5, 24))
+
+        self.assertEqual(first + second, ["S-20250524-0001", "S-20250524-0002", "S-20250524-0003"])
+
+    def test_refuses_block_past_last_sequence(self):
+        DispenserModel.objects.filter(pk=self.model.pk).update(next_sequence=9998)
+
+        with self.assertRaises(SerialRangeExhausted) as ctx:
+            reserve_serial_ids(code="S", count=3)
+
+        self.assertEqual(ctx.exception.remaining, 2)
+        self.assertEqual(len(reserve_serial_ids(code="S", count=2)), 2)
+
+    def test_endpoint_requires_admin_and_known_model(self):
+        url = reverse("admin-reserve-serial-ids", args=["S"])
+        user = User.objects.create_user(
+            email="user@example.com", password="pass12345", first_name="Plain", last_name="User"
+        )
+        self.client.force_authenticate(user=user)
+        self.assertEqual(self.client.post(url, {"count": 1}, format="json").status_code, 403)
+
+        self.client.force_authenticate(user=self.admin)
+        resp = self.client.post(url, {"count": 2, "date": "2025-05-24"}, format="json")
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.data["serial_ids"], ["S-20250524-0001", "S-20250524-0002"])
+
+        resp = self.client.post(reverse("admin-reserve-serial-ids", args=["XL"]), {"count": 1}, format="json")
+        self.assertEqual(resp.status_code, 404)
+
+
+class AdminDispenserImportTests(TestCase):
+    def setUp(self):
+        self.addCleanup(dispenser_model_catalog.clear)
+        self.client = APIClient()
+        self.admin = User.objects.create_user(
+            email="admin@example.com",
+            password="pass12345",
+            first_name="Admin",
+            last_name="User",
+            is_staff=True,
+        )
+        DispenserModel.objects.create(code="S", name="Small", slot_count=4, serial_prefix="S")
+        Dispenser.objects.create(name="Existing", serial_id="S-20250101-0001", size="S")
+
+    def test_csv_upload_reports_rejected_rows(self):
+        manifest = SimpleUploadedFile(
+            "units.csv",
+            b"serial_id,name\n"
+            b"S-20250101-0001,Taken\n"
+            b"S-20250101-0002,\n"
+            b"S-20250101-0003,Ward A\n"
+            b"S-20250101-0003,Again\n"
+            b"XL-20250101-0001,Unknown\n"
+            b"not-a-serial,Bad\n",
+        )
+        self.client.force_authenticate(user=self.admin)
+
+        resp = self.client.post(reverse("admin-dispenser-import"), {"manifest": manifest}, format="multipart")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual((resp.data["rows"], resp.data["created"], resp.data["failed"]), (6, 2, 4))
+        self.assertEqual([error["line"] for error in resp.data["errors"]], [2, 5, 6, 7])
+        self.assertEqual(resp.data["errors"][1]["error"], "Duplicate of line 4")
+        self.assertEqual(Dispenser.objects.get(serial_id="S-20250101-0002").name, "S-20250101-0002")
+        self.assertEqual(Container.objects.filter(dispenser__serial_id="S-20250101-0003").count(), 4)
+
+    def test_management_command_imports_ndjson_in_batches(self):
+        lines = [f'{{"serial_id": "S-20250101-{n:04d}"}}' for n in range(2, 9)] + ["{oops"]
+        with tempfile.NamedTemporaryFile("w", suffix=".ndjson", delete=False) as manifest:
+            manifest.write("\n".join(lines))
+        self.addCleanup(os.unlink, manifest.name)
+        out, err = StringIO(), StringIO()
+
+        # One catalog query, then per batch of 3: lookup, SAVEPOINT, two INSERTs, RELEASE.
+        with self.assertNumQueries(1 + 3 * 5):
+            call_command("import_dispensers", manifest.name, "--batch-size", "3", stdout=out, stderr=err)
+
+        self.assertIn("Imported 7 of 8 rows (1 failed)", out.getvalue())
+        self.assertIn("line 8: -: Line is not valid JSON", err.getvalue())
+        self.assertEqual(Dispenser.objects.filter(owner__isnull=True).count(), 8)
+
+    def test_error_report_is_capped(self):
+        rows = (ManifestRow(n, "bad", "bad", "Invalid") for n in range(1, 51))
+        report = import_dispensers(rows, batch_size=7, max_errors=5)
+
+        self.assertEqual(report["failed"], 50)
+        self.assertEqual(len(report["errors"]), 5)
+        self.assertTrue(report["errors_truncated"])
+
+
+class AdminDispenserListTests(TestCase):
+    def setUp(self):
+        self.addCleanup(dispenser_model_catalog.clear)
+        self.client = APIClient()
+        self.admin = User.objects.create_user(
+            email="admin@example.com",
+            password="pass12345",
+            first_name="Admin",
+            last_name="User",
+            is_staff=True,
+        )
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="pass12345", first_name="Owner", last_name="User"
+        )
+        small = DispenserModel.objects.create(code="S", name="Small", slot_count=4, serial_prefix="S")
+        large = DispenserModel.objects.create(code="L", name="Large", slot_count=10, serial_prefix="L")
+        now = timezone.now()
+        self.dispensers = [
+            Dispenser.objects.create(
+                name=f"Unit{n}",
+                serial_id=f"{model.code}-2025010{n % 3 + 1}-{n:04d}",
+                size=model.code,
+                dispenser_model=model,
+                owner=self.owner if n % 2 else None,
+                device_secret="secret" if n % 3 == 0 else "",
+                dirty=n < 4,
+                last_seen_at=now - timedelta(days=n),
+            )
+            for n, model in enumerate([small, small, large, small, large, small, small])
+        ]
+        self.client.force_authenticate(user=self.admin)
+        self.url = reverse("admin-dispensers")
+
+    def collect(self, params):
+        ids, url = [], self.url
+        while url:
+            resp = self.client.get(url, params)
+            self.assertEqual(resp.status_code, 200)
+            ids.extend(item["id"] for item in resp.data["results"])
+            url, params = resp.data["next"], None
+        return ids
+
+    def test_cursor_pages_cover_fleet_newest_first(self):
+        # Pages cost one query each: no COUNT, owner/model joined in.
+        with self.assertNumQueries(1):
+            resp = self.client.get(self.url, {"page_size": 3})
+        self.assertEqual(len(resp.data["results"]), 3)
+        self.assertNotIn("count", resp.data)
+
+        ids = self.collect({"page_size": 3})
+        self.assertEqual(ids, sorted((d.id for d in self.dispensers), reverse=True))
+
+    def test_filters_and_serial_prefix_search(self):
+        def matching(params, predicate):
+            self.assertEqual(
+                sorted(self.collect(params)), sorted(d.id for d in self.dispensers if predicate(d))
+            )
+
+        matching({"model": "L"}, lambda d: d.size == "L")
+        matching({"owner": "owner@example.com"}, lambda d: d.owner_id == self.owner.id)
+        matching({"paired": "false"}, lambda d: not d.device_secret)
+        matching({"paired": "true", "dirty": "true"}, lambda d: d.device_secret and d.dirty)
+        matching({"search": "S-20250102"}, lambda d: d.serial_id.startswith("S-20250102"))
+        cutoff = self.dispensers[2].last_seen_at
+        matching({"last_seen_after": cutoff.isoformat()}, lambda d: d.last_seen_at >= cutoff)
+
+        self.assertEqual(self.client.get(self.url, {"last_seen_after": "yesterday"}).status_code, 400)
+
+
+class AdminUserListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(
+            email="admin@example.com",
+            password="pass12345",
+            first_name="Admin",
+            last_name="User",
+            is_staff=True,
+        )
+        self.carer = User.objects.create_user(
+            email="carer@example.com", password="pass12345", first_name="Carer", last_name="User"
+        )
+        self.seen = timezone.now() - timedelta(hours=1)
+        for n in range(3):
+            Dispenser.objects.create(
+                name=f"Unit{n}",
+                serial_id=f"S-20250101-{n:04d}",
+                size="S",
+                owner=self.carer,
+                dirty=n == 0,
+                last_seen_at=self.seen - timedelta(days=n),
+            )
+        self.client.force_authenticate(user=self.admin)
+
+    def test_users_are_annotated_with_fleet_counts_in_one_query(self):
+        with self.assertNumQueries(1):
+            resp = self.client.get(reverse("admin-users"))
+
+        self.assertEqual(resp.status_code, 200)
+        users = {user["email"]: user for user in resp.data["results"]}
+        self.assertEqual(users["carer@example.com"]["dispenser_count"], 3)
+        self.assertEqual(users["carer@example.com"]["unsynced_dispenser_count"], 1)
+        self.assertEqual(
+            users["carer@example.com"]["last_device_activity"], self.seen.isoformat().replace("+00:00", "Z")
+        )
+        self.assertEqual(users["admin@example.com"]["dispenser_count"], 0)
+        self.assertIsNone(users["admin@example.com"]["last_device_activity"])
+
+    def test_email_prefix_search(self):
+        resp = self.client.get(reverse("admin-users"), {"search": "car"})
+
+        self.assertEqual([user["email"] for user in resp.data["results"]], ["carer@example.com"])
+
+
+class AdminFleetHealthTests(TestCase):
+    def setUp(self):
+        cache.delete(FLEET_HEALTH_CACHE_KEY)
+        self.addCleanup(cache.delete, FLEET_HEALTH_CACHE_KEY)
+        self.addCleanup(dispenser_model_catalog.clear)
+        self.client = APIClient()
+        self.admin = User.objects.create_user(
+            email="admin@example.com",
+            password="pass12345",
+            first_name="Admin",
+            last_name="User",
+            is_staff=True,
+        )
+        small = DispenserModel.objects.create(code="S", name="Small", slot_count=4, serial_prefix="S")
+        now = timezone.now()
+        for n, (model, last_seen_at, secret, dirty) in enumerate(
+            [
+                (small, now - timedelta(minutes=1), "s", False),
+                (small, now - timedelta(days=3), "s", True),
+                (small, None, "", True),
+                (None, now - timedelta(hours=2), "", False),
+            ]
+        ):
+            Dispenser.objects.create(
+                name=f"Unit{n}",
+                serial_id=f"S-20250101-{n:04d}",
+                size="S",
+                dispenser_model=model,
+                last_seen_at=last_seen_at,
+                device_secret=secret,
+                dirty=dirty,
+            )
+        self.client.force_authenticate(user=self.admin)
+
+    def test_buckets_per_model_from_one_cached_query(self):
+        url = reverse("admin-fleet-health")
+
+        with self.assertNumQueries(1):
+            resp = self.client.get(url)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            resp.data["totals"],
+            {"total": 4, "online": 1, "stale": 1, "never_seen": 1, "unpaired": 2, "dirty": 2},
+        )
+        by_model = {row["model"]: row for row in resp.data["models"]}
+        self.assertEqual(by_model["S"]["total"], 3)
+        self.assertEqual(by_model[None]["unpaired"], 1)
+
+        Dispenser.objects.all().delete()
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+        self.assertEqual(cached.data["totals"]["total"], 4)
+
+
+class AdminPendingSyncTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(
+            email="admin@example.com",
+            password="pass12345",
+            first_name="Admin",
+            last_name="User",
+            is_staff=True,
+        )
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="pass12345", first_name="Owner", last_name="User"
+        )
+        self.addCleanup(verified_token_cache.clear)
+        now = timezone.now()
+        self.dispensers = []
+        for n, dirty_since in enumerate([now - timedelta(hours=2), None, now - timedelta(hours=5)]):
+            dispenser = create_dispenser_for_user(
+                owner=self.owner, name=f"Unit{n}", serial_id=f"S-20250101-{n:04d}"
+            )
+            Dispenser.objects.filter(pk=dispenser.pk).update(dirty=dirty_since is not None, dirty_since=dirty_since)
+            self.dispensers.append(dispenser)
+
+    def test_version_bump_keeps_oldest_dirty_since(self):
+        fresh, synced, oldest = (Dispenser.objects.get(pk=d.pk) for d in self.dispensers)
+        for dispenser in (fresh, synced):
+            create_schedule_for_container(
+                container_id=dispenser.containers.first().pk, owner=self.owner, day_of_week=0, hour=8
+            )
+
+        self.assertEqual(Dispenser.objects.get(pk=fresh.pk).dirty_since, fresh.dirty_since)
+        bumped = Dispenser.objects.get(pk=synced.pk)
+        self.assertTrue(bumped.dirty)
+        self.assertGreater(bumped.dirty_since, fresh.dirty_since)
+
+    def test_queue_oldest_first_and_fetch_records_lag(self):
+        self.client.force_authenticate(user=self.admin)
+
+        resp = self.client.get(reverse("admin-pending-sync"))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            [row["id"] for row in resp.data["results"]], [self.dispensers[2].id, self.dispensers[0].id]
+        )
+        self.assertAlmostEqual(resp.data["results"][0]["pending_seconds"], 5 * 3600, delta=5)
+
+        device = APIClient()
+        token, _ = issue_device_token(self.dispensers[0])
+        config = device.get(
+            reverse("device-config", args=[self.dispensers[0].serial_id]), HTTP_AUTHORIZATION=f"Bearer {token}"
+        )
+        self.assertEqual(config.status_code, 200)
+        fetched = Dispenser.objects.get(pk=self.dispensers[0].pk)
+        self.assertFalse(fetched.dirty)
+        self.assertIsNone(fetched.dirty_since)
+        self.assertAlmostEqual(fetched.last_sync_lag_seconds, 2 * 3600, delta=5)
+
+        with self.assertNumQueries(1):
+            resp = self.client.get(reverse("admin-sync-lag"))
+
+        self.assertEqual(resp.data["pending"], 1)
+        oldest = Dispenser.objects.get(pk=self.dispensers[2].pk)
+        self.assertEqual(resp.data["oldest_dirty_since"], oldest.dirty_since)
+        counts = {bucket["le_seconds"]: bucket["count"] for bucket in resp.data["buckets"]}
+        self.assertEqual(counts[6 * 3600], 1)
+        self.assertEqual(sum(counts.values()), 1)
+
+
+class AdminResetPairingTests(TestCase):
+    def setUp(self):
+        self.addCleanup(dispenser_model_catalog.clear)
+        self.client = APIClient()
+        self.admin = User.objects.create_user(
+            email="admin@example.com",
+            password="pass12345",
+            first_name="Admin",
+            last_name="User",
+            is_staff=True,
+        )
+        DispenserModel.objects.create(code="S", name="Small", slot_count=4, serial_prefix="S")
+        DispenserModel.objects.create(code="L", name="Large", slot_count=10, serial_prefix="L")
+        for n in range(5):
+            code = "S" if n < 3 else "L"
+            Dispenser.objects.create(
+                name=f"Unit{n}",
+                serial_id=f"{code}-20250101-{n:04d}",
+                size=code,
+                dispenser_model=DispenserModel.objects.get(code=code),
+                device_secret=f"secret{n}",
+            )
+
+    def test_reset_in_chunks_reports_progress(self):
+        seen = []
+
+        # Two chunks of (keyset SELECT, SAVEPOINT, UPDATE, RELEASE), then the final empty SELECT.
+        with self.assertNumQueries(2 * 4 + 1):
+            reset = reset_pairing_in_chunks(
+                Dispenser.objects.filter(size="S"),
+                chunk_size=2,
+                progress=lambda total, last_pk: seen.append(total),
+            )
+
+        self.assertEqual(reset, 3)
+        self.assertEqual(seen, [2, 3])
+        small = Dispenser.objects.filter(size="S")
+        self.assertFalse(small.exclude(device_secret="").exists())
+        self.assertEqual(set(small.values_list("device_session_rev", flat=True)), {2})
+        self.assertEqual(Dispenser.objects.filter(size="L").exclude(device_secret="").count(), 2)
+
+    def test_endpoint_requires_filter_or_all(self):
+        self.client.force_authenticate(user=self.admin)
+        url = reverse("admin-reset-pairing")
+
+        self.assertEqual(self.client.post(url, {}, format="json").status_code, 400)
+
+        resp = self.client.post(url, {"model": "L"}, format="json")
+        self.assertEqual(
+            resp.data, {"reset": 2, "chunks": 1, "last_pk": Dispenser.objects.latest("pk").pk, "done": True}
+        )
+
+        resp = self.client.post(url, {"all": True}, format="json")
+        self.assertEqual(resp.data["reset"], 5)
+        self.assertFalse(Dispenser.objects.exclude(device_secret="").exists())
+
+    def test_endpoint_resumes_from_last_pk(self):
+        self.client.force_authenticate(user=self.admin)
+        url = reverse("admin-reset-pairing")
+        pks = list(Dispenser.objects.order_by("pk").values_list("pk", flat=True))
+
+        first = self.client.post(url, {"all": True, "limit": 3}, format="json").data
+        self.assertEqual((first["reset"], first["last_pk"], first["done"]), (3, pks[2], False))
+        self.assertEqual(Dispenser.objects.exclude(device_secret="").count(), 2)
+
+        second = self.client.post(
+            url, {"all": True, "limit": 3, "start_after_pk": first["last_pk"]}, format="json"
+        ).data
+        self.assertEqual((second["reset"], second["last_pk"], second["done"]), (2, pks[4], True))
+        self.assertEqual(set(Dispenser.objects.values_list("device_session_rev", flat=True)), {2})
+
+    def test_management_command(self):
+        out = StringIO()
+
+        call_command("reset_pairing", "--search", "S-", "--chunk-size", "2", stdout=out)
+
+        self.assertIn("Reset pairing for 3 dispensers", out.getvalue())
+        self.assertIn("2/3 reset", out.getvalue())
+        self.assertIn("resume with --start-after", out.getvalue())
+
+        first_pk = Dispenser.objects.order_by("pk").values_list("pk", flat=True).first()
+        out = StringIO()
+        call_command("reset_pairing", "--search", "S-", "--start-after", str(first_pk), stdout=out)
+        self.assertIn("Reset pairing for 2 dispensers", out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("reset_pairing", stdout=StringIO())
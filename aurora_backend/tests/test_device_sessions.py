@@ -1,10 +1,14 @@
+from unittest import mock
+
+import jwt
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from rest_framework.test import APIClient
 
 from authentication.models import User
 from dispensers.models import Container, Schedule, ScheduleEvent
+from dispensers.device_tokens import issue_device_token, verified_token_cache
 from dispensers.services import create_dispenser_for_user
 
 
@@ -85,3 +89,150 @@ class DeviceSessionTests(TestCase):
         session_url = reverse("device-session", args=[self.dispenser.serial_id])
         resp = self.client.post(session_url, HTTP_X_DEVICE_SECRET="bad-secret")
         self.assertEqual(resp.status_code, 401)
+
+
+class VerifiedTokenCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="owner@example.com",
+            password="pass12345",
+            first_name="Owner",
+            last_name="User",
+        )
+        self.dispenser = create_dispenser_for_user(
+            owner=self.user, name="MyDisp", serial_id="S-20250101-0998"
+        )
+        verified_token_cache.clear()
+        self.addCleanup(verified_token_cache.clear)
+        self.config_url = reverse("device-config", args=[self.dispenser.serial_id])
+
+    def test_repeat_requests_skip_signature_verification(self):
+        token, _ = issue_device_token(self.dispenser)
+        resp = self.client.get(self.config_url, HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(resp.status_code, 200)
+
+        with mock.patch("dispensers.device_tokens.decode_device_token") as decode:
+            resp = self.client.get(self.config_url, HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        self.assertEqual(resp.status_code, 200)
+        decode.assert_not_called()
+
+    def test_cached_token_still_checks_revocation(self):
+        token, _ = issue_device_token(self.dispenser)
+        self.client.get(self.config_url, HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        self.dispenser.device_session_rev += 1
+        self.dispenser.save(update_fields=["device_session_rev"])
+        resp = self.client.get(self.config_url, HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        self.assertEqual(resp.status_code, 401)
+
+    def test_cached_token_expires_exactly(self):
+        token, exp = issue_device_token(self.dispenser)
+        self.client.get(self.config_url, HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        with mock.patch("dispensers.device_tokens.time.time", return_value=int(exp.timestamp())):
+            self.assertIsNone(verified_token_cache.get(token))
+
+
+@override_settings(DEVICE_GATEWAY_KEYS={"hub": "hub-key"})
+class DeviceSessionBatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="owner@example.com",
+            password="pass12345",
+            first_name="Owner",
+            last_name="User",
+        )
+        self.dispensers = []
+        for i in range(3):
+            dispenser = create_dispenser_for_user(
+                owner=self.user, name=f"Disp{i}", serial_id=f"S-20250101-050{i}"
+            )
+            dispenser.device_secret = f"secret-{i}"
+            dispenser.save(update_fields=["device_secret"])
+            self.dispensers.append(dispenser)
+        self.url = reverse("device-sessions-batch")
+
+    def test_issues_tokens_with_single_lookup(self):
+        payload = {
+            "devices": [
+                {"serial_id": d.serial_id, "device_secret": d.device_secret} for d in self.dispensers
+            ]
+        }
+        with self.assertNumQueries(1):
+            resp = self.client.post(self.url, payload, format="json", HTTP_X_GATEWAY_KEY="hub-key")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([s["serial_id"] for s in resp.data["sessions"]], [d.serial_id for d in self.dispensers])
+        token = resp.data["sessions"][0]["token"]
+        config_url = reverse("device-config", args=[self.dispensers[0].serial_id])
+        self.assertEqual(self.client.get(config_url, HTTP_AUTHORIZATION=f"Bearer {token}").status_code, 200)
+
+    def test_bad_credentials_reported_per_device(self):
+        payload = {
+            "devices": [
+                {"serial_id": self.dispensers[0].serial_id, "device_secret": "wrong"},
+                {"serial_id": "S-20250101-9999", "device_secret": "whatever"},
+                {"serial_id": self.dispensers[1].serial_id, "device_secret": self.dispensers[1].device_secret},
+            ]
+        }
+        resp = self.client.post(self.url, payload, format="json", HTTP_X_GATEWAY_KEY="hub-key")
+
+        self.assertEqual(resp.status_code, 200)
+        sessions = resp.data["sessions"]
+        self.assertNotIn("token", sessions[0])
+        self.assertNotIn("token", sessions[1])
+        self.assertIn("token", sessions[2])
+
+    def test_requires_gateway_key(self):
+        payload = {"devices": [{"serial_id": self.dispensers[0].serial_id, "device_secret": "secret-0"}]}
+        resp = self.client.post(self.url, payload, format="json", HTTP_X_GATEWAY_KEY="nope")
+        self.assertEqual(resp.status_code, 401)
+
+
+class DeviceTokenKeyRotationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="owner@example.com",
+            password="pass12345",
+            first_name="Owner",
+            last_name="User",
+        )
+        self.dispenser = create_dispenser_for_user(
+            owner=self.user, name="MyDisp", serial_id="S-20250101-0997"
+        )
+        self.config_url = reverse("device-config", args=[self.dispenser.serial_id])
+        self.addCleanup(verified_token_cache.clear)
+
+    def get_config(self, token):
+        return self.client.get(self.config_url, HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_tokens_from_previous_key_verify_during_overlap(self):
+        with self.settings(DEVICE_TOKEN_KEYS=[{"kid": "old", "secret": "old-secret"}], DEVICE_TOKEN_ACTIVE_KID="old"):
+            old_token, _ = issue_device_token(self.dispenser)
+
+        rotated = [
+            {"kid": "new", "secret": "new-secret"},
+            {"kid": "old", "secret": "old-secret", "verify_until": "2999-01-01T00:00:00+00:00"},
+        ]
+        with self.settings(DEVICE_TOKEN_KEYS=rotated, DEVICE_TOKEN_ACTIVE_KID="new"):
+            new_token, _ = issue_device_token(self.dispenser)
+            self.assertEqual(jwt.get_unverified_header(new_token)["kid"], "new")
+            self.assertEqual(self.get_config(old_token).status_code, 200)
+            self.assertEqual(self.get_config(new_token).status_code, 200)
+
+    def test_retired_key_is_rejected(self):
+        with self.settings(DEVICE_TOKEN_KEYS=[{"kid": "old", "secret": "old-secret"}], DEVICE_TOKEN_ACTIVE_KID="old"):
+            old_token, _ = issue_device_token(self.dispenser)
+            self.assertEqual(self.get_config(old_token).status_code, 200)
+
+        retired = [
+            {"kid": "new", "secret": "new-secret"},
+            {"kid": "old", "secret": "old-secret", "verify_until": "2000-01-01T00:00:00+00:00"},
+        ]
+        with self.settings(DEVICE_TOKEN_KEYS=retired, DEVICE_TOKEN_ACTIVE_KID="new"):
+            self.assertEqual(self.get_config(old_token).status_code, 401)
@@ -1,15 +1,26 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connections
 from django.urls import reverse
 from django.test import TestCase
 from django.utils import timezone
 from rest_framework.test import APIClient
 
-from dispensers.models import Dispenser, Container, Schedule
-from dispensers.services import create_dispenser_for_user
+from dispensers.models import Dispenser, Container, DispenserModel, Schedule, ScheduleEvent, ScheduleTemplate
+from dispensers import services
+from dispensers.services import create_dispenser_for_user, provision_dispensers, update_schedule
+from dispensers.weekmask import WeekMask
 from authentication.models import User
+from dispensers.catalog import dispenser_model_catalog
 
 
 class DispenserAPITests(TestCase):
     def setUp(self):
+        self.addCleanup(dispenser_model_catalog.clear)
+        cache.clear()
+        self.addCleanup(cache.clear)
         self.client = APIClient()
         self.user = User.objects.create_user(
             email="owner@example.com",
@@ -36,6 +47,78 @@ class DispenserAPITests(TestCase):
         self.assertEqual(len(resp.data), 1)
         self.assertEqual(resp.data[0]["name"], "MyDisp")
 
+    def test_list_sparse_fieldsets_drive_prefetches(self):
+        dispenser = create_dispenser_for_user(owner=self.user, name="Sparse", serial_id="S-20250101-0005")
+        Schedule.objects.create(container=dispenser.containers.first(), day_of_week=0, hour=8)
+        self.client.force_authenticate(user=self.user)
+        url = reverse("list-all-user-dispensers")
+
+        # One query for the response cache's version check, then the reads.
+        with self.assertNumQueries(2):
+            resp = self.client.get(url, {"fields": "id,name"})
+        self.assertEqual(resp.data, [{"id": dispenser.id, "name": "Sparse"}])
+
+        with self.assertNumQueries(3):
+            resp = self.client.get(url, {"fields": "name", "expand": "containers"})
+        self.assertEqual(set(resp.data[0]), {"name", "containers"})
+        self.assertNotIn("schedules", resp.data[0]["containers"][0])
+
+        with self.assertNumQueries(4):
+            resp = self.client.get(url, {"expand": "containers.schedules"})
+        self.assertEqual(set(resp.data[0]), {"id", "name", "serial_id", "owner", "containers"})
+        self.assertEqual(len(resp.data[0]["containers"][0]["schedules"]), 1)
+
+        resp = self.client.get(url, {"fields": "name,secret"})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_list_pagination_is_opt_in(self):
+        for index in range(3):
+            create_dispenser_for_user(owner=self.user, name=f"Page{index}", serial_id=f"S-20250101-06{index:02d}")
+        self.client.force_authenticate(user=self.user)
+        url = reverse("list-all-user-dispensers")
+
+        self.assertEqual(len(self.client.get(url).data), 3)
+
+        first = self.client.get(url, {"fields": "name", "page_size": 2}).data
+        self.assertEqual([d["name"] for d in first["results"]], ["Page0", "Page1"])
+        second = self.client.get(first["next"]).data
+        self.assertEqual([d["name"] for d in second["results"]], ["Page2"])
+        self.assertIsNone(second["next"])
+
+    def test_owner_views_serve_cached_responses_until_service_writes(self):
+        dispenser = create_dispenser_for_user(owner=self.user, name="Cached", serial_id="S-20250101-0007")
+        container = dispenser.containers.first()
+        self.client.force_authenticate(user=self.user)
+        list_url = reverse("list-all-user-dispensers")
+        detail_url = reverse("get-dispenser", args=[dispenser.id])
+
+        first = self.client.get(list_url)
+        etag = first["ETag"]
+        with self.assertNumQueries(1):
+            cached = self.client.get(list_url)
+        self.assertEqual(cached.data, first.data)
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+
+        self.client.put(reverse("update-dispenser-name"), {"current_name": "Cached", "new_name": "Renamed"})
+        renamed = self.client.get(list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(renamed.status_code, 200)
+        self.assertEqual(renamed.data[0]["name"], "Renamed")
+
+        detail_etag = self.client.get(detail_url)["ETag"]
+        self.client.post(
+            reverse("container-schedules-create", args=[container.id]), {"day_of_week": 2, "hour": 9}
+        )
+        resp = self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data["containers"][0]["schedules"]), 1)
+        self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code, 304)
+
+        self.client.force_authenticate(user=self.other)
+        self.assertEqual(self.client.get(detail_url).status_code, 404)
+        self.assertEqual(self.client.get(list_url).data, [])
+
     def test_get_dispenser_detail(self):
         dispenser = create_dispenser_for_user(owner=self.user, name="MyDisp", serial_id="S-20250101-0003")
 
@@ -120,3 +203,484 @@ class DispenserAPITests(TestCase):
         dispenser.refresh_from_db()
         self.assertTrue(dispenser.dirty)
         self.assertEqual(dispenser.schedule_version, 2)
+
+    def test_configuration_put_applies_diff_with_single_version_bump(self):
+        dispenser = create_dispenser_for_user(owner=self.user, name="ConfDisp", serial_id="S-20250101-0201")
+        first, second = Container.objects.filter(dispenser=dispenser)[:2]
+        keep = Schedule.objects.create(container=first, day_of_week=0, hour=8, minute=0, repeat=True)
+        Schedule.objects.create(container=first, day_of_week=1, hour=8, minute=0, repeat=True)
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse("dispenser-configuration", args=[dispenser.id])
+        payload = {
+            "containers": [
+                {
+                    "slot_number": first.slot_number,
+                    "pill_name": "Aspirin",
+                    "schedules": [
+                        {"day_of_week": 0, "hour": 8, "minute": 0, "repeat": False},
+                        {"day_of_week": 2, "hour": 20, "minute": 30},
+                    ],
+                },
+                {"slot_number": second.slot_number, "schedules": [{"day_of_week": 6, "hour": 9}]},
+            ]
+        }
+        resp = self.client.put(url, payload, format="json")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["schedules_created"], 2)
+        self.assertEqual(resp.data["schedules_updated"], 1)
+        self.assertEqual(resp.data["schedules_deleted"], 1)
+        self.assertEqual(resp.data["containers_updated"], 1)
+        dispenser.refresh_from_db()
+        self.assertEqual(dispenser.schedule_version, 2)
+        keep.refresh_from_db()
+        self.assertFalse(keep.repeat)
+        self.assertEqual(
+            sorted(first.schedules.values_list("day_of_week", "hour", "minute")), [(0, 8, 0), (2, 20, 30)]
+        )
+
+        # Re-sending the same state is a no-op.
+        again = self.client.put(url, payload, format="json")
+        self.assertFalse(again.data["changed"])
+        dispenser.refresh_from_db()
+        self.assertEqual(dispenser.schedule_version, 2)
+
+    def test_configuration_put_conflicting_with_a_concurrent_insert_returns_409(self):
+        dispenser = create_dispenser_for_user(owner=self.user, name="ConfDisp", serial_id="S-20250101-0206")
+        container = Container.objects.filter(dispenser=dispenser).first()
+        bulk_create = Schedule.objects.bulk_create
+
+        def racing_bulk_create(objs, *args, **kwargs):
+            # Another request commits the same row between our diff and our insert.
+            Schedule.objects.create(container=container, day_of_week=4, hour=7)
+            return bulk_create(objs, *args, **kwargs)
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse("dispenser-configuration", args=[dispenser.id])
+        payload = {"containers": [{"slot_number": container.slot_number, "schedules": [{"day_of_week": 4, "hour": 7}]}]}
+        with mock.patch.object(Schedule.objects, "bulk_create", side_effect=racing_bulk_create):
+            resp = self.client.put(url, payload, format="json")
+
+        self.assertEqual(resp.status_code, 409)
+        dispenser.refresh_from_db()
+        self.assertEqual(dispenser.schedule_version, 1)
+
+    def test_configuration_put_rejects_unknown_slot(self):
+        dispenser = create_dispenser_for_user(owner=self.user, name="ConfDisp", serial_id="S-20250101-0202")
+        self.client.force_authenticate(user=self.user)
+        url = reverse("dispenser-configuration", args=[dispenser.id])
+        resp = self.client.put(url, {"containers": [{"slot_number": 99, "schedules": []}]}, format="json")
+
+        self.assertEqual(resp.status_code, 400)
+
+    def test_stale_instances_do_not_lose_version_increments(self):
+        dispenser = create_dispenser_for_user(owner=self.user, name="Racy", serial_id="S-20250101-0203")
+        container = Container.objects.filter(dispenser=dispenser).first()
+        schedule = Schedule.objects.create(container=container, day_of_week=0, hour=8, minute=0, repeat=True)
+        stale_a = Schedule.objects.select_related("container__dispenser__owner").get(pk=schedule.pk)
+        stale_b = Schedule.objects.select_related("container__dispenser__owner").get(pk=schedule.pk)
+
+        update_schedule(schedule=stale_a, owner=self.user, hour=9)
+        update_schedule(schedule=stale_b, owner=self.user, minute=30)
+
+        dispenser.refresh_from_db()
+        self.assertEqual(dispenser.schedule_version, 3)
+        self.assertEqual(stale_b.container.dispenser.schedule_version, 3)
+
+    def test_version_bumps_use_locked_fallback_without_update_returning(self):
+        with mock.patch.object(connections["default"], "vendor", "mysql"):
+            self.assertFalse(services._can_update_returning())
+        dispenser = create_dispenser_for_user(owner=self.user, name="Fallback", serial_id="S-20250101-0204")
+        schedule = Schedule.objects.create(container=dispenser.containers.first(), day_of_week=0, hour=8)
+
+        with mock.patch("dispensers.services._can_update_returning", return_value=False):
+            update_schedule(schedule=schedule, owner=self.user, hour=9)
+
+        dispenser.refresh_from_db()
+        self.assertEqual(dispenser.schedule_version, 2)
+        self.assertTrue(dispenser.dirty)
+
+    def test_if_match_rejects_stale_schedule_edits(self):
+        dispenser = create_dispenser_for_user(owner=self.user, name="Guarded", serial_id="S-20250101-0204")
+        container = Container.objects.filter(dispenser=dispenser).first()
+        schedule = Schedule.objects.create(container=container, day_of_week=0, hour=8, minute=0, repeat=True)
+        self.client.force_authenticate(user=self.user)
+        url = reverse("schedule-update", args=[schedule.id])
+
+        ok = self.client.patch(url, {"hour": 9}, format="json", HTTP_IF_MATCH='"1"')
+        stale = self.client.patch(url, {"hour": 10}, format="json", HTTP_IF_MATCH='"1"')
+
+        self.assertEqual(ok.status_code, 200)
+        self.assertEqual(ok["ETag"], '"2"')
+        self.assertEqual(stale.status_code, 412)
+        self.assertEqual(stale.data["schedule_version"], 2)
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.hour, 9)
+
+    def test_malformed_version_checks_are_rejected(self):
+        dispenser = create_dispenser_for_user(owner=self.user, name="Guarded", serial_id="S-20250101-0205")
+        container = Container.objects.filter(dispenser=dispenser).first()
+        schedule = Schedule.objects.create(container=container, day_of_week=0, hour=8, minute=0, repeat=True)
+        self.client.force_authenticate(user=self.user)
+        url = reverse("schedule-update", args=[schedule.id])
+
+        list_body = self.client.patch(url, [{"hour": 9}], format="json")
+        bad_header = self.client.patch(url, {"hour": 9}, format="json", HTTP_IF_MATCH='"abc"')
+
+        self.assertEqual(list_body.status_code, 400)
+        self.assertEqual(bad_header.status_code, 400)
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.hour, 8)
+
+    def test_expected_version_in_body_guards_schedule_creation(self):
+        dispenser = create_dispenser_for_user(owner=self.user, name="Guarded", serial_id="S-20250101-0205")
+        container = Container.objects.filter(dispenser=dispenser).first()
+        self.client.force_authenticate(user=self.user)
+        url = reverse("container-schedules-create", args=[container.id])
+
+        resp = self.client.post(url, {"day_of_week": 0, "hour": 9, "minute": 0, "expected_version": 7}, format="json")
+
+        self.assertEqual(resp.status_code, 412)
+        self.assertEqual(container.schedules.count(), 0)
+
+    def test_schedule_creation_query_count(self):
+        dispenser = create_dispenser_for_user(owner=self.user, name="Counted", serial_id="S-20250101-0206")
+        container = Container.objects.filter(dispenser=dispenser).first()
+        self.client.force_authenticate(user=self.user)
+        url = reverse("container-schedules-create", args=[container.id])
+
+        # SAVEPOINT, version bump doubling as ownership check, INSERT,
+        # schedule mask SELECT + UPDATE, RELEASE.
+        with self.assertNumQueries(6):
+            resp = self.client.post(url, {"day_of_week": 3, "hour": 12}, format="json")
+
+        self.assertEqual(resp.status_code, 201)
+        schedule = container.schedules.get()
+        self.assertEqual(resp.data, {"id": schedule.id, "day_of_week": 3, "hour": 12, "minute": 0, "repeat": True})
+
+    def test_schedule_creation_for_foreign_container_returns_404(self):
+        dispenser = create_dispenser_for_user(owner=self.other, name="Foreign", serial_id="S-20250101-0207")
+        container = Container.objects.filter(dispenser=dispenser).first()
+        self.client.force_authenticate(user=self.user)
+        url = reverse("container-schedules-create", args=[container.id])
+
+        resp = self.client.post(url, {"day_of_week": 3, "hour": 12}, format="json")
+
+        self.assertEqual(resp.status_code, 404)
+        dispenser.refresh_from_db()
+        self.assertEqual(dispenser.schedule_version, 1)
+
+    def test_schedule_writes_maintain_mask_and_summary(self):
+        dispenser = create_dispenser_for_user(owner=self.user, name="Masked", serial_id="S-20250101-0208")
+        first, second = Container.objects.filter(dispenser=dispenser)[:2]
+        self.client.force_authenticate(user=self.user)
+        for container, hour in ((first, 8), (first, 20), (second, 8)):
+            url = reverse("container-schedules-create", args=[container.id])
+            self.client.post(url, {"day_of_week": 0, "hour": hour}, format="json")
+
+        first.refresh_from_db()
+        self.assertEqual(first.week_mask, WeekMask.from_times([(0, 8, 0), (0, 20, 0)]))
+
+        url = reverse("dispenser-schedule-summary", args=[dispenser.id])
+        resp = self.client.get(url, {"day_of_week": 0, "hour": 20})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["doses_per_week"], 3)
+        self.assertEqual(resp.data["containers"][0]["doses_per_week"], 2)
+        self.assertEqual(
+            resp.data["overlaps"],
+            [{"day_of_week": 0, "hour": 8, "minute": 0, "slots": [first.slot_number, second.slot_number]}],
+        )
+        self.assertEqual(resp.data["dropping_slots"], [first.slot_number])
+
+        schedule = first.schedules.get(hour=20)
+        self.client.delete(reverse("schedule-delete", args=[schedule.id]))
+        first.refresh_from_db()
+        self.assertEqual(len(first.week_mask), 1)
+
+    def test_calendar_expands_repeating_and_one_off_schedules(self):
+        dispenser = create_dispenser_for_user(owner=self.user, name="Cal", serial_id="S-20250101-0209")
+        first, second = Container.objects.filter(dispenser=dispenser)[:2]
+        created = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        weekly = Schedule.objects.create(container=first, day_of_week=0, hour=8, minute=30, created_at=created)
+        once = Schedule.objects.create(container=second, day_of_week=2, hour=21, repeat=False, created_at=created)
+        self.client.force_authenticate(user=self.user)
+
+        url = reverse("dispenser-calendar", args=[dispenser.id])
+        resp = self.client.get(url, {"start": "2025-01-06", "end": "2025-01-19"})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            [(dose["at"], dose["schedule_id"]) for dose in resp.data["doses"]],
+            [
+                ("2025-01-06T08:30:00+00:00", weekly.id),
+                ("2025-01-13T08:30:00+00:00", weekly.id),
+            ],
+        )
+
+        resp = self.client.get(url, {"start": "2025-01-01", "end": "2025-01-05", "tz": "Europe/Berlin"})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([dose["schedule_id"] for dose in resp.data["doses"]], [once.id])
+        self.assertEqual(resp.data["doses"][0]["at"], "2025-01-01T21:00:00+01:00")
+        self.assertEqual(resp.data["doses"][0]["slot_number"], second.slot_number)
+
+    def test_calendar_joins_recorded_events(self):
+        dispenser = create_dispenser_for_user(owner=self.user, name="Cal", serial_id="S-20250101-0210")
+        container = Container.objects.filter(dispenser=dispenser).first()
+        schedule = Schedule.objects.create(
+            container=container, day_of_week=0, hour=8, created_at=datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        )
+        ScheduleEvent.objects.create(
+            dispenser=dispenser,
+            container=container,
+            schedule=schedule,
+            status=ScheduleEvent.STATUS_COMPLETED,
+            occurred_at=datetime(2025, 1, 6, 8, 5, tzinfo=dt_timezone.utc),
+        )
+        self.client.force_authenticate(user=self.user)
+
+        resp = self.client.get(reverse("dose-calendar"), {"start": "2025-01-06", "end": "2025-01-13", "events": "true"})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([dose["status"] for dose in resp.data["doses"]], ["completed", None])
+
+    def test_calendar_rejects_foreign_dispenser_and_long_ranges(self):
+        dispenser = create_dispenser_for_user(owner=self.other, name="Foreign", serial_id="S-20250101-0211")
+        self.client.force_authenticate(user=self.user)
+
+        resp = self.client.get(
+            reverse("dispenser-calendar", args=[dispenser.id]), {"start": "2025-01-06", "end": "2025-01-12"}
+        )
+        self.assertEqual(resp.status_code, 404)
+
+        resp = self.client.get(reverse("dose-calendar"), {"start": "2025-01-01", "end": "2025-12-31"})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_upcoming_doses_merge_dispensers_with_fixed_queries(self):
+        now = timezone.now()
+        soon, later = now + timedelta(hours=1), now + timedelta(hours=2)
+        for index in range(3):
+            dispenser = create_dispenser_for_user(
+                owner=self.user, name=f"Up{index}", serial_id=f"S-20250101-03{index:02d}"
+            )
+            container = Container.objects.filter(dispenser=dispenser).first()
+            at = soon if index == 1 else later
+            Schedule.objects.create(container=container, day_of_week=at.weekday(), hour=at.hour, minute=at.minute)
+        self.client.force_authenticate(user=self.user)
+        url = reverse("upcoming-doses")
+
+        with self.assertNumQueries(1):
+            resp = self.client.get(url, {"limit": 4})
+
+        self.assertEqual(resp.status_code, 200)
+        doses = resp.data["doses"]
+        self.assertEqual(len(doses), 4)
+        self.assertEqual([dose["at"] for dose in doses], sorted(dose["at"] for dose in doses))
+        self.assertEqual(doses[0]["at"], soon.replace(second=0, microsecond=0).isoformat())
+        self.assertEqual(doses[3]["at"], (soon + timedelta(days=7)).replace(second=0, microsecond=0).isoformat())
+
+    def test_home_screen_summarizes_dispensers_with_fixed_queries(self):
+        now = timezone.now()
+        day_start = now.astimezone(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        dispenser = create_dispenser_for_user(owner=self.user, name="Home", serial_id="S-20250101-0700")
+        taken = Schedule.objects.create(
+            container=dispenser.containers.get(slot_number=1), day_of_week=day_start.weekday(), hour=0
+        )
+        Schedule.objects.create(
+            container=dispenser.containers.get(slot_number=2), day_of_week=day_start.weekday(), hour=0
+        )
+        ScheduleEvent.objects.create(
+            dispenser=dispenser,
+            container=taken.container,
+            schedule=taken,
+            status=ScheduleEvent.STATUS_COMPLETED,
+            occurred_at=day_start + timedelta(minutes=5),
+        )
+        self.client.force_authenticate(user=self.user)
+        url = reverse("home-screen")
+
+        with self.assertNumQueries(3):
+            resp = self.client.get(url, {"tz": "UTC"})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["user"]["email"], "owner@example.com")
+        (item,) = resp.data["dispensers"]
+        self.assertEqual(item["id"], dispenser.id)
+        self.assertEqual(item["next_dose"]["at"], (day_start + timedelta(days=7)).isoformat())
+        self.assertEqual(item["next_dose"]["slot_number"], 1)
+        self.assertEqual(item["last_event"]["status"], "completed")
+        self.assertEqual(item["last_event"]["slot_number"], 1)
+        adherence = item["adherence_today"]
+        self.assertEqual((adherence["due"], adherence["completed"]), (2, 1))
+        self.assertEqual(adherence["missed"] + adherence["pending"], 1)
+
+        for index in range(3):
+            create_dispenser_for_user(owner=self.user, name=f"More{index}", serial_id=f"S-20250101-071{index}")
+        with self.assertNumQueries(3):
+            resp = self.client.get(url, {"tz": "UTC"})
+        self.assertEqual(len(resp.data["dispensers"]), 4)
+        idle = resp.data["dispensers"][1]
+        self.assertIsNone(idle["next_dose"])
+        self.assertIsNone(idle["last_event"])
+        self.assertEqual(idle["adherence_today"]["due"], 0)
+
+    def test_schedule_template_create_and_list(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse("schedule-templates")
+        payload = {
+            "name": "Morning and evening",
+            "rules": [
+                {"slot_number": 1, "day_of_week": 0, "hour": 8},
+                {"slot_number": 1, "day_of_week": 0, "hour": 20},
+            ],
+        }
+
+        resp = self.client.post(url, payload, format="json")
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(len(resp.data["rules"]), 2)
+        self.assertEqual(self.client.post(url, payload, format="json").status_code, 400)
+        resp = self.client.get(url)
+        self.assertEqual([template["name"] for template in resp.data], ["Morning and evening"])
+
+    def test_apply_schedule_template_to_many_dispensers(self):
+        template = ScheduleTemplate.objects.create(owner=self.user, name="Regimen")
+        template.rules.create(slot_number=1, day_of_week=0, hour=8)
+        template.rules.create(slot_number=2, day_of_week=3, hour=12, minute=15)
+        template.rules.create(slot_number=99, day_of_week=3, hour=12)
+        dispensers = [
+            create_dispenser_for_user(owner=self.user, name=f"Ward{index}", serial_id=f"S-20250101-04{index:02d}")
+            for index in range(4)
+        ]
+        foreign = create_dispenser_for_user(owner=self.other, name="Foreign", serial_id="S-20250101-0499")
+        already = Container.objects.get(dispenser=dispensers[0], slot_number=1)
+        Schedule.objects.create(container=already, day_of_week=0, hour=8)
+        Schedule.objects.create(
+            container=Container.objects.get(dispenser=dispensers[0], slot_number=2), day_of_week=3, hour=12, minute=15
+        )
+        self.client.force_authenticate(user=self.user)
+        url = reverse("schedule-template-apply", args=[template.id])
+        ids = [d.id for d in dispensers] + [foreign.id]
+
+        with self.assertNumQueries(11):
+            resp = self.client.post(url, {"dispenser_ids": ids}, format="json")
+
+        self.assertEqual(resp.status_code, 200)
+        results = {entry["dispenser_id"]: entry for entry in resp.data["results"]}
+        self.assertEqual(results[foreign.id], {"dispenser_id": foreign.id, "status": "not_found"})
+        self.assertEqual(results[dispensers[0].id]["status"], "unchanged")
+        self.assertEqual(results[dispensers[0].id]["schedule_version"], 1)
+        for dispenser in dispensers[1:]:
+            self.assertEqual(results[dispenser.id]["status"], "applied")
+            self.assertEqual(results[dispenser.id]["schedules_created"], 2)
+            self.assertEqual(results[dispenser.id]["schedule_version"], 2)
+            self.assertEqual(results[dispenser.id]["missing_slots"], [99])
+            container = Container.objects.get(dispenser=dispenser, slot_number=2)
+            self.assertEqual(container.week_mask, WeekMask.from_times([(3, 12, 15)]))
+        self.assertFalse(Schedule.objects.filter(container__dispenser=foreign).exists())
+
+    def test_apply_schedule_template_conflicting_with_a_concurrent_insert_returns_409(self):
+        template = ScheduleTemplate.objects.create(owner=self.user, name="Regimen")
+        template.rules.create(slot_number=1, day_of_week=0, hour=8)
+        dispenser = create_dispenser_for_user(owner=self.user, name="Ward", serial_id="S-20250101-0450")
+        container = Container.objects.get(dispenser=dispenser, slot_number=1)
+        bulk_create = Schedule.objects.bulk_create
+
+        def racing_bulk_create(objs, *args, **kwargs):
+            Schedule.objects.create(container=container, day_of_week=0, hour=8)
+            return bulk_create(objs, *args, **kwargs)
+
+        self.client.force_authenticate(user=self.user)
+        url = reverse("schedule-template-apply", args=[template.id])
+        with mock.patch.object(Schedule.objects, "bulk_create", side_effect=racing_bulk_create):
+            resp = self.client.post(url, {"dispenser_ids": [dispenser.id]}, format="json")
+
+        self.assertEqual(resp.status_code, 409)
+        dispenser.refresh_from_db()
+        self.assertEqual(dispenser.schedule_version, 1)
+
+    def test_create_dispenser_uses_fixed_queries(self):
+        DispenserModel.objects.create(code="M", name="Medium", slot_count=6, serial_prefix="M")
+
+        dispenser_model_catalog.by_code("M")
+
+        # SAVEPOINT, dispenser INSERT, container bulk INSERT, RELEASE; the model comes from the catalog.
+        with self.assertNumQueries(4):
+            dispenser = create_dispenser_for_user(owner=self.user, name="Quick", serial_id="M-20250101-0001")
+
+        self.assertTrue(dispenser.dirty)
+        self.assertEqual(
+            list(dispenser.containers.values_list("slot_number", flat=True)), [1, 2, 3, 4, 5, 6]
+        )
+
+    def test_provision_dispensers_in_chunks(self):
+        DispenserModel.objects.create(code="L", name="Large", slot_count=10, serial_prefix="L")
+        specs = [{"serial_id": f"L-20250101-{n:04d}"} for n in range(1, 6)]
+
+        dispenser_model_catalog.by_code("L")
+
+        # Registered-serial lookup, SAVEPOINT, two INSERTs and RELEASE per chunk of two.
+        with self.assertNumQueries(15):
+            report = provision_dispensers(dispensers=specs, batch_size=2)
+
+        self.assertEqual(report["created"], 5)
+        created = Dispenser.objects.filter(serial_id__startswith="L-")
+        self.assertEqual(Container.objects.filter(dispenser__in=created).count(), 50)
+        first = created.get(serial_id="L-20250101-0001")
+        self.assertIsNone(first.owner)
+        self.assertEqual(first.name, "L-20250101-0001")
+
+        onboarded = provision_dispensers(
+            dispensers=[{"serial_id": "L-20250101-0100", "name": "Room 1"}], owner=self.user
+        )
+        self.assertEqual(onboarded["created"], 1)
+        room = Dispenser.objects.get(serial_id="L-20250101-0100")
+        self.assertEqual(room.owner, self.user)
+        self.assertEqual(room.containers.count(), 10)
+
+    def test_provision_dispensers_rejects_bad_rows(self):
+        DispenserModel.objects.create(code="L", name="Large", slot_count=10, serial_prefix="L")
+        create_dispenser_for_user(owner=self.user, name="Taken", serial_id="L-20250101-0001")
+
+        report = provision_dispensers(
+            dispensers=[
+                {"serial_id": "L-20250101-0001"},
+                {"serial_id": "not-a-serial"},
+                {"serial_id": "Q-20250101-0001"},
+                {"serial_id": "L-20250101-0002"},
+                {"serial_id": "L-20250101-0002"},
+            ],
+            batch_size=2,
+        )
+
+        self.assertEqual(report["created"], 1)
+        self.assertEqual([error["line"] for error in report["errors"]], [1, 2, 3, 5])
+        self.assertFalse(Dispenser.objects.filter(serial_id="Q-20250101-0001").exists())
+
+    def test_dispenser_model_catalog_serves_lookups_and_invalidates(self):
+        small = DispenserModel.objects.create(code="S", name="Small", slot_count=4, serial_prefix="S")
+        self.assertEqual(dispenser_model_catalog.by_code("S"), small)
+
+        dispenser = create_dispenser_for_user(owner=self.user, name="Cached", serial_id="S-20250101-0500")
+        dispenser = Dispenser.objects.get(pk=dispenser.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(dispenser.max_containers, 4)
+
+        admin = User.objects.create_user(
+            email="staff@example.com", password="pass12345", first_name="Staff", last_name="User", is_staff=True
+        )
+        self.client.force_authenticate(user=admin)
+        resp = self.client.post(
+            reverse("admin-dispenser-models"),
+            {"code": "XL", "name": "Extra large", "slot_count": 12, "serial_prefix": "XL"},
+            format="json",
+        )
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(dispenser_model_catalog.by_code("XL").slot_count, 12)
+
+        small.slot_count = 5
+        small.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(dispenser.max_containers, 5)
@@ -0,0 +1,237 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from aurora_backend.query_budget import QueryBudgetExceeded, get_query_budget
+from aurora_backend.throttling import get_throttle_store
+from authentication.models import User
+from authentication.views import UpdateNamesView
+from dispensers.catalog import dispenser_model_catalog
+from dispensers.device_tokens import issue_device_token, verified_token_cache
+from dispensers.models import Dispenser, DispenserModel, Schedule, ScheduleEvent, ScheduleTemplate
+from dispensers.services import create_dispenser_for_user
+
+# Requests are measured against fleets of these sizes; counts must fit the
+# view's budget and must not grow with the fleet.
+FLEET_SIZES = (1, 6)
+BUDGETED_URLCONFS = ("dispensers.urls", "authentication.urls", "aurora_admin.urls")
+
+
+def _url_names(urlconf):
+    return [
+        pattern.name
+        for pattern in get_resolver(urlconf).url_patterns
+        if isinstance(pattern, URLPattern)
+    ]
+
+
+@override_settings(
+    QUERY_BUDGET_ENABLED=True,
+    DEVICE_GATEWAY_KEYS={"hub": "gateway-key"},
+)
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        self.addCleanup(dispenser_model_catalog.clear)
+        self.addCleanup(verified_token_cache.clear)
+        self.addCleanup(cache.clear)
+        # Every route is hit by the same users many times over; start each test with empty buckets.
+        get_throttle_store.cache_clear()
+        DispenserModel.objects.create(code="S", name="Small", slot_count=4, serial_prefix="S")
+        self.owner = User.objects.create_user(
+            email="owner@example.com", password="pass12345", first_name="Owner", last_name="User"
+        )
+        self.admin = User.objects.create_user(
+            email="admin@example.com", password="pass12345", first_name="Admin", last_name="User", is_staff=True
+        )
+
+    def build_fleet(self, size):
+        """`size` paired dispensers with schedules and events, plus a template."""
+        now = timezone.now()
+        dispensers = []
+        for n in range(size):
+            dispenser = create_dispenser_for_user(
+                owner=self.owner, name=f"Unit{n}", serial_id=f"S-20250101-{n + 1:04d}"
+            )
+            Dispenser.objects.filter(pk=dispenser.pk).update(device_secret=f"secret{n}", last_seen_at=now)
+            dispenser.device_secret = f"secret{n}"
+            for container in dispenser.containers.all():
+                # Midnight today is always already due, so the home screen's event query always runs.
+                for hour in (0, 20):
+                    schedule = Schedule.objects.create(
+                        container=container, day_of_week=timezone.localtime(now).weekday(), hour=hour
+                    )
+                    ScheduleEvent.objects.create(
+                        dispenser=dispenser,
+                        container=container,
+                        schedule=schedule,
+                        status=ScheduleEvent.STATUS_COMPLETED,
+                        occurred_at=now - timedelta(days=1),
+                    )
+            dispensers.append(dispenser)
+        template = ScheduleTemplate.objects.create(owner=self.owner, name="Regimen")
+        for slot in range(1, 5):
+            template.rules.create(slot_number=slot, day_of_week=6, hour=12)
+        Dispenser.objects.create(name="Spare", serial_id="S-20250101-9000", size="S")
+        return dispensers, template
+
+    def requests_for(self, dispensers, template):
+        """(url name, method, url, kwargs) for every budgeted route."""
+        first = dispensers[0]
+        container = first.containers.first()
+        schedule = container.schedules.first()
+        user = {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(self.owner).access_token}"}
+        admin = {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(self.admin).access_token}"}
+        device = {"HTTP_AUTHORIZATION": f"Bearer {issue_device_token(first)[0]}"}
+        leaver = User.objects.create_user(
+            email="leaver@example.com", password="pass12345", first_name="Leaver", last_name="User"
+        )
+        leaver_auth = {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(leaver).access_token}"}
+        refresh = str(RefreshToken.for_user(self.owner))
+        all_ids = [d.id for d in dispensers]
+        serial = first.serial_id
+        return [
+            ("register-dispenser", "post", reverse("register-dispenser"),
+             {"data": {"serial_id": "S-20250101-0999", "name": "Newcomer"}, **user}),
+            ("delete-dispenser", "delete", reverse("delete-dispenser", args=[first.name]), user),
+            ("list-all-user-dispensers", "get", reverse("list-all-user-dispensers"), user),
+            ("get-dispenser", "get", reverse("get-dispenser", args=[first.id]), user),
+            ("reset-dispenser-pairing", "post", reverse("reset-dispenser-pairing", args=[first.id]), user),
+            ("dispenser-configuration", "put", reverse("dispenser-configuration", args=[first.id]),
+             {"data": {"containers": [{"slot_number": 1, "pill_name": "A", "schedules": [
+                 {"day_of_week": 1, "hour": 9}]}]}, **user}),
+            ("dispenser-schedule-summary", "get", reverse("dispenser-schedule-summary", args=[first.id]), user),
+            ("dispenser-calendar", "get", reverse("dispenser-calendar", args=[first.id]),
+             {"data": {"start": "2025-01-06", "end": "2025-01-19", "events": "true"}, **user}),
+            ("dose-calendar", "get", reverse("dose-calendar"),
+             {"data": {"start": "2025-01-06", "end": "2025-01-19", "events": "true"}, **user}),
+            ("upcoming-doses", "get", reverse("upcoming-doses"), {"data": {"limit": 50}, **user}),
+            ("home-screen", "get", reverse("home-screen"), user),
+            ("schedule-templates", "get", reverse("schedule-templates"), user),
+            ("schedule-templates", "post", reverse("schedule-templates"),
+             {"data": {"name": "Other", "rules": [{"slot_number": 1, "day_of_week": 0, "hour": 7}]}, **user}),
+            ("schedule-template-apply", "post", reverse("schedule-template-apply", args=[template.id]),
+             {"data": {"dispenser_ids": all_ids}, **user}),
+            ("update-pill-name", "put", reverse("update-pill-name"),
+             {"data": {"dispenser_name": first.name, "slot_number": 1, "pill_name": "B"}, **user}),
+            ("update-dispenser-name", "put", reverse("update-dispenser-name"),
+             {"data": {"current_name": first.name, "new_name": "Renamed"}, **user}),
+            ("container-schedules-list", "get", reverse("container-schedules-list", args=[container.id]), user),
+            ("container-schedules-create", "post", reverse("container-schedules-create", args=[container.id]),
+             {"data": {"day_of_week": 5, "hour": 6}, **user}),
+            ("schedule-retrieve", "get", reverse("schedule-retrieve", args=[schedule.id]), user),
+            ("schedule-update", "patch", reverse("schedule-update", args=[schedule.id]),
+             {"data": {"hour": 9}, **user}),
+            ("schedule-delete", "delete", reverse("schedule-delete", args=[schedule.id]), user),
+            ("device-sessions-batch", "post", reverse("device-sessions-batch"),
+             {"data": {"devices": [{"serial_id": d.serial_id, "device_secret": d.device_secret}
+                                   for d in dispensers]}, "HTTP_X_GATEWAY_KEY": "gateway-key"}),
+            ("device-config", "get", reverse("device-config", args=[serial]), device),
+            ("device-events", "post", reverse("device-events", args=[serial]),
+             {"data": {"status": "completed", "occurred_at": timezone.now().isoformat(), "container_slot": 1,
+                       "schedule_id": schedule.id}, **device}),
+            ("device-session", "post", reverse("device-session", args=[serial]),
+             {"HTTP_X_DEVICE_SECRET": first.device_secret}),
+            ("device-pair", "post", reverse("device-pair", args=["S-20250101-9000"]), {}),
+            ("register", "post", reverse("register"),
+             {"data": {"email": "new@example.com", "password": "pass12345", "first_name": "New",
+                       "last_name": "User"}}),
+            ("login", "post", reverse("login"), {"data": {"email": "owner@example.com", "password": "pass12345"}}),
+            ("logout", "post", reverse("logout"), {"data": {"refresh": refresh}, **user}),
+            ("token_obtain_pair", "post", reverse("token_obtain_pair"),
+             {"data": {"email": "owner@example.com", "password": "pass12345"}}),
+            ("token_refresh", "post", reverse("token_refresh"), {"data": {"refresh": refresh}}),
+            ("get_user", "get", reverse("get_user"), user),
+            ("update_names", "patch", reverse("update_names"), {"data": {"first_name": "Renamed"}, **user}),
+            ("delete_user", "delete", reverse("delete_user"),
+             {"data": {"user_email": "leaver@example.com"}, **leaver_auth}),
+            ("admin-users", "get", reverse("admin-users"), admin),
+            ("admin-dispensers", "get", reverse("admin-dispensers"), admin),
+            ("admin-pending-sync", "get", reverse("admin-pending-sync"), admin),
+            ("admin-sync-lag", "get", reverse("admin-sync-lag"), admin),
+            ("admin-fleet-health", "get", reverse("admin-fleet-health"), admin),
+            ("admin-reset-pairing", "post", reverse("admin-reset-pairing"), {"data": {"model": "S"}, **admin}),
+            ("admin-dispenser-import", "post", reverse("admin-dispenser-import"),
+             {"data": {"manifest": SimpleUploadedFile("units.csv", b"serial_id\nS-20250101-0500\n")},
+              "format": "multipart", **admin}),
+            ("admin-dispenser-models", "get", reverse("admin-dispenser-models"), admin),
+            ("admin-dispenser-models", "post", reverse("admin-dispenser-models"),
+             {"data": {"code": "M", "name": "Medium", "slot_count": 6, "serial_prefix": "M"}, **admin}),
+            ("admin-reserve-serial-ids", "post", reverse("admin-reserve-serial-ids", args=["S"]),
+             {"data": {"count": 100}, **admin}),
+        ]
+
+    def measure(self, size):
+        """{(url name, method): (status, queries)} for a fleet of `size`, each request on fresh data."""
+        results = {}
+        index = 0
+        while True:
+            with transaction.atomic():
+                dispensers, template = self.build_fleet(size)
+                requests = self.requests_for(dispensers, template)
+                if index == len(requests):
+                    transaction.set_rollback(True)
+                    return results
+                name, method, url, kwargs = requests[index]
+                kwargs = dict(kwargs)
+                data = kwargs.pop("data", None)
+                request_format = kwargs.pop("format", "json" if method != "get" else None)
+                client = APIClient()
+                cache.clear()
+                dispenser_model_catalog.by_code("S")
+                with CaptureQueriesContext(connection) as queries:
+                    response = getattr(client, method)(url, data, format=request_format, **kwargs)
+                results[(name, method)] = (response.status_code, len(queries), url)
+                transaction.set_rollback(True)
+            verified_token_cache.clear()
+            index += 1
+
+    def test_every_route_declares_a_budget(self):
+        for urlconf in BUDGETED_URLCONFS:
+            for pattern in get_resolver(urlconf).url_patterns:
+                with self.subTest(route=pattern.name):
+                    view = pattern.callback
+                    methods = [m for m in ("get", "post", "put", "patch", "delete") if hasattr(view.view_class, m)]
+                    for method in methods:
+                        self.assertIsNotNone(get_query_budget(view, method), f"{pattern.name} {method}")
+
+    def test_requests_fit_budgets_at_every_fleet_size(self):
+        measured = [self.measure(size) for size in FLEET_SIZES]
+        covered = {name for name, _ in measured[0]}
+        for urlconf in BUDGETED_URLCONFS:
+            for name in _url_names(urlconf):
+                self.assertIn(name, covered, f"no budget request for {name}")
+
+        for key, (status_code, count, url) in measured[0].items():
+            with self.subTest(route=key):
+                self.assertLess(status_code, 400, f"{key} returned {status_code}")
+                budget = get_query_budget(get_resolver().resolve(url).func, key[1])
+                self.assertLessEqual(count, budget)
+                for other in measured[1:]:
+                    self.assertEqual(other[key][1], count, f"{key} query count grows with fleet size")
+
+    def rename_over_budget(self):
+        client = APIClient()
+        client.force_authenticate(user=self.owner)
+        with mock.patch.object(UpdateNamesView, "query_budget", {"*": 0}):
+            return client.patch(reverse("update_names"), {"first_name": "Renamed"}, format="json")
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_strict_overrun_rolls_back_the_request(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.rename_over_budget()
+
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.first_name, "Owner")
+
+    @override_settings(QUERY_BUDGET_ENABLED=False)
+    def test_middleware_is_off_unless_enabled(self):
+        self.assertEqual(self.rename_over_budget().status_code, 200)
@@ -0,0 +1,130 @@
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from aurora_backend.throttling import (
+    MemoryThrottleStore,
+    SQLiteThrottleStore,
+    ThrottleStore,
+    UserRateThrottle,
+    get_throttle_store,
+)
+from authentication.models import User
+from dispensers.device_tokens import issue_device_token
+from dispensers.services import create_dispenser_for_user
+from dispensers.throttles import DeviceConfigThrottle
+
+
+class TokenBucketStoreTests(SimpleTestCase):
+    def assert_token_bucket(self, store):
+        # Burst of 3, refilling one token per second.
+        self.assertEqual([store.take_token("k", 3, 1.0, 100.0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(store.take_token("k", 3, 1.0, 100.0), 1.0)
+        self.assertEqual(store.take_token("k", 3, 1.0, 101.0), 0)
+        self.assertEqual(store.take_token("other", 3, 1.0, 101.0), 0)
+
+    def assert_sliding_window(self, store):
+        # Two requests per 10s window.
+        self.assertEqual(store.hit_window("k", 2, 10, 100.0), 0)
+        self.assertEqual(store.hit_window("k", 2, 10, 101.0), 0)
+        self.assertAlmostEqual(store.hit_window("k", 2, 10, 102.0), 8.0)
+        # Halfway into the next window half of the previous count still applies.
+        self.assertEqual(store.hit_window("k", 2, 10, 115.0), 0)
+        self.assertGreater(store.hit_window("k", 2, 10, 115.0), 0)
+        self.assertEqual(store.hit_window("k", 2, 10, 130.0), 0)
+
+    def test_memory_store(self):
+        self.assert_token_bucket(MemoryThrottleStore())
+        self.assert_sliding_window(MemoryThrottleStore())
+
+    def test_sqlite_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assert_token_bucket(SQLiteThrottleStore(os.path.join(tmp, "buckets.sqlite3")))
+            self.assert_sliding_window(SQLiteThrottleStore(os.path.join(tmp, "windows.sqlite3")))
+
+    def test_sqlite_store_is_shared_between_instances(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "throttle.sqlite3")
+            first, second = SQLiteThrottleStore(path), SQLiteThrottleStore(path)
+            self.assertEqual(first.take_token("k", 1, 0.5, 10.0), 0)
+            self.assertAlmostEqual(second.take_token("k", 1, 0.5, 10.0), 2.0)
+            self.assertEqual(first.hit_window("w", 1, 60, 10.0), 0)
+            self.assertGreater(second.hit_window("w", 1, 60, 11.0), 0)
+
+    def test_store_interface_is_abstract(self):
+        with self.assertRaises(TypeError):
+            ThrottleStore()
+
+
+@override_settings(THROTTLE_STORE_URL="memory://")
+class DeviceRateThrottleTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="owner@example.com",
+            password="pass12345",
+            first_name="Owner",
+            last_name="User",
+        )
+        self.first = create_dispenser_for_user(owner=self.user, name="First", serial_id="S-20250101-0301")
+        self.second = create_dispenser_for_user(owner=self.user, name="Second", serial_id="S-20250101-0302")
+        get_throttle_store.cache_clear()
+
+    def get_config(self, dispenser):
+        token, _ = issue_device_token(dispenser)
+        url = reverse("device-config", args=[dispenser.serial_id])
+        return self.client.get(url, HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_throttle_is_keyed_by_serial(self):
+        with mock.patch.object(DeviceConfigThrottle, "THROTTLE_RATES", {"device_config": "2/min"}):
+            self.assertEqual(self.get_config(self.first).status_code, 200)
+            self.assertEqual(self.get_config(self.first).status_code, 200)
+            throttled = self.get_config(self.first)
+            other = self.get_config(self.second)
+
+        self.assertEqual(throttled.status_code, 429)
+        self.assertIn("Retry-After", throttled)
+        self.assertEqual(other.status_code, 200)
+
+    def test_anonymous_requests_do_not_drain_a_devices_bucket(self):
+        url = reverse("device-config", args=[self.first.serial_id])
+        view = SimpleNamespace(kwargs={"serial_id": self.first.serial_id})
+        factory = APIRequestFactory()
+
+        def allowed(auth=None):
+            request = Request(factory.get(url, REMOTE_ADDR="203.0.113.9"))
+            request.auth = auth
+            return DeviceConfigThrottle().allow_request(request, view)
+
+        with mock.patch.object(DeviceConfigThrottle, "THROTTLE_RATES", {"device_config": "2/min"}):
+            spam = [allowed() for _ in range(3)]
+            device = [allowed(self.first) for _ in range(2)]
+
+        self.assertEqual(spam, [True, True, False])
+        self.assertEqual(device, [True, True])
+
+
+@override_settings(THROTTLE_STORE_URL="memory://")
+class SlidingWindowThrottleTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="owner@example.com",
+            password="pass12345",
+            first_name="Owner",
+            last_name="User",
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_user_scope_uses_shared_store(self):
+        url = reverse("list-all-user-dispensers")
+        with mock.patch.object(UserRateThrottle, "THROTTLE_RATES", {"user": "2/min", "anon": "2/min"}):
+            statuses = [self.client.get(url).status_code for _ in range(3)]
+
+        self.assertEqual(statuses, [200, 200, 429])
@@ -0,0 +1,34 @@
+from django.test import SimpleTestCase
+
+from dispensers.weekmask import MINUTES_PER_WEEK, WeekMask, minute_of_week, split_minute_of_week
+
+
+class WeekMaskTests(SimpleTestCase):
+    def test_round_trips_through_bytes(self):
+        mask = WeekMask.from_times([(0, 0, 0), (6, 23, 59), (2, 8, 30)])
+
+        restored = WeekMask.from_bytes(mask.to_bytes())
+
+        self.assertEqual(restored, mask)
+        self.assertEqual(len(restored), 3)
+        self.assertLessEqual(len(mask.to_bytes()), MINUTES_PER_WEEK // 8)
+        self.assertEqual(WeekMask().to_bytes(), b"")
+
+    def test_membership_and_set_operations(self):
+        morning = WeekMask.from_times([(0, 8, 0), (1, 8, 0)])
+        evening = WeekMask.from_times([(0, 20, 0), (1, 8, 0)])
+
+        self.assertTrue(morning.has(0, 8))
+        self.assertFalse(morning.has(0, 20))
+        self.assertEqual(len(morning | evening), 3)
+        self.assertEqual(morning & evening, WeekMask.from_times([(1, 8, 0)]))
+        self.assertEqual(morning - evening, WeekMask.from_times([(0, 8, 0)]))
+        self.assertEqual(WeekMask.overlap([morning, evening, WeekMask()]), morning & evening)
+
+    def test_minutes_are_ordered(self):
+        mask = WeekMask.from_times([(3, 12, 0), (0, 7, 15)])
+
+        self.assertEqual(
+            [split_minute_of_week(m) for m in mask.minutes()], [(0, 7, 15), (3, 12, 0)]
+        )
+        self.assertEqual(minute_of_week(6, 23, 59), MINUTES_PER_WEEK - 1)